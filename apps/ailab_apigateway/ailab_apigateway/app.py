@@ -1,18 +1,35 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from .config import description, getAPIVersion, setLogBasicConfig, settings
 from .routers import main_router
+from .utilities.chat_history import aclose_shared_redis_clients
+from .utilities.retriever_utils.vectorstore_methods import get_retrieval_engine
+from .utilities.retriever_utils.vectorstore_registry import vectorstore_registry
 
 setLogBasicConfig()
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    # TODO: Add db connection
+    # build the shared vector store once, before the first request is served;
+    # a failure is logged and the first request retries the load
+    await asyncio.to_thread(vectorstore_registry.reload_if_changed)
+    reload_interval = settings.get("vectorstore_reload_interval", 0)
+    watcher = None
+    if reload_interval > 0:
+        watcher = asyncio.create_task(vectorstore_registry.watch(reload_interval))
     yield
+    if watcher is not None:
+        watcher.cancel()
+        with suppress(asyncio.CancelledError):
+            await watcher
+    await aclose_shared_redis_clients()
+    if settings.database_type == "postgres":
+        get_retrieval_engine().dispose()
 
 
 app = FastAPI(
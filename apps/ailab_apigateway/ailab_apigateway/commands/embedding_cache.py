@@ -0,0 +1,44 @@
+import typer
+
+from ..utilities.persistent_embedding_cache import get_persistent_cache
+
+cli = typer.Typer(name="embedding cache")
+
+
+@cli.command()
+def stats():
+    """Show the number and size of cached vectors per embedding model."""
+    for model, model_stats in get_persistent_cache().stats().items():
+        typer.echo(
+            f"{model}: {model_stats['vectors']} vectors, {model_stats['bytes']} bytes"
+        )
+
+
+@cli.command()
+def prune(
+    max_entries: int = typer.Option(None, help="Keep at most this many vectors."),
+    older_than_days: float = typer.Option(
+        None, help="Delete vectors unused for this many days."
+    ),
+    compact: bool = typer.Option(True, help="Reclaim the freed disk space."),
+):
+    """Delete least recently used vectors from the embedding cache."""
+    cache = get_persistent_cache()
+    older_than = older_than_days * 86400 if older_than_days is not None else None
+    deleted = cache.prune(
+        max_entries=max_entries or cache.max_entries, older_than=older_than
+    )
+    typer.echo(f"deleted {deleted} vectors")
+    if compact:
+        cache.compact()
+
+
+@cli.command(name="compact")
+def compact_cache():
+    """Reclaim the disk space left by deleted vectors."""
+    get_persistent_cache().compact()
+    typer.echo("compacted")
+
+
+if __name__ == "__main__":
+    cli()
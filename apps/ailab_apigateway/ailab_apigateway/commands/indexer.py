@@ -1,21 +1,44 @@
 import logging
+import os
 from typing import Any, Callable
 
-from langchain.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
-from langchain.vectorstores.pgvector import PGVector
 from pydantic import BaseModel
 
 from ..config import settings
-from .directory_utils import initialize_dir_for_file
-from .embedding_selector import embedding_selector
-from .indexer_utils.postgres_methods import make_connection_string
+from ..utilities.directory_utils import initialize_dir_for_file
+from ..utilities.embedding_selector import embedding_selector
+from ..utilities.index_version import bump_index_version
+from ..utilities.indexer_utils.chunk_hashes import ChunkDiff
+from ..utilities.indexer_utils.embedding_stage import embed_in_batches
+from ..utilities.indexer_utils.ingestion import (
+    iter_chunks,
+    resolve_document_paths,
+    split_file,
+)
+from ..utilities.indexer_utils.vector_writers import (
+    FAISSWriter,
+    PGVectorWriter,
+    VectorWriter,
+)
+from ..utilities.persistent_embedding_cache import with_persistent_cache
+from ..utilities.retriever_utils.bm25_index import BM25Index
+from ..utilities.retriever_utils.hybrid_search import bm25_index_path, indexed_chunks
+from ..utilities.retriever_utils.mmap_docstore import save_faiss
 
 
 class VecDBMethods(BaseModel):
-    upsert: Callable | str
-    save: Callable | str | None
+    writer: type[VectorWriter]
+    save: Callable | str | None = None
+
+
+class IndexingStats(BaseModel):
+    added: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.deleted)
 
 
 def get_vecdb_method(vector_db_name: str) -> VecDBMethods:
@@ -29,31 +52,13 @@ def get_vecdb_method(vector_db_name: str) -> VecDBMethods:
         VecDBMethods: contains the callables to database methods in the object attributes
     """
     dict_db_method = {
-        "FAISS": {"upsert": FAISS.from_documents, "save": "save_local"},
-        "postgres": {
-            "upsert": PGVector.from_documents,
-        },
+        "FAISS": {"writer": FAISSWriter, "save": save_faiss},
+        "postgres": {"writer": PGVectorWriter},
     }
-    # vecdb_methods = VecDBMethods(upsert=dict_db_method[vector_db_name]['upsert'], save=dict_db_method[vector_db_name]['save'])
     vecdb_methods = VecDBMethods(**dict_db_method[vector_db_name])
     return vecdb_methods
 
 
-def get_extra_arguments() -> dict:
-    """
-    get extra arguments for the upsert method based on the database
-    """
-    arg_dict = {}
-    if settings.database_type == "postgres":
-        arg_dict["connection_string"] = make_connection_string()
-        arg_dict["collection_name"] = settings.database_table
-        arg_dict["pre_delete_collection"] = settings.indexer_override
-    elif settings.database_type == "FAISS":
-        pass  # no extra arguments for FAISS db
-
-    return arg_dict
-
-
 def split_document(doc_path: str, chunk_size: int, overlap: int) -> Any:
     """
     Splits a document into chunks. The chunks are split along using these separators:
@@ -70,40 +75,105 @@ def split_document(doc_path: str, chunk_size: int, overlap: int) -> Any:
     Returns:
         Any: The split documents.
     """
-    raw_document = TextLoader(doc_path).load()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=overlap
-    )
-    documents = text_splitter.split_documents(raw_document)
-    return documents
+    return split_file(doc_path, chunk_size=chunk_size, overlap=overlap)
 
 
-def index_from_document(embeddings_function: Callable, upsert_method: Callable) -> Any:
+def index_from_document(
+    embeddings_function: Callable, writer: type[VectorWriter], override: bool = False
+) -> tuple[Any, IndexingStats]:
     """
-    Makes an index of the document.
+    Makes an index of the documents.
+
+    `DOCUMENT_PATH` may name a file, a directory or a glob pattern, or be a list of
+    them. Files are loaded and split in a process pool and their chunks merged into a
+    single stream, each chunk keeping its file as `source`. Files larger than
+    `STREAMING_SPLIT_THRESHOLD` bytes are read and split in bounded windows instead.
+
+    Every chunk is identified by its content hash. Unless `override` is set, the
+    existing index is updated in place: only new or changed chunks are embedded and
+    chunks that disappeared from the documents are deleted. Chunks are embedded in
+    batches, several in flight at once, and every batch is handed to the writer as
+    soon as it is embedded.
+
+    Returns
+    -------
+    tuple
+        The vector store and the counts of added, unchanged and deleted chunks.
     """
-    docs = split_document(
-        settings.document_path, chunk_size=settings.chunk_size, overlap=settings.overlap
+    paths = resolve_document_paths(
+        settings.document_path,
+        extensions=settings.get("document_extensions", [".txt", ".md"]),
     )
+    if not paths:
+        raise FileNotFoundError(f"No documents found for {settings.document_path}")
     logging.info(
-        f"Created {len(docs)} vectors, using chunk_size={settings.chunk_size} and overlap={settings.overlap}"
+        f"Splitting {len(paths)} files, "
+        f"using chunk_size={settings.chunk_size} and overlap={settings.overlap}"
     )
-    args_dict = get_extra_arguments()
-    index = upsert_method(documents=docs, embedding=embeddings_function(), **args_dict)
-    return index
+    docs = iter_chunks(
+        paths,
+        chunk_size=settings.chunk_size,
+        overlap=settings.overlap,
+        workers=settings.get("indexer_workers", 0),
+        streaming_threshold=settings.get("streaming_split_threshold", 64 << 20),
+    )
+    # vectors computed by earlier runs, whatever their chunking, are not paid for again
+    embeddings = with_persistent_cache(embeddings_function())
+    vector_writer = writer(embeddings, override=override)
+    try:
+        diff = ChunkDiff(vector_writer.existing_ids())
+        stats = IndexingStats()
+        for documents, vectors in embed_in_batches(
+            diff.new_chunks(docs),
+            embeddings,
+            batch_size=settings.get("embedding_batch_size", 256),
+            max_concurrency=settings.get("embedding_max_concurrency", 4),
+            max_retries=settings.get("embedding_max_retries", 6),
+            base_delay=settings.get("embedding_retry_base_delay", 1.0),
+            max_delay=settings.get("embedding_retry_max_delay", 60.0),
+        ):
+            vector_writer.write(documents, vectors)
+            stats.added += len(documents)
+        stale_ids = diff.stale_ids
+        vector_writer.delete(stale_ids)
+        stats.unchanged = diff.unchanged
+        stats.deleted = len(stale_ids)
+        logging.info(
+            f"Indexed {stats.added} new chunks, kept {stats.unchanged}, deleted {stats.deleted}"
+        )
+        return vector_writer.finish(), stats
+    finally:
+        vector_writer.close()
 
 
 def write_database_to_file(
-    index: Any, path: str, save_method: Callable
+    index: Any, path: str, save_method: Callable | str
 ) -> (
     None
 ):  # TODO this at least works for FAISS, need to see if there are similar methods for other dbs
     """
-    Writes the database to a file.
+    Writes the database to a file, with a method of the index given by name or a
+    function taking the index and the path.
     """
     initialize_dir_for_file(path)
-    save_function = getattr(index, save_method)
-    save_function(path)
+    if isinstance(save_method, str):
+        getattr(index, save_method)(path)
+    else:
+        save_method(index, path)
+
+
+def write_lexical_index(index: Any, path: str) -> None:
+    """
+    Build the BM25 index over the chunks of the vector store and write it to `path`.
+    """
+    lexical_index = BM25Index.build(
+        indexed_chunks(index),
+        k1=settings.get("bm25_k1", 1.2),
+        b=settings.get("bm25_b", 0.75),
+    )
+    initialize_dir_for_file(path)
+    lexical_index.save(path)
+    logging.info(f"BM25 index of {len(lexical_index)} chunks written to {path}")
 
 
 def indexer(save_to_file: bool = False) -> None:
@@ -111,15 +181,34 @@ def indexer(save_to_file: bool = False) -> None:
     vecdb_methods = get_vecdb_method(settings.database_type)
     # get the embeddings function by name
     embeddings = embedding_selector(settings.embeddings_name)
-    # create a vector index starting from a document
-    index = index_from_document(
-        embeddings_function=embeddings, upsert_method=vecdb_methods.upsert
+    # create or update a vector index starting from a document
+    index, stats = index_from_document(
+        embeddings_function=embeddings,
+        writer=vecdb_methods.writer,
+        override=settings.get("indexer_override", False),
+    )
+    if index is None:
+        # no index yet and the documents hold no text to create one from
+        logging.warning(f"No chunks to index in {settings.document_path}")
+        return
+    # a FAISS index, and so its BM25 index, only persists when saved to file
+    write_lexical = settings.get("hybrid_search_enabled", True) and (
+        save_to_file or settings.database_type != "FAISS"
     )
+    lexical_path = bm25_index_path()
+    if not stats.changed and not (write_lexical and not os.path.exists(lexical_path)):
+        logging.info("Index is up to date")
+        return
     if save_to_file:
         # save the vector index to file
         write_database_to_file(
             index=index, path=settings.database_path, save_method=vecdb_methods.save
         )
+    if write_lexical:
+        write_lexical_index(index, lexical_path)
+    # signal the running API (vector store registry and answer cache) to reload
+    version = bump_index_version()
+    logging.info(f"Index version bumped to {version}")
 
 
 if __name__ == "__main__":
@@ -1,32 +1,57 @@
+import asyncio
+import json
 import logging
-from typing import List
+from functools import partial
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
 from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory, RedisChatMessageHistory
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.document import Document
+from langchain.schema.messages import AIMessage, HumanMessage
+from langchain.schema.vectorstore import VectorStore
+from langchain_core.embeddings import Embeddings
+from starlette.background import BackgroundTask
 
 from ..config import settings
-from ..utilities.format_responses import ResponderWithDocument
+from ..utilities.answer_cache import CachedAnswer, answer_cache
+from ..utilities.chat_history import (
+    AsyncRedisChatMessageHistory,
+    llm_summarizer,
+    shared_redis_client,
+)
+from ..utilities.context_packing import token_counter
+from ..utilities.embedding_cache import aembed_queries, normalize_query
+from ..utilities.format_responses import ResponderWithDocument, serialize_documents
+from ..utilities.memory_chat_history import InMemoryChatMessageHistory, chat_store
 from ..utilities.prompt_variables import template_history_prompt
 from ..utilities.retriever import (
-    chatbot_answer_with_history,
-    document_retrieval,
+    achatbot_answer_with_history,
+    adocument_retrieval,
+    adocument_retrieval_by_vectors,
+    astream_chatbot_answer_with_history,
     get_scores,
 )
-from ..utilities.retriever_utils.vectorstore_methods import get_vectorstore_connector
+from ..utilities.retriever_utils.vectorstore_registry import vectorstore_registry
+from ..utilities.single_flight import SingleFlight, text_fingerprint
 from .dtos.ask_dto import AskDto
 
 router = APIRouter()
 
+# in-flight /ask computations, by question, index version and history
+answer_flights: SingleFlight[Tuple[str, List[Document]]] = SingleFlight()
+
+MessageHistory = Union[AsyncRedisChatMessageHistory, InMemoryChatMessageHistory]
 
-def retrieve_docs_similar_to_question(question: str) -> List[Document]:
+
+async def retrieve_docs_similar_to_question(
+    question: str, vectorstore: VectorStore
+) -> List[Document]:
     """
     Return document chunks from vector database specified in the settings, based on similarity search with the question
     """
-    vectorstore = get_vectorstore_connector()
-    retrieved_documents = document_retrieval(
+    retrieved_documents = await adocument_retrieval(
         vectorstore,
         question,
         top_k=settings.get("top_k"),
@@ -35,8 +60,143 @@ def retrieve_docs_similar_to_question(question: str) -> List[Document]:
     return retrieved_documents
 
 
+async def lookup_answer_cache(
+    question: str,
+    vectorstore: VectorStore,
+    index_version: Optional[str],
+    history_key: str,
+) -> Tuple[Optional[List[float]], Optional[CachedAnswer]]:
+    """
+    Look the question up in the semantic answer cache, if it is enabled, among the
+    answers generated with the same chat history (`history_key`).
+
+    Returns
+    -------
+    tuple
+        The question embedding (None when the cache is disabled) and the cached
+        answer (None on a miss).
+    """
+    if not settings.get("answer_cache_enabled", False):
+        return None, None
+    # the embedding is cached, the retriever reuses it on a cache miss
+    question_embedding = await vectorstore.embeddings.aembed_query(question)
+    cached = answer_cache.lookup(question_embedding, index_version, history_key)
+    if cached is not None:
+        logging.info(f"Answer cache hit for a question similar to: {cached.question}")
+    return question_embedding, cached
+
+
+async def answer_with_history(
+    question: str, history: str, vectorstore: VectorStore, index_version: Optional[str]
+) -> Tuple[str, List[Document]]:
+    """
+    Answer a question from the semantic answer cache, or by retrieval and the LLM.
+
+    Returns
+    -------
+    tuple
+        The answer and the retrieved documents.
+    """
+    history_key = text_fingerprint(history)
+    question_embedding, cached = await lookup_answer_cache(
+        question, vectorstore, index_version, history_key
+    )
+    if cached is not None:
+        return cached.answer, cached.documents
+    retrieved_documents = await retrieve_docs_similar_to_question(question, vectorstore)
+    logging.info(f"Retrieved documents: {retrieved_documents}")
+    prompt = ChatPromptTemplate.from_template(template_history_prompt)
+    model = ChatOpenAI()
+    # get chatbot answer
+    answer = await achatbot_answer_with_history(
+        question, retrieved_documents, history, prompt, model
+    )
+    if question_embedding is not None:
+        answer_cache.store(
+            question_embedding,
+            index_version,
+            question,
+            answer,
+            retrieved_documents,
+            history_key,
+        )
+    return answer, retrieved_documents
+
+
+def new_message_history(session_id: Optional[str] = None) -> MessageHistory:
+    """
+    The chat history of a session, `SESSION_ID` when none is given, in the
+    `MEMORY_BACKEND` store: "redis" on the process-wide Redis client, or "memory"
+    in this process (single-node deployments). Idle sessions expire after
+    `MEMORY_TTL` seconds.
+    """
+    session_id = session_id or settings.session_id
+    backend = settings.get("memory_backend", "redis")
+    if backend == "memory":
+        return InMemoryChatMessageHistory(session_id, chat_store)
+    if backend != "redis":
+        raise ValueError(f"Unknown memory backend: {backend}")
+    return AsyncRedisChatMessageHistory(
+        session_id=session_id,
+        redis_client=shared_redis_client(
+            settings.memory_url,
+            max_connections=settings.get("memory_max_connections", 50),
+            pool_timeout=settings.get("memory_pool_timeout", 5),
+        ),
+        ttl=settings.get("memory_ttl", 86400),
+    )
+
+
+async def read_history(message_history: MessageHistory) -> str:
+    """
+    The chat history for the prompt: the last `HISTORY_MAX_TURNS` turns within
+    `HISTORY_TOKEN_BUDGET` tokens after a summary of the older ones, or the whole
+    session when `HISTORY_MAX_TURNS` is 0.
+    """
+    max_turns = settings.get("history_max_turns", 4)
+    if not max_turns:
+        return await message_history.aget_buffer_string()
+    return await message_history.aget_window_buffer_string(
+        max_turns,
+        token_budget=settings.get("history_token_budget", 1000),
+        count_tokens=token_counter(settings.get("context_encoding", "cl100k_base")),
+    )
+
+
+async def fold_message_history(session_id: Optional[str] = None) -> None:
+    """
+    Fold the turns that left the history window into the session summary.
+
+    Runs after the answer is sent, so the summarization call does not delay it.
+    """
+    max_turns = settings.get("history_max_turns", 4)
+    if not max_turns:
+        return
+    message_history = new_message_history(session_id)
+    try:
+        await message_history.afold_history(
+            llm_summarizer(ChatOpenAI()),
+            max_turns,
+            token_budget=settings.get("history_token_budget", 1000),
+            count_tokens=token_counter(settings.get("context_encoding", "cl100k_base")),
+        )
+    except Exception:
+        logging.exception("Summarizing the chat history failed")
+    finally:
+        await message_history.aclose()
+
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Format one server-sent event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("/ask")
-async def ask_question(request: AskDto) -> dict | None:
+async def ask_question(
+    request: AskDto, background_tasks: BackgroundTasks
+) -> dict | None:
     """
     Ask a question to a chatbot and get an answer.
 
@@ -44,29 +204,44 @@ async def ask_question(request: AskDto) -> dict | None:
     ----------
     request : Request
         The request object.
+    background_tasks : BackgroundTasks
+        Runs the chat history summarization after the response.
 
     Returns
     -------
     dict
         A dictionary containing the answer, documents, and scores.
+
+    Notes
+    -----
+    Concurrent requests with the same normalized question, index version and chat
+    history are answered by one computation (`SINGLE_FLIGHT_ENABLED`); each still
+    records the turn in its session.
     """
     question = request.question
-    retrieved_documents = retrieve_docs_similar_to_question(question)
-    logging.info(f"Retrieved documents: {retrieved_documents}")
-    prompt = ChatPromptTemplate.from_template(template_history_prompt)
-    model = ChatOpenAI()
-    # set up message history and conversation memory
-    message_history = RedisChatMessageHistory(
-        url=settings.memory_url, session_id=settings.session_id
-    )
-    memory = ConversationBufferMemory(chat_memory=message_history)
-    # get chatbot answer
-    answer = chatbot_answer_with_history(
-        question, retrieved_documents, memory, prompt, model
-    )
-    # update memory entries
-    message_history.add_user_message(question)
-    message_history.add_ai_message(answer)
+    loaded = await vectorstore_registry.aget_loaded()
+    vectorstore, index_version = loaded.vectorstore, loaded.fingerprint
+    # set up message history
+    message_history = new_message_history(request.session_id)
+    try:
+        history = await read_history(message_history)
+        compute = partial(
+            answer_with_history, question, history, vectorstore, index_version
+        )
+        if settings.get("single_flight_enabled", True):
+            # identical questions in flight, asked with the same history, share
+            # one embedding, search and LLM call
+            key = (normalize_query(question), index_version, text_fingerprint(history))
+            answer, retrieved_documents = await answer_flights.run(key, compute)
+        else:
+            answer, retrieved_documents = await compute()
+        # update memory entries
+        await message_history.aadd_messages(
+            [HumanMessage(content=question), AIMessage(content=answer)]
+        )
+    finally:
+        await message_history.aclose()
+    background_tasks.add_task(fold_message_history, request.session_id)
     responder = ResponderWithDocument(
         {
             "answer": answer,
@@ -76,3 +251,252 @@ async def ask_question(request: AskDto) -> dict | None:
     )
 
     return responder.produce_response()
+
+
+async def stream_answer_events(
+    question: str, session_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Produce the server-sent events of `/ask/stream`.
+
+    Events, in order: one `documents` event with the retrieved documents and scores,
+    `token` events carrying the answer as the model generates it, then `end` once the
+    answer is stored in the chat memory. A failure is reported as an `error` event.
+    """
+    message_history = new_message_history(session_id)
+    try:
+        loaded = await vectorstore_registry.aget_loaded()
+        vectorstore, index_version = loaded.vectorstore, loaded.fingerprint
+        history = await read_history(message_history)
+        history_key = text_fingerprint(history)
+        question_embedding, cached = await lookup_answer_cache(
+            question, vectorstore, index_version, history_key
+        )
+        if cached is not None:
+            retrieved_documents = cached.documents
+        else:
+            retrieved_documents = await retrieve_docs_similar_to_question(
+                question, vectorstore
+            )
+        yield sse_event(
+            "documents",
+            {
+                "documents": serialize_documents(retrieved_documents),
+                "scores": get_scores(retrieved_documents),
+            },
+        )
+        if cached is not None:
+            answer = cached.answer
+            yield sse_event("token", {"token": answer})
+        else:
+            prompt = ChatPromptTemplate.from_template(template_history_prompt)
+            model = ChatOpenAI()
+            chunks = []
+            async for chunk in astream_chatbot_answer_with_history(
+                question, retrieved_documents, history, prompt, model
+            ):
+                chunks.append(chunk)
+                yield sse_event("token", {"token": chunk})
+            answer = "".join(chunks)
+            if question_embedding is not None:
+                answer_cache.store(
+                    question_embedding,
+                    index_version,
+                    question,
+                    answer,
+                    retrieved_documents,
+                    history_key,
+                )
+        # only a completed answer is written to memory
+        await message_history.aadd_messages(
+            [HumanMessage(content=question), AIMessage(content=answer)]
+        )
+        yield sse_event("end", {})
+    except Exception:
+        # the details stay in the log, they may reveal internals to the client
+        logging.exception("Streaming answer failed")
+        yield sse_event("error", {"detail": "Answering the question failed"})
+    finally:
+        await message_history.aclose()
+
+
+@router.post("/ask/stream")
+async def ask_question_stream(request: AskDto) -> StreamingResponse:
+    """
+    Ask a question to a chatbot and stream the answer as server-sent events.
+
+    The response starts right away: retrieval and generation happen while the
+    stream is open, see `stream_answer_events` for the events sent. The chat
+    history is summarized once the stream is closed.
+
+    Parameters
+    ----------
+    request : Request
+        The request object.
+
+    Returns
+    -------
+    StreamingResponse
+        A `text/event-stream` response.
+    """
+    return StreamingResponse(
+        stream_answer_events(request.question, request.session_id),
+        media_type="text/event-stream",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(fold_message_history, request.session_id),
+    )
+
+
+async def embed_batch_questions(
+    embeddings: Embeddings, questions: List[str]
+) -> List[Union[List[float], Exception]]:
+    """
+    Embed the questions of a batch in one request. If it fails, the questions are
+    embedded one by one, so a question that cannot be embedded only fails itself.
+    """
+    try:
+        return await aembed_queries(embeddings, questions)
+    except Exception:
+        logging.exception("Embedding the batch failed, embedding its questions apart")
+
+    async def embed(question: str) -> List[float]:
+        return (await aembed_queries(embeddings, [question]))[0]
+
+    return await asyncio.gather(
+        *(embed(question) for question in questions), return_exceptions=True
+    )
+
+
+async def retrieve_batch_documents(
+    vectorstore: VectorStore, vectors: List[List[float]], questions: List[str]
+) -> List[Union[List[Document], Exception]]:
+    """
+    Search the documents of a batch of embedded questions in one batched search. If
+    it fails, the questions are searched one by one, so a failing search only fails
+    its question.
+    """
+    search = partial(
+        adocument_retrieval_by_vectors,
+        vectorstore,
+        top_k=settings.get("top_k"),
+        similarity_threshold=settings.similarity_threshold,
+    )
+    try:
+        return await search(vectors, questions=questions)
+    except Exception:
+        logging.exception("Searching the batch failed, searching its questions apart")
+
+    async def retrieve(vector: List[float], question: str) -> List[Document]:
+        return (await search([vector], questions=[question]))[0]
+
+    return await asyncio.gather(
+        *(retrieve(vector, question) for vector, question in zip(vectors, questions)),
+        return_exceptions=True,
+    )
+
+
+@router.post("/ask/batch")
+async def ask_questions_batch(requests: List[AskDto]) -> List[dict]:
+    """
+    Ask many questions at once, for evaluation jobs and bulk generation.
+
+    All questions are embedded in one request and searched in one batched vector
+    search; the LLM calls then run with bounded concurrency. Batch questions are
+    answered independently: they neither read nor write the chat memory, and a
+    question failing at any step only fails its own result.
+
+    Parameters
+    ----------
+    requests : List[AskDto]
+        The questions.
+
+    Returns
+    -------
+    List[dict]
+        One result per question, in input order, each with the answer, the
+        documents and an error message (None unless that question failed).
+    """
+    max_size = settings.get("ask_batch_max_size", 1000)
+    if len(requests) > max_size:
+        raise HTTPException(
+            status_code=422, detail=f"A batch holds at most {max_size} questions"
+        )
+    questions = [request.question for request in requests]
+    loaded = await vectorstore_registry.aget_loaded()
+    vectorstore, index_version = loaded.vectorstore, loaded.fingerprint
+    question_embeddings = await embed_batch_questions(vectorstore.embeddings, questions)
+    use_answer_cache = settings.get("answer_cache_enabled", False)
+    # batch answers are generated without history, they only share cache entries
+    # with other answers generated without history
+    no_history = text_fingerprint("")
+    cached = [
+        (
+            answer_cache.lookup(embedding, index_version, no_history)
+            if use_answer_cache and not isinstance(embedding, Exception)
+            else None
+        )
+        for embedding in question_embeddings
+    ]
+    pending = [
+        i
+        for i, embedding in enumerate(question_embeddings)
+        if cached[i] is None and not isinstance(embedding, Exception)
+    ]
+    retrieved = await retrieve_batch_documents(
+        vectorstore,
+        [question_embeddings[i] for i in pending],
+        [questions[i] for i in pending],
+    )
+    documents_per_question = {i: documents for i, documents in zip(pending, retrieved)}
+    prompt = ChatPromptTemplate.from_template(template_history_prompt)
+    model = ChatOpenAI()
+    semaphore = asyncio.Semaphore(settings.get("ask_batch_concurrency", 8))
+
+    async def answer_question(i: int) -> Tuple[str, List[Document]]:
+        if isinstance(question_embeddings[i], Exception):
+            raise question_embeddings[i]
+        if cached[i] is not None:
+            return cached[i].answer, cached[i].documents
+        documents = documents_per_question[i]
+        if isinstance(documents, Exception):
+            raise documents
+        async with semaphore:
+            answer = await achatbot_answer_with_history(
+                questions[i], documents, "", prompt, model
+            )
+        if use_answer_cache:
+            answer_cache.store(
+                question_embeddings[i],
+                index_version,
+                questions[i],
+                answer,
+                documents,
+                no_history,
+            )
+        return answer, documents
+
+    outcomes = await asyncio.gather(
+        *(answer_question(i) for i in range(len(questions))), return_exceptions=True
+    )
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            logging.error("Answering a batch question failed", exc_info=outcome)
+            results.append(
+                {
+                    "answer": None,
+                    "documents": [],
+                    "error": "Answering the question failed",
+                }
+            )
+        else:
+            answer, documents = outcome
+            results.append(
+                {
+                    "answer": answer,
+                    "documents": serialize_documents(documents),
+                    "error": None,
+                }
+            )
+    return results
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class AskDto(BaseModel):
@@ -9,6 +11,11 @@ class AskDto(BaseModel):
     ----------
     question : str
         The question asked in the request.
+    session_id : str, optional
+        The conversation the question belongs to, `SESSION_ID` when not given.
     """
 
     question: str
+    session_id: Optional[str] = Field(
+        default=None, min_length=1, max_length=128, pattern=r"^[\w.:-]+$"
+    )
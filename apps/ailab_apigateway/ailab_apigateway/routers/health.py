@@ -1,6 +1,9 @@
 from fastapi import APIRouter
 
 from ..config import settings
+from ..utilities.answer_cache import answer_cache
+from ..utilities.embedding_cache import query_embedding_cache
+from ..utilities.retriever_utils.vectorstore_methods import retrieval_pool_stats
 
 router = APIRouter()
 
@@ -19,4 +22,13 @@ async def health() -> dict:
     environment = settings.get("ENV_FOR_DYNACONF")
     logLevel = settings.get("LOG_LEVEL")
 
-    return {"status": True, "environment": environment, "logLevel": logLevel}
+    status = {
+        "status": True,
+        "environment": environment,
+        "logLevel": logLevel,
+        "queryEmbeddingCache": query_embedding_cache.stats(),
+        "answerCache": answer_cache.stats(),
+    }
+    if settings.database_type == "postgres":
+        status["retrievalPool"] = retrieval_pool_stats()
+    return status
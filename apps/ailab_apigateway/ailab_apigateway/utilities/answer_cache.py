@@ -0,0 +1,206 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain.schema.document import Document
+
+from ..config import settings
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    documents: List[Document]
+    created_at: float
+    last_used: float
+    nbytes: int = field(default=0)
+    history_key: str = ""
+
+
+def _estimate_nbytes(answer: str, documents: List[Document], dim: int) -> int:
+    text_bytes = len(answer) + sum(len(doc.page_content) for doc in documents)
+    return dim * np.dtype(np.float32).itemsize + text_bytes
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of recent answers, looked up by question embedding similarity.
+
+    A new question hits when its cosine distance to a cached question is at most
+    `max_distance`. Question vectors are kept L2-normalized in one float32 matrix, so
+    a lookup is a single matrix-vector product. Entries belong to one index version:
+    a lookup or store for another version empties the cache first. An answer also
+    depends on the chat history it was generated with, so entries only hit for the
+    same `history_key` (a digest of that history, empty for none).
+
+    Attributes
+    ----------
+    max_distance : float
+        Largest cosine distance (1 - cosine similarity) that still counts as a hit.
+    max_bytes : int
+        Memory budget for vectors, answers and documents; least recently used
+        entries are evicted beyond it.
+    ttl : float
+        Seconds an answer may be served after it was stored, 0 disables expiry.
+    """
+
+    def __init__(
+        self,
+        max_distance: float = 0.01,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_distance = max_distance
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._index_version: Optional[str] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[CachedAnswer] = []
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _switch_version(self, index_version: Optional[str]) -> None:
+        if index_version != self._index_version:
+            self._clear()
+            self._index_version = index_version
+
+    def _clear(self) -> None:
+        self._vectors = None
+        self._entries = []
+        self._nbytes = 0
+
+    def _remove(self, positions: List[int]) -> None:
+        if not positions:
+            return
+        drop = set(positions)
+        self._nbytes -= sum(self._entries[i].nbytes for i in drop)
+        self._entries = [e for i, e in enumerate(self._entries) if i not in drop]
+        self._vectors = np.delete(self._vectors, positions, axis=0)
+        if not self._entries:
+            self._vectors = None
+
+    def _expire(self) -> None:
+        if not self.ttl:
+            return
+        now = self._clock()
+        self._remove(
+            [
+                i
+                for i, entry in enumerate(self._entries)
+                if now - entry.created_at > self.ttl
+            ]
+        )
+
+    def lookup(
+        self,
+        embedding: List[float],
+        index_version: Optional[str],
+        history_key: str = "",
+    ) -> Optional[CachedAnswer]:
+        """
+        Return the cached answer closest to `embedding`, if it is close enough and
+        was generated with the same chat history.
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            self._switch_version(index_version)
+            self._expire()
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ query
+            other_history = np.fromiter(
+                (entry.history_key != history_key for entry in self._entries),
+                dtype=bool,
+                count=len(self._entries),
+            )
+            similarities[other_history] = -np.inf
+            best = int(np.argmax(similarities))
+            if 1.0 - float(similarities[best]) > self.max_distance:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            entry.last_used = self._clock()
+            return entry
+
+    def store(
+        self,
+        embedding: List[float],
+        index_version: Optional[str],
+        question: str,
+        answer: str,
+        documents: List[Document],
+        history_key: str = "",
+    ) -> None:
+        """
+        Cache an answer, evicting least recently used entries to stay in budget.
+        """
+        vector = self._normalize(embedding)
+        now = self._clock()
+        # snapshot the documents, the retriever rewrites the metadata of shared ones
+        documents = [
+            Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+            for doc in documents
+        ]
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            documents=documents,
+            created_at=now,
+            last_used=now,
+            nbytes=_estimate_nbytes(answer, documents, vector.shape[0]),
+            history_key=history_key,
+        )
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._switch_version(index_version)
+            if self._vectors is not None and self._vectors.shape[1] != vector.shape[0]:
+                self._clear()
+            while self._entries and self._nbytes + entry.nbytes > self.max_bytes:
+                oldest = min(
+                    range(len(self._entries)),
+                    key=lambda i: self._entries[i].last_used,
+                )
+                self._remove([oldest])
+            self._entries.append(entry)
+            self._nbytes += entry.nbytes
+            row = vector[np.newaxis, :]
+            self._vectors = (
+                row if self._vectors is None else np.vstack([self._vectors, row])
+            )
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    max_distance=settings.get("answer_cache_max_distance", 0.01),
+    max_bytes=settings.get("answer_cache_max_bytes", 16 * 1024 * 1024),
+    ttl=settings.get("answer_cache_ttl", 3600),
+)
@@ -0,0 +1,342 @@
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.schema.messages import (
+    BaseMessage,
+    SystemMessage,
+    get_buffer_string,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain.schema.output_parser import StrOutputParser
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import WatchError
+
+from .context_packing import TokenCounter, estimate_tokens
+
+SUMMARY_KEY_SUFFIX = ":summary"
+# messages summarized per LLM call when folding a long backlog of turns
+FOLD_BATCH_MESSAGES = 20
+
+# (current summary, new lines of conversation) -> new summary
+Summarizer = Callable[[str, str], Awaitable[str]]
+
+# one client, with its connection pool, per Redis url in this process
+_shared_clients: Dict[str, Redis] = {}
+
+
+def shared_redis_client(
+    url: str, max_connections: int = 50, pool_timeout: Optional[float] = 5
+) -> Redis:
+    """
+    The process-wide async Redis client for `url`, created on first use.
+
+    Its pool blocks when all connections are in use: a request waits up to
+    `pool_timeout` seconds for one instead of failing with "Too many connections".
+
+    Parameters
+    ----------
+    url : str
+        Redis connection url.
+    max_connections : int
+        Size of the client's connection pool.
+    pool_timeout : float, optional
+        Seconds to wait for a free connection, None to wait indefinitely.
+
+    Returns
+    -------
+    Redis
+        The client, shared by all requests: do not close it.
+    """
+    client = _shared_clients.get(url)
+    if client is None:
+        pool = BlockingConnectionPool.from_url(
+            url, max_connections=max_connections, timeout=pool_timeout
+        )
+        # the client owns the pool, closing it disconnects the pool
+        client = Redis.from_pool(pool)
+        _shared_clients[url] = client
+    return client
+
+
+async def aclose_shared_redis_clients() -> None:
+    """
+    Close the clients of `shared_redis_client`, at shutdown.
+    """
+    while _shared_clients:
+        _, client = _shared_clients.popitem()
+        await client.aclose()
+
+
+def llm_summarizer(model: BaseLanguageModel) -> Summarizer:
+    """
+    Summarize with the progressive summary prompt of ConversationSummaryMemory.
+    """
+    chain = SUMMARY_PROMPT | model | StrOutputParser()
+
+    async def summarize(summary: str, new_lines: str) -> str:
+        return await chain.ainvoke({"summary": summary, "new_lines": new_lines})
+
+    return summarize
+
+
+def window_size(
+    recent: Sequence[BaseMessage],
+    token_budget: int = 0,
+    count_tokens: Optional[TokenCounter] = None,
+) -> int:
+    """
+    Number of the newest messages kept verbatim in the prompt.
+
+    Whole turns, a human message and the replies after it, are kept newest first
+    while their tokens fit the budget.
+
+    Parameters
+    ----------
+    recent : Sequence[BaseMessage]
+        The newest messages of the session, newest first.
+    token_budget : int
+        Maximum number of tokens of the kept turns, 0 for no limit.
+    count_tokens : Callable[[str], int], optional
+        Token counter, an estimate from the text length by default.
+
+    Returns
+    -------
+    int
+        How many of the `recent` messages are kept.
+    """
+    count = count_tokens or estimate_tokens
+    kept = used = 0
+    turn = turn_tokens = 0
+    for message in recent:
+        turn += 1
+        turn_tokens += count(get_buffer_string([message]))
+        if message.type != "human":
+            continue
+        if token_budget and used + turn_tokens > token_budget:
+            break
+        kept += turn
+        used += turn_tokens
+        turn = turn_tokens = 0
+    return kept
+
+
+def window_buffer_string(
+    summary: str,
+    recent: Sequence[BaseMessage],
+    token_budget: int = 0,
+    count_tokens: Optional[TokenCounter] = None,
+) -> str:
+    """
+    Format the summary and the window of `recent` (newest first) like
+    ConversationSummaryBufferMemory's "history".
+    """
+    kept = list(recent[: window_size(recent, token_budget, count_tokens)])
+    messages = [SystemMessage(content=summary)] if summary else []
+    return get_buffer_string(messages + kept[::-1])
+
+
+class AsyncRedisChatMessageHistory:
+    """
+    Async counterpart of langchain's RedisChatMessageHistory.
+
+    Messages are stored under the same key layout and encoding, so sessions written
+    by either class can be read by the other.
+
+    A bounded window of the history can be read instead of all of it: the last
+    turns verbatim, after a summary of the older ones kept in a hash next to the
+    session list (`summary` and `folded`, the number of messages it covers). The
+    summary is updated incrementally by `afold_history`, so the prompt stays the
+    same size however long the session runs.
+
+    Attributes
+    ----------
+    session_id : str
+        Identifier of the conversation.
+    url : str
+        Redis connection url.
+    key_prefix : str
+        Prefix of the Redis list holding the session messages.
+    redis_client : Redis, optional
+        A shared client to use, see `shared_redis_client`; by default the history
+        opens its own, closed by `aclose`.
+    ttl : int
+        Seconds a session is kept after its last write, 0 to keep it forever.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        url: str = "redis://localhost:6379/0",
+        key_prefix: str = "message_store:",
+        redis_client: Optional[Redis] = None,
+        ttl: int = 0,
+    ) -> None:
+        self.session_id = session_id
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.owns_client = redis_client is None
+        self.redis_client = (
+            Redis.from_url(url) if redis_client is None else redis_client
+        )
+
+    @property
+    def key(self) -> str:
+        return self.key_prefix + self.session_id
+
+    @property
+    def summary_key(self) -> str:
+        return self.key + SUMMARY_KEY_SUFFIX
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        items = await self.redis_client.lrange(self.key, 0, -1)
+        return messages_from_dict(
+            [json.loads(item.decode("utf-8")) for item in items[::-1]]
+        )
+
+    async def aget_buffer_string(self) -> str:
+        """
+        The session history formatted like ConversationBufferMemory's "history".
+        """
+        return get_buffer_string(await self.aget_messages())
+
+    async def _aread_window(
+        self, max_turns: int
+    ) -> Tuple[str, int, List[BaseMessage], int, int]:
+        # the summary, the messages it covers, the newest messages (newest first),
+        # the length of the session and the "folded" count as stored, in one
+        # round-trip
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hmget(self.summary_key, "summary", "folded")
+            pipe.lrange(self.key, 0, 2 * max_turns - 1)
+            pipe.llen(self.key)
+            (summary, stored_folded), items, length = await pipe.execute()
+        folded = stored_folded = int(stored_folded or 0)
+        if folded > length:
+            # the session was cleared or trimmed without its summary
+            summary, folded = None, 0
+        recent = messages_from_dict(
+            [json.loads(item.decode("utf-8")) for item in items]
+        )
+        summary = (summary or b"").decode("utf-8")
+        return summary, folded, recent, length, stored_folded
+
+    async def _astore_summary(self, summary: str, folded: int, expected: int) -> bool:
+        # compare-and-set: the summary is only replaced if it still covers the
+        # `expected` messages, a concurrent fold of the session may have moved on
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(self.summary_key)
+                    current = int(await pipe.hget(self.summary_key, "folded") or 0)
+                    if current != expected:
+                        return False
+                    pipe.multi()
+                    pipe.hset(
+                        self.summary_key,
+                        mapping={"summary": summary, "folded": folded},
+                    )
+                    if self.ttl:
+                        pipe.expire(self.summary_key, self.ttl)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def aget_window_buffer_string(
+        self,
+        max_turns: int,
+        token_budget: int = 0,
+        count_tokens: Optional[TokenCounter] = None,
+    ) -> str:
+        """
+        The summary of the older turns and the last turns of the session, formatted
+        like ConversationSummaryBufferMemory's "history".
+
+        Parameters
+        ----------
+        max_turns : int
+            Maximum number of turns kept verbatim.
+        token_budget : int
+            Maximum number of tokens of the verbatim turns, 0 for no limit.
+        count_tokens : Callable[[str], int], optional
+            Token counter, an estimate from the text length by default.
+
+        Returns
+        -------
+        str
+            The summary as a system message, then the kept turns.
+        """
+        summary, _, recent, _, _ = await self._aread_window(max_turns)
+        return window_buffer_string(summary, recent, token_budget, count_tokens)
+
+    async def afold_history(
+        self,
+        summarize: Summarizer,
+        max_turns: int,
+        token_budget: int = 0,
+        count_tokens: Optional[TokenCounter] = None,
+    ) -> bool:
+        """
+        Fold the turns that left the window into the session summary.
+
+        Only the messages the summary does not cover yet are read and summarized,
+        normally the one turn pushed out by the last answer. The session list is
+        left whole for readers of the full history. A summary is only stored if no
+        concurrent fold of the session stored one meanwhile, the fold stops
+        otherwise.
+
+        Parameters
+        ----------
+        summarize : Callable[[str, str], Awaitable[str]]
+            Produces the new summary from the current one and the new lines of
+            conversation, see `llm_summarizer`.
+        max_turns, token_budget, count_tokens
+            The window, as passed to `aget_window_buffer_string`.
+
+        Returns
+        -------
+        bool
+            Whether the summary was updated.
+        """
+        summary, folded, recent, length, stored = await self._aread_window(max_turns)
+        end = length - window_size(recent, token_budget, count_tokens)
+        updated = False
+        while folded < end:
+            batch_end = min(folded + FOLD_BATCH_MESSAGES, end)
+            # counted from the oldest message, at the tail of the list: positions
+            # that messages pushed meanwhile do not shift
+            items = await self.redis_client.lrange(self.key, -batch_end, -(folded + 1))
+            messages = messages_from_dict(
+                [json.loads(item.decode("utf-8")) for item in items[::-1]]
+            )
+            summary = await summarize(summary, get_buffer_string(messages))
+            if not await self._astore_summary(summary, batch_end, stored):
+                break
+            folded = stored = batch_end
+            updated = True
+        return updated
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """
+        Append messages to the session and renew its expiry, in one round-trip.
+        """
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.lpush(
+                self.key,
+                *(json.dumps(message_to_dict(message)) for message in messages),
+            )
+            if self.ttl:
+                pipe.expire(self.key, self.ttl)
+                # a no-op until the session has a summary
+                pipe.expire(self.summary_key, self.ttl)
+            await pipe.execute()
+
+    async def aclear(self) -> None:
+        await self.redis_client.delete(self.key, self.summary_key)
+
+    async def aclose(self) -> None:
+        if self.owns_client:
+            await self.redis_client.aclose()
@@ -0,0 +1,180 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from langchain.schema.document import Document
+
+from ..config import settings
+from .indexer_utils.ingestion import START_INDEX_KEY
+
+CONTEXT_SEPARATOR = "\n\n"
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    # about 4 characters per token for English text with the OpenAI encodings
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=None)
+def token_counter(encoding_name: str = "cl100k_base") -> TokenCounter:
+    """
+    Count tokens with the tiktoken encoding, or estimate them without tiktoken.
+
+    The encoding is downloaded on first use, an estimate from the text length is
+    used when that is not possible.
+    """
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as error:
+        logging.warning(
+            f"Cannot load the {encoding_name} encoding ({error}), "
+            "estimating token counts from text length"
+        )
+        return estimate_tokens
+
+    def count_tokens(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return count_tokens
+
+
+@dataclass(eq=False)
+class Passage:
+    source: Optional[str]
+    start: Optional[int]
+    text: str
+    tokens: int = 0
+    rank: int = 0
+
+
+def merge_overlapping(first: Passage, second: Passage) -> Optional[Passage]:
+    """
+    Join two spans of a source file when they overlap or touch.
+
+    The spans are placed by their start offsets, and only merged if the text they
+    share is the same in both: an offset recorded by an earlier indexer run may no
+    longer match the file.
+
+    Parameters
+    ----------
+    first, second : Passage
+        The spans; their source, start, and text are used.
+
+    Returns
+    -------
+    Passage or None
+        The span covering both, or None when they are apart, from different
+        sources, or do not agree on their shared text.
+    """
+    if first.source != second.source or first.start is None or second.start is None:
+        return None
+    if second.start < first.start:
+        first, second = second, first
+    overlap = first.start + len(first.text) - second.start
+    if overlap < 0:
+        return None
+    if overlap >= len(second.text):
+        # the second span lies within the first
+        offset = second.start - first.start
+        if first.text[offset:].startswith(second.text):
+            return Passage(first.source, first.start, first.text)
+        return None
+    if overlap and not first.text.endswith(second.text[:overlap]):
+        return None
+    return Passage(first.source, first.start, first.text + second.text[overlap:])
+
+
+def _merge_with_passages(
+    passages: List[Passage], chunk: Passage
+) -> Tuple[Passage, List[Passage]]:
+    # a chunk may bridge two passages, merge until nothing overlaps
+    absorbed: List[Passage] = []
+    merged_any = True
+    while merged_any:
+        merged_any = False
+        for passage in passages:
+            if passage in absorbed:
+                continue
+            merged = merge_overlapping(passage, chunk)
+            if merged is not None:
+                chunk = merged
+                absorbed.append(passage)
+                merged_any = True
+    return chunk, absorbed
+
+
+def pack_context(
+    documents: List[Document],
+    token_budget: int = 0,
+    count_tokens: Optional[TokenCounter] = None,
+) -> List[str]:
+    """
+    Pack retrieved chunks into as few, non-repeating passages as fit a token budget.
+
+    The documents are taken best first. A chunk overlapping or touching chunks
+    already taken from the same source, as neighbouring chunks do by the splitter's
+    overlap, is merged with them into one passage without repeating the shared
+    text, going by their `start_index` (chunks indexed without one are not merged).
+    A chunk whose text was already taken is dropped. A chunk is only taken if the tokens it
+    adds fit the remaining budget, so smaller, lower ranked chunks can still fill
+    it. When not even the best chunk fits, it is truncated to the budget.
+
+    Parameters
+    ----------
+    documents : List[Document]
+        The retrieved chunks, best first.
+    token_budget : int
+        Maximum number of tokens of the passages, 0 for no limit.
+    count_tokens : Callable[[str], int], optional
+        Token counter, `token_counter()` by default.
+
+    Returns
+    -------
+    List[str]
+        The passages, in the rank of their best chunk.
+    """
+    count = count_tokens or token_counter()
+    passages: List[Passage] = []
+    used = 0
+    for rank, doc in enumerate(documents):
+        text = doc.page_content
+        if not text.strip() or any(text in passage.text for passage in passages):
+            continue
+        start = doc.metadata.get(START_INDEX_KEY)
+        chunk = Passage(
+            source=doc.metadata.get("source"),
+            start=start if isinstance(start, int) else None,
+            text=text,
+        )
+        merged, absorbed = _merge_with_passages(passages, chunk)
+        merged.tokens = count(merged.text)
+        merged.rank = min([rank] + [passage.rank for passage in absorbed])
+        added = merged.tokens - sum(passage.tokens for passage in absorbed)
+        if token_budget and used + added > token_budget:
+            if passages:
+                continue
+            kept = len(merged.text) * token_budget // merged.tokens
+            merged.text = merged.text[:kept]
+            merged.tokens = added = count(merged.text)
+        passages = [passage for passage in passages if passage not in absorbed]
+        passages.append(merged)
+        used += added
+    return [passage.text for passage in sorted(passages, key=lambda p: p.rank)]
+
+
+def format_context(documents: List[Document]) -> str:
+    """
+    The prompt context for the retrieved chunks, packed into `CONTEXT_TOKEN_BUDGET`
+    tokens (see `pack_context`).
+    """
+    passages = pack_context(
+        documents,
+        token_budget=settings.get("context_token_budget", 3000),
+        count_tokens=token_counter(settings.get("context_encoding", "cl100k_base")),
+    )
+    return CONTEXT_SEPARATOR.join(passages)
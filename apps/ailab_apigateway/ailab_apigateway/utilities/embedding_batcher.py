@@ -0,0 +1,127 @@
+import asyncio
+from typing import List, Optional, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from ..config import settings
+
+# texts of one caller, and the future their vectors are delivered to
+PendingRequest = Tuple[List[str], "asyncio.Future[List[List[float]]]"]
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper coalescing concurrent async embedding calls.
+
+    Texts passed to `aembed_query` and small `aembed_documents` calls are collected
+    for `window` seconds after the first one arrives, or until `max_batch_size`
+    texts are waiting, then embedded in one `aembed_documents` call of the wrapped
+    model; each caller gets its own vectors back. Under load, many concurrent
+    questions thus cost one embedding request instead of one each. Calls of at
+    least `max_batch_size` texts and the sync methods are passed through.
+
+    Attributes
+    ----------
+    window : float
+        Seconds to wait for more texts after the first one, 0 disables batching.
+    max_batch_size : int
+        Texts sent in one request at most.
+    batches, texts : int
+        Requests made to the wrapped model and texts they held, see `stats`.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, window: float = 0.005, max_batch_size: int = 64
+    ) -> None:
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.texts = 0
+        self._pending: List[PendingRequest] = []
+        self._pending_texts = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # the event loop only keeps weak references to tasks
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def model(self) -> Optional[str]:
+        # lets the caches namespace their keys by the wrapped model
+        return getattr(self.embeddings, "model", None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.window <= 0 or len(texts) >= self.max_batch_size:
+            return await self.embeddings.aembed_documents(texts)
+        if self._pending_texts + len(texts) > self.max_batch_size:
+            self._flush()
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[List[List[float]]]" = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_texts += len(texts)
+        if self._pending_texts >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[PendingRequest]) -> None:
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        self.batches += 1
+        self.texts += len(texts)
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for request_texts, future in batch:
+            end = start + len(request_texts)
+            # a caller may have been cancelled meanwhile
+            if not future.done():
+                future.set_result(vectors[start:end])
+            start = end
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+def with_micro_batching(embeddings: Embeddings) -> Embeddings:
+    """
+    Wrap an Embeddings instance with a `MicroBatchingEmbeddings`, unless
+    `EMBEDDING_BATCH_WINDOW_MS` is 0.
+    """
+    window_ms = settings.get("embedding_batch_window_ms", 5)
+    if not window_ms:
+        return embeddings
+    return MicroBatchingEmbeddings(
+        embeddings,
+        window=window_ms / 1000,
+        max_batch_size=settings.get("embedding_batch_max_size", 64),
+    )
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from ..config import settings
+from .embedding_batcher import MicroBatchingEmbeddings
+
+CacheKey = Tuple[str, str]
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+
+    Surrounding and repeated whitespace is collapsed and the text is case-folded.
+    """
+    return " ".join(text.split()).casefold()
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    """
+    Name of the model behind an Embeddings object, used to namespace cache keys.
+    """
+    if isinstance(embeddings, MicroBatchingEmbeddings):
+        # batching does not change the vectors, keys stay those of the model
+        embeddings = embeddings.embeddings
+    model = getattr(embeddings, "model", None)
+    return (
+        f"{type(embeddings).__name__}:{model}" if model else type(embeddings).__name__
+    )
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of query embeddings with a time-to-live.
+
+    Attributes
+    ----------
+    max_size : int
+        Maximum number of cached embeddings; the least recently used is evicted first.
+    ttl : float
+        Seconds an entry stays valid after it was stored, 0 keeps entries until evicted.
+    hits, misses : int
+        Lookup counters, see `stats`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: OrderedDict[CacheKey, Tuple[float, List[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and self._clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: CacheKey, embedding: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper answering `embed_query` from a QueryEmbeddingCache.
+
+    Document embedding is passed through untouched; only the query path, which sees
+    the same questions over and over, is cached. Queries are embedded in their
+    normalized form, the cache key, so the vector cached for a key does not depend on
+    the spelling that came first.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: QueryEmbeddingCache) -> None:
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = embedding_model_name(embeddings)
+
+    def _key(self, query: str) -> CacheKey:
+        return (self.model_name, query)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        query = normalize_query(text)
+        key = self._key(query)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+            self.cache.put(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        query = normalize_query(text)
+        key = self._key(query)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(query)
+            self.cache.put(key, embedding)
+        return embedding
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries, the cache misses in a single `aembed_documents` call.
+        """
+        queries = [normalize_query(text) for text in texts]
+        keys = [self._key(query) for query in queries]
+        embeddings = [self.cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = await self.embeddings.aembed_documents(
+                [queries[i] for i in missing]
+            )
+            for i, embedding in zip(missing, computed):
+                self.cache.put(keys[i], embedding)
+                embeddings[i] = embedding
+        return embeddings
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_size=settings.get("query_embedding_cache_size", 1024),
+    ttl=settings.get("query_embedding_cache_ttl", 3600),
+)
+
+
+async def aembed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed many queries in one request, through the query cache when there is one.
+    """
+    if isinstance(embeddings, CachedQueryEmbeddings):
+        return await embeddings.aembed_queries(texts)
+    return await embeddings.aembed_documents(texts)
+
+
+def with_query_cache(embeddings: Embeddings) -> Embeddings:
+    """
+    Wrap an Embeddings instance with the process-wide query embedding cache.
+    """
+    return CachedQueryEmbeddings(embeddings, query_embedding_cache)
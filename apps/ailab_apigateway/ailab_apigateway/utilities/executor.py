@@ -0,0 +1,35 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+from ..config import settings
+
+T = TypeVar("T")
+
+blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.get("blocking_executor_workers", 16),
+    thread_name_prefix="blocking",
+)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking call in the bounded executor without stalling the event loop.
+
+    Used for the calls that have no async API (vector searches on FAISS and postgres,
+    index loading). The executor size caps how many of them run at once.
+
+    Parameters
+    ----------
+    func : Callable
+        The blocking callable.
+    *args, **kwargs
+        Arguments forwarded to `func`.
+
+    Returns
+    -------
+    The return value of `func`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
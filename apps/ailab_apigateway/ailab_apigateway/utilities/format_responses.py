@@ -1,9 +1,19 @@
 from abc import ABC
-from typing import override
+from typing import List, override
 
 from langchain.schema import Document
 
 
+def serialize_documents(documents: List[Document]) -> List[dict]:
+    """
+    Convert Langchain Documents into the JSON-friendly form used in responses.
+    """
+    return [
+        {"page_content": str(doc.page_content), "metadata": str(doc.metadata)}
+        for doc in documents
+    ]
+
+
 class Responder(ABC):
     """
     base class for responder objects, given an input dictionary it returns only
@@ -11,7 +21,8 @@ class Responder(ABC):
     """
 
     def __init__(self, response_dict: dict) -> None:
-        self._response_dict = response_dict
+        # validate (and for documents, serialize) through the subclass' setter
+        self.response_dict(response_dict)
 
     def response_dict(self, rd: dict) -> None:
         assert "answer" in rd, "'answer' key not found in response_dict"
@@ -74,10 +85,7 @@ class ResponderWithDocument(Responder):
             isinstance(entry, Document) for entry in rd["documents"]
         ), "the entries of the response_dict['documents'] list are not Langchain's Documents"
         self._response_dict = rd
-        self._response_dict["documents"] = [
-            {"page_content": str(doc.page_content), "metadata": str(doc.metadata)}
-            for doc in rd["documents"]
-        ]
+        self._response_dict["documents"] = serialize_documents(rd["documents"])
 
     def produce_response(self) -> dict:
         return {k: self._response_dict[k] for k in self.response_keys}
@@ -0,0 +1,47 @@
+import os
+import uuid
+from typing import Optional
+
+from ..config import settings
+from .directory_utils import initialize_dir_for_file
+
+
+def index_version_path() -> str:
+    return settings.get("index_version_path", "databases/INDEX_VERSION")
+
+
+def read_index_version() -> Optional[str]:
+    """
+    Read the version marker written by the indexer after its last rebuild.
+
+    Returns
+    -------
+    str or None
+        The current index version, or None if the indexer never wrote one.
+    """
+    try:
+        with open(index_version_path(), encoding="utf8") as version_file:
+            return version_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def bump_index_version() -> str:
+    """
+    Mark the document index as rebuilt by writing a new version marker.
+
+    The marker is replaced atomically, readers see either the old or the new version.
+
+    Returns
+    -------
+    str
+        The new index version.
+    """
+    path = index_version_path()
+    initialize_dir_for_file(path)
+    version = uuid.uuid4().hex
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as version_file:
+        version_file.write(version)
+    os.replace(tmp_path, path)
+    return version
@@ -0,0 +1,59 @@
+import hashlib
+from typing import Iterable, Iterator, Set
+
+from langchain.schema.document import Document
+
+CHUNK_HASH_KEY = "chunk_hash"
+
+
+def chunk_hash(doc: Document) -> str:
+    """
+    Content hash identifying a chunk, used as its id in the vector store.
+
+    The source is part of the hash, so the same text in two files gives two chunks;
+    identical chunks within one source share a single vector.
+    """
+    source = str(doc.metadata.get("source", ""))
+    return hashlib.sha256(f"{source}\0{doc.page_content}".encode("utf8")).hexdigest()
+
+
+class ChunkDiff:
+    """
+    Compares freshly split chunks with the chunk ids already in the vector store.
+
+    Attributes
+    ----------
+    existing_ids : Set[str]
+        Chunk hashes present in the vector store before this run.
+    seen_ids : Set[str]
+        Chunk hashes of the current documents, filled while `new_chunks` is consumed.
+    unchanged : int
+        Number of current chunks already in the vector store.
+    """
+
+    def __init__(self, existing_ids: Set[str]) -> None:
+        self.existing_ids = existing_ids
+        self.seen_ids: Set[str] = set()
+        self.unchanged = 0
+
+    def new_chunks(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """
+        Tag every chunk with its hash and yield only those not yet indexed.
+        """
+        for doc in chunks:
+            doc_hash = chunk_hash(doc)
+            if doc_hash in self.seen_ids:
+                continue
+            self.seen_ids.add(doc_hash)
+            if doc_hash in self.existing_ids:
+                self.unchanged += 1
+                continue
+            doc.metadata[CHUNK_HASH_KEY] = doc_hash
+            yield doc
+
+    @property
+    def stale_ids(self) -> Set[str]:
+        """
+        Ids of indexed chunks that no longer exist; complete once `new_chunks` is exhausted.
+        """
+        return self.existing_ids - self.seen_ids
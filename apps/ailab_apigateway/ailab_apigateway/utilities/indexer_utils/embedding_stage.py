@@ -0,0 +1,142 @@
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Deque, Iterable, Iterator, List, Tuple
+
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+EmbeddedBatch = Tuple[List[Document], List[List[float]]]
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    Tell whether an embedding call failed because the provider is rate limiting us.
+    """
+    if "RateLimit" in type(error).__name__:
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+    return status == 429
+
+
+def embed_with_retry(
+    embeddings: Embeddings,
+    texts: List[str],
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> List[List[float]]:
+    """
+    Embed texts, retrying with exponential backoff and jitter while throttled.
+
+    Parameters
+    ----------
+    embeddings : Embeddings
+        The embeddings model.
+    texts : List[str]
+        The texts to embed.
+    max_retries : int
+        Retries after the first attempt before the throttling error is raised.
+    base_delay, max_delay : float
+        Backoff before retry n is min(max_delay, base_delay * 2**n), with full jitter.
+
+    Returns
+    -------
+    List[List[float]]
+        One vector per text.
+    """
+    attempt = 0
+    while True:
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as error:
+            if not is_throttling_error(error) or attempt >= max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            attempt += 1
+            logging.warning(
+                f"Embedding batch throttled, retry {attempt}/{max_retries} in {delay:.1f}s"
+            )
+            sleep(delay)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def embed_in_batches(
+    chunks: Iterable[Document],
+    embeddings: Embeddings,
+    batch_size: int = 256,
+    max_concurrency: int = 4,
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+) -> Iterator[EmbeddedBatch]:
+    """
+    Embed a stream of chunks in batches, several batches in flight at once.
+
+    Chunks are consumed lazily and batches are yielded in input order as soon as they
+    are embedded, so the caller can upsert them incrementally and at most
+    `max_concurrency` batches of vectors are held in memory.
+
+    Parameters
+    ----------
+    chunks : Iterable[Document]
+        The chunks to embed.
+    embeddings : Embeddings
+        The embeddings model.
+    batch_size : int
+        Chunks per embedding request.
+    max_concurrency : int
+        Embedding requests in flight at once.
+    max_retries, base_delay, max_delay
+        Retry policy on throttling, see `embed_with_retry`.
+
+    Yields
+    ------
+    Tuple[List[Document], List[List[float]]]
+        A batch of chunks and their vectors.
+    """
+    embedded = 0
+    started = time.monotonic()
+    in_flight: Deque[Tuple[List[Document], Future]] = deque()
+    with ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="embed"
+    ) as executor:
+
+        def submit(batch: List[Document]) -> None:
+            future = executor.submit(
+                embed_with_retry,
+                embeddings,
+                [doc.page_content for doc in batch],
+                max_retries,
+                base_delay,
+                max_delay,
+            )
+            in_flight.append((batch, future))
+
+        for batch in batched(chunks, batch_size):
+            if len(in_flight) >= max_concurrency:
+                done_batch, future = in_flight.popleft()
+                embedded += len(done_batch)
+                yield done_batch, future.result()
+                _log_progress(embedded, started)
+            submit(batch)
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            embedded += len(done_batch)
+            yield done_batch, future.result()
+            _log_progress(embedded, started)
+
+
+def _log_progress(embedded: int, started: float) -> None:
+    elapsed = time.monotonic() - started
+    rate = embedded / elapsed if elapsed else 0.0
+    logging.info(f"Embedded {embedded} chunks ({rate:.1f} chunks/s)")
@@ -0,0 +1,263 @@
+import glob
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, Set
+
+from langchain.document_loaders import TextLoader
+from langchain.schema.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# character offset of a chunk in its file, lets overlapping chunks be merged again
+START_INDEX_KEY = "start_index"
+
+NON_SPACE = re.compile(r"\S")
+
+
+def resolve_document_paths(
+    patterns: str | Iterable[str], extensions: Iterable[str] = (".txt", ".md")
+) -> List[str]:
+    """
+    Expand the configured document locations into a sorted list of files.
+
+    Parameters
+    ----------
+    patterns : str or Iterable[str]
+        Files, directories (walked recursively) or glob patterns (`**` supported).
+    extensions : Iterable[str]
+        File extensions picked up when walking a directory.
+
+    Returns
+    -------
+    List[str]
+        The matching files, without duplicates.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    extensions = tuple(extensions)
+    paths: Set[str] = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _dirs, files in os.walk(pattern):
+                paths.update(
+                    os.path.join(root, name)
+                    for name in files
+                    if name.endswith(extensions)
+                )
+        elif glob.has_magic(pattern):
+            paths.update(
+                p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p)
+            )
+        else:
+            paths.add(pattern)
+    return sorted(paths)
+
+
+def _on_word_boundaries(text: str, start: int, end: int) -> bool:
+    return (start == 0 or text[start - 1].isspace()) and (
+        end == len(text) or text[end].isspace()
+    )
+
+
+def _find_chunk(text: str, chunk: str, start: int, limit: int) -> int:
+    # the first match from `start` on word boundaries, a chunk is cut elsewhere
+    # only in a word too long for one chunk; none past `limit` is the right one
+    index = first = text.find(chunk, start)
+    while 0 <= index <= limit and not _on_word_boundaries(
+        text, index, index + len(chunk)
+    ):
+        index = text.find(chunk, index + 1)
+    return index if 0 <= index <= limit else first
+
+
+def chunk_offsets(text: str, chunks: List[str], overlap: int) -> List[int]:
+    """
+    Character offset of each chunk of a split text.
+
+    A chunk does not start before the previous one, repeats at most `overlap` of
+    its characters and begins at the latest where the text goes on after it, so it
+    is searched in between; searching from the previous start alone can match an
+    earlier repetition of the same text.
+    """
+    offsets: List[int] = []
+    end = 0
+    for chunk in chunks:
+        previous = offsets[-1] if offsets else 0
+        following = NON_SPACE.search(text, end)
+        limit = following.start() if following else len(text)
+        index = _find_chunk(text, chunk, max(previous, end - overlap), limit)
+        if index < 0:
+            # the overlap may also count separators that were stripped
+            index = _find_chunk(text, chunk, previous, limit)
+        offsets.append(index)
+        end = index + len(chunk)
+    return offsets
+
+
+def resume_offset(text: str, end: int, overlap: int) -> int:
+    """
+    Where to split `text` again after a chunk ending at `end`: the first word
+    boundary of the `overlap` characters before it, so the next chunk can repeat
+    them, else `end` itself.
+    """
+    for index in range(max(end - overlap, 1), end):
+        if text[index - 1].isspace() and not text[index].isspace():
+            return index
+    return end
+
+
+def split_file(path: str, chunk_size: int, overlap: int) -> List[Document]:
+    """
+    Load one text file and split it into chunks, each carrying the file path as
+    `source` and its character offset in the file as `start_index`.
+    """
+    text = TextLoader(path).load()[0].page_content
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=overlap
+    )
+    chunks = text_splitter.split_text(text)
+    return [
+        Document(page_content=chunk, metadata={"source": path, START_INDEX_KEY: index})
+        for chunk, index in zip(chunks, chunk_offsets(text, chunks, overlap))
+    ]
+
+
+def stream_split_file(
+    path: str, chunk_size: int, overlap: int, window_size: int = 1 << 20
+) -> Iterator[Document]:
+    """
+    Split a text file of any size into chunks, reading it in bounded windows.
+
+    Each window is appended to the text not yet split for good and split with the
+    same recursive separators as `split_file`. Chunks ending within `chunk_size`
+    characters of the buffer end may still grow with the next window, so only the
+    chunks before are emitted. The buffer then resumes at the end of the last one,
+    or at the separator the splitter started the overlap of the next chunk at, so
+    the text is split again from a chunk boundary. Chunks next to a window boundary
+    may be grouped slightly differently than in a whole-file split, no text is lost
+    or repeated beyond `overlap`. Memory stays around `window_size + 2 * chunk_size`
+    characters.
+
+    Parameters
+    ----------
+    path : str
+        The file to split.
+    chunk_size, overlap : int
+        Splitter settings, see `split_file`.
+    window_size : int
+        Characters read from the file at once.
+
+    Yields
+    ------
+    Document
+        The chunks, each carrying the file path as `source` and its character
+        offset in the file as `start_index`.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=overlap
+    )
+    buffer = ""
+    # offset of the buffer in the file
+    buffer_start = 0
+    with open(path) as file:
+        while True:
+            window = file.read(window_size)
+            buffer += window
+            chunks = text_splitter.split_text(buffer)
+            offsets = chunk_offsets(buffer, chunks, overlap)
+            # all chunks are final at the end of the file
+            final_end = len(buffer) - chunk_size if window else len(buffer)
+            ready = 0
+            while (
+                ready < len(chunks) and offsets[ready] + len(chunks[ready]) <= final_end
+            ):
+                yield Document(
+                    page_content=chunks[ready],
+                    metadata={
+                        "source": path,
+                        START_INDEX_KEY: buffer_start + offsets[ready],
+                    },
+                )
+                ready += 1
+            if not window:
+                return
+            if ready == 0:
+                continue
+            emitted_end = offsets[ready - 1] + len(chunks[ready - 1])
+            if ready < len(chunks) and offsets[ready] > offsets[ready - 1]:
+                # the splitter started the overlap of the next chunk at a separator
+                resume = min(offsets[ready], emitted_end)
+            else:
+                resume = resume_offset(buffer, emitted_end, overlap)
+            buffer = buffer[resume:]
+            buffer_start += resume
+
+
+def iter_chunks(
+    paths: List[str],
+    chunk_size: int,
+    overlap: int,
+    workers: int = 0,
+    streaming_threshold: int = 64 << 20,
+) -> Iterator[Document]:
+    """
+    Load and split files in a process pool, yielding chunks as files complete.
+
+    At most twice as many files as workers are in flight, so the split chunks
+    waiting to be embedded stay bounded however large the corpus. Files are merged in
+    completion order. Files larger than `streaming_threshold` bytes are split lazily
+    with `stream_split_file` in this process instead, while the pool works on the
+    smaller ones.
+
+    Parameters
+    ----------
+    paths : List[str]
+        The files to ingest.
+    chunk_size, overlap : int
+        Splitter settings, see `split_file`.
+    workers : int
+        Worker processes, 0 for one per CPU.
+    streaming_threshold : int
+        Size in bytes above which a file is streamed, 0 to stream every file.
+
+    Yields
+    ------
+    Document
+        The chunks of all files.
+    """
+    large = [path for path in paths if os.path.getsize(path) > streaming_threshold]
+    paths = [path for path in paths if os.path.getsize(path) <= streaming_threshold]
+    workers = workers or os.cpu_count() or 1
+    if len(paths) <= 1 or workers == 1:
+        for path in large:
+            yield from stream_split_file(path, chunk_size, overlap)
+        for path in paths:
+            yield from split_file(path, chunk_size, overlap)
+        return
+    pending = iter(paths)
+    in_flight: Set[Future] = set()
+    # spawn: the indexer runs embedding threads, forking next to them is unsafe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+
+        def fill() -> None:
+            for path in pending:
+                in_flight.add(executor.submit(split_file, path, chunk_size, overlap))
+                if len(in_flight) >= 2 * workers:
+                    break
+
+        fill()
+        for path in large:
+            logging.info(f"Streaming {path}")
+            yield from stream_split_file(path, chunk_size, overlap)
+        files_done = 0
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.remove(future)
+                files_done += 1
+                yield from future.result()
+            fill()
+            logging.info(f"Split {files_done}/{len(paths)} files")
@@ -0,0 +1,184 @@
+import json
+import logging
+import math
+from typing import Optional
+
+import sqlalchemy
+from langchain.vectorstores.pgvector import PGVector
+from sqlalchemy.orm import Session
+
+from ..retriever_utils.batch_search import ANN_METHODS, PGVECTOR_OPCLASSES
+
+# an ivfflat index sized for n rows is rebuilt once the collection has grown or shrunk
+# by this factor, its lists are clustered on the rows present when it is built
+IVFFLAT_REBUILD_FACTOR = 2
+
+
+def ann_index_name(method: str, collection_id: str) -> str:
+    # one index per collection, within the 63 characters allowed for a name
+    return f"langchain_pg_embedding_{method}_{collection_id.replace('-', '')}"
+
+
+def ivfflat_lists(rows: int) -> int:
+    """
+    Number of ivfflat lists recommended by pgvector for a collection size.
+    """
+    if rows <= 1_000_000:
+        return max(rows // 1000, 10)
+    return int(math.sqrt(rows))
+
+
+def ann_index_options(
+    method: str, rows: int, m: int, ef_construction: int, lists: int
+) -> str:
+    """
+    WITH options of the index, `lists` 0 sizing ivfflat lists to the collection.
+    """
+    if method == "hnsw":
+        return f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    return f"lists = {int(lists) or ivfflat_lists(rows)}"
+
+
+def create_ann_index_sql(
+    name: str,
+    method: str,
+    dimension: int,
+    opclass: str,
+    options: str,
+    collection_id: str,
+) -> str:
+    """
+    Statement creating a partial ANN index over the embeddings of one collection.
+
+    LangChain declares the embedding column without a dimension, which pgvector
+    cannot index, so the index is built on the column cast to the collection's
+    dimension; queries must use the same cast expression to be served by it.
+    """
+    return (
+        f"CREATE INDEX {name} ON langchain_pg_embedding "
+        f"USING {method} ((embedding::vector({int(dimension)})) {opclass}) "
+        f"WITH ({options}) "
+        f"WHERE collection_id = '{collection_id}'"
+    )
+
+
+def ensure_ann_index(
+    vectorstore: PGVector,
+    method: str,
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int = 0,
+) -> Optional[str]:
+    """
+    Create or maintain the ANN index of the vector store's collection.
+
+    The index definition is recorded in the index comment. An index whose method,
+    dimension or options differ from the requested ones is rebuilt, and so is an
+    ivfflat index once the collection size has changed by `IVFFLAT_REBUILD_FACTOR`.
+    An hnsw index is maintained by pgvector on insert, so it is only analyzed.
+
+    Parameters
+    ----------
+    vectorstore : PGVector
+        The vector store whose collection is indexed.
+    method : str
+        "hnsw" or "ivfflat"; anything else drops the ANN index of the collection.
+    m, ef_construction : int
+        hnsw graph degree and build-time candidate list size.
+    lists : int
+        ivfflat list count, 0 to size it to the collection.
+
+    Returns
+    -------
+    str or None
+        Name of the index, None when the collection is not indexed.
+    """
+    with Session(vectorstore._conn) as session:
+        _drop_orphaned_ann_indexes(session)
+        collection = vectorstore.get_collection(session)
+        collection_id = str(collection.uuid)
+        if method not in ANN_METHODS:
+            _drop_ann_indexes(session, collection_id)
+            session.commit()
+            return None
+        rows, dimension = session.execute(
+            sqlalchemy.text(
+                "SELECT count(*), max(vector_dims(embedding)) "
+                "FROM langchain_pg_embedding WHERE collection_id = :collection_id"
+            ),
+            {"collection_id": collection_id},
+        ).one()
+        if not rows:
+            return None
+        name = ann_index_name(method, collection_id)
+        options = ann_index_options(method, rows, m, ef_construction, lists)
+        wanted = {"dimension": dimension, "options": options, "lists": lists}
+        comment = session.execute(
+            sqlalchemy.text("SELECT obj_description(to_regclass(:name), 'pg_class')"),
+            {"name": name},
+        ).scalar()
+        built = json.loads(comment) if comment else None
+        if built is not None and _is_current(method, built, wanted, rows):
+            session.execute(sqlalchemy.text("ANALYZE langchain_pg_embedding"))
+            session.commit()
+            return name
+        _drop_ann_indexes(session, collection_id)
+        logging.info(f"Building {method} index {name} ({options}) over {rows} vectors")
+        session.execute(
+            sqlalchemy.text(
+                create_ann_index_sql(
+                    name,
+                    method,
+                    dimension,
+                    PGVECTOR_OPCLASSES[vectorstore._distance_strategy],
+                    options,
+                    collection_id,
+                )
+            )
+        )
+        # psycopg2 binds parameters client-side, so they work in utility statements
+        session.execute(
+            sqlalchemy.text(f"COMMENT ON INDEX {name} IS :definition"),
+            {"definition": json.dumps({**wanted, "rows": rows})},
+        )
+        session.commit()
+    return name
+
+
+def _drop_ann_indexes(session: Session, collection_id: str) -> None:
+    for method in ANN_METHODS:
+        name = ann_index_name(method, collection_id)
+        session.execute(sqlalchemy.text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _drop_orphaned_ann_indexes(session: Session) -> None:
+    # indexes of collections dropped since, e.g. by an indexer run with override
+    collection_ids = {
+        str(uuid).replace("-", "")
+        for (uuid,) in session.execute(
+            sqlalchemy.text("SELECT uuid FROM langchain_pg_collection")
+        )
+    }
+    index_names = session.execute(
+        sqlalchemy.text(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE tablename = 'langchain_pg_embedding' "
+            "AND indexname ~ '^langchain_pg_embedding_(hnsw|ivfflat)_[0-9a-f]{32}$'"
+        )
+    )
+    for (name,) in index_names.all():
+        if name.rsplit("_", 1)[1] not in collection_ids:
+            session.execute(sqlalchemy.text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _is_current(method: str, built: dict, wanted: dict, rows: int) -> bool:
+    if method == "hnsw":
+        return all(built.get(key) == value for key, value in wanted.items())
+    if built.get("dimension") != wanted["dimension"]:
+        return False
+    if built.get("lists") != wanted["lists"]:
+        return False
+    if wanted["lists"]:
+        return True
+    built_rows = built.get("rows") or 1
+    return 1 / IVFFLAT_REBUILD_FACTOR < rows / built_rows < IVFFLAT_REBUILD_FACTOR
@@ -1,3 +1,10 @@
+import csv
+import io
+import json
+import uuid
+from typing import Any, List
+
+from langchain.schema.document import Document
 from langchain.vectorstores.pgvector import PGVector
 
 from ...config import settings
@@ -17,3 +24,98 @@ def make_connection_string() -> str:
         password=settings.database_password,
     )
     return connection_string
+
+
+COPY_COLUMNS = "uuid, collection_id, embedding, document, cmetadata, custom_id"
+
+
+def embedding_copy_rows(
+    collection_id: str,
+    documents: List[Document],
+    vectors: List[List[float]],
+    ids: List[str],
+) -> io.StringIO:
+    """
+    Render chunks as CSV rows for `COPY ... FROM STDIN`, in `COPY_COLUMNS` order.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    for doc, vector, doc_id in zip(documents, vectors, ids):
+        writer.writerow(
+            [
+                uuid.uuid4(),
+                collection_id,
+                "[" + ",".join(map(str, vector)) + "]",
+                doc.page_content,
+                json.dumps(doc.metadata),
+                doc_id,
+            ]
+        )
+    buffer.seek(0)
+    return buffer
+
+
+def copy_insert_embeddings(
+    connection: Any,
+    collection_id: str,
+    documents: List[Document],
+    vectors: List[List[float]],
+    ids: List[str],
+) -> None:
+    """
+    Insert a batch of chunks into `langchain_pg_embedding` in one transaction.
+
+    The rows are streamed straight into the table with COPY. The chunks must not be
+    stored yet: the incremental diff only writes chunks with new ids, and the table
+    has no index on the id to replace existing rows without scanning it per batch.
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        A raw DBAPI connection, committed once the batch is written.
+    collection_id : str
+        The collection the chunks belong to.
+    documents, vectors, ids : List
+        The chunks, their vectors and their ids.
+    """
+    rows = embedding_copy_rows(collection_id, documents, vectors, ids)
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY langchain_pg_embedding ({COPY_COLUMNS}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                rows,
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def delete_embeddings(connection: Any, collection_id: str, ids: List[str]) -> None:
+    """
+    Delete chunks of one collection by id, in one transaction.
+
+    `PGVector.delete` matches the id alone, and chunks hashed from the same file
+    and text share it across collections, so the collection is matched too.
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        A raw DBAPI connection, committed once the chunks are deleted.
+    collection_id : str
+        The collection the chunks belong to.
+    ids : List[str]
+        The ids of the chunks.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM langchain_pg_embedding "
+                "WHERE collection_id = %s AND custom_id = ANY(%s)",
+                (collection_id, ids),
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
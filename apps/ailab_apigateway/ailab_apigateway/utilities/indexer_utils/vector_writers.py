@@ -0,0 +1,289 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Set, Tuple
+
+import numpy as np
+import sqlalchemy
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema.document import Document
+from langchain.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain.vectorstores.pgvector import PGVector
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.orm import Session
+
+from ...config import settings
+from ..retriever_utils.faiss_index import enable_reconstruct, make_faiss_index
+from ..retriever_utils.mmap_docstore import (
+    FAISS_INDEX_FILE,
+    faiss_files_path,
+    load_faiss,
+)
+from .chunk_hashes import CHUNK_HASH_KEY
+from .pgvector_index import ensure_ann_index
+from .postgres_methods import (
+    copy_insert_embeddings,
+    delete_embeddings,
+    make_connection_string,
+)
+
+
+class VectorWriter(ABC):
+    """
+    Base class for writers receiving already embedded chunks batch by batch.
+
+    Chunks are stored under their content hash (see `chunk_hashes`), which lets an
+    incremental run find out what is already indexed and delete what is gone.
+
+    Attributes
+    ----------
+    embeddings : Embeddings
+        The embeddings model, stored with the index for query-time embedding.
+    override : bool
+        Start from an empty index instead of updating the existing one.
+    """
+
+    def __init__(self, embeddings: Embeddings, override: bool = False) -> None:
+        self.embeddings = embeddings
+        self.override = override
+
+    @staticmethod
+    def ids_of(documents: List[Document]) -> List[str]:
+        return [doc.metadata[CHUNK_HASH_KEY] for doc in documents]
+
+    @abstractmethod
+    def existing_ids(self) -> Set[str]:
+        """
+        Ids of the chunks already in the index.
+        """
+
+    @abstractmethod
+    def write(self, documents: List[Document], vectors: List[List[float]]) -> None:
+        """
+        Upsert a batch of chunks and their vectors.
+        """
+
+    @abstractmethod
+    def delete(self, ids: Set[str]) -> None:
+        """
+        Delete chunks by id.
+        """
+
+    @abstractmethod
+    def finish(self) -> Any:
+        """
+        Complete the write and return the resulting vector store.
+        """
+
+    def close(self) -> None:
+        """
+        Release the resources of the writer, also after a failed write.
+        """
+
+
+class FAISSWriter(VectorWriter):
+    """
+    Builds a FAISS index incrementally, on top of the saved index unless overriding.
+
+    A new index is built from `FAISS_INDEX_SPEC`. Indexes that need training (IVF,
+    PQ) are trained on the first `FAISS_TRAINING_SIZE` vectors, which are held back
+    in a preallocated float32 array until then; an updated index keeps its training.
+    """
+
+    def __init__(self, embeddings: Embeddings, override: bool = False) -> None:
+        super().__init__(embeddings, override)
+        self.index: Optional[FAISS] = None
+        self.index_spec = settings.get("faiss_index_spec", "Flat")
+        self.training_size = settings.get("faiss_training_size", 200_000)
+        # vectors held back until the index is trained, preallocated on first write
+        self._untrained_vectors: Optional[np.ndarray] = None
+        self._untrained_documents: List[Document] = []
+        index_file = os.path.join(
+            faiss_files_path(settings.database_path), FAISS_INDEX_FILE
+        )
+        if not override and os.path.exists(index_file):
+            self.index = load_faiss(settings.database_path, embeddings, writable=True)
+            logging.info(f"Updating the FAISS index in {settings.database_path}")
+
+    def existing_ids(self) -> Set[str]:
+        if self.index is None:
+            return set()
+        return set(self.index.index_to_docstore_id.values())
+
+    def _add(self, documents: List[Document], vectors: List[List[float]]) -> None:
+        self.index.add_embeddings(
+            list(zip((doc.page_content for doc in documents), vectors)),
+            metadatas=[doc.metadata for doc in documents],
+            ids=self.ids_of(documents),
+        )
+
+    def _create_index(self, dimension: int) -> None:
+        documents, vectors = self._untrained_documents, self._untrained_vectors
+        self._untrained_documents, self._untrained_vectors = [], None
+        index = make_faiss_index(self.index_spec, dimension)
+        held = len(documents)
+        if held:
+            vectors = vectors[:held]
+        if not index.is_trained:
+            logging.info(f"Training the {self.index_spec} index on {held} vectors")
+            index.train(vectors)
+        self.index = FAISS(self.embeddings, index, InMemoryDocstore({}), {})
+        if documents:
+            self._add(documents, vectors)
+
+    def _hold_for_training(
+        self, documents: List[Document], vectors: List[List[float]]
+    ) -> int:
+        # buffers vectors until the training size is reached, then trains; returns
+        # how many of the batch were taken, the others go into the trained index
+        dimension = len(vectors[0])
+        if self._untrained_vectors is None:
+            if not self._needs_training(dimension):
+                self._create_index(dimension)
+                return 0
+            self._untrained_vectors = np.empty(
+                (self.training_size, dimension), dtype=np.float32
+            )
+        held = len(self._untrained_documents)
+        taken = min(len(documents), self.training_size - held)
+        rows = slice(held, held + taken)
+        self._untrained_vectors[rows] = vectors[:taken]
+        self._untrained_documents.extend(documents[:taken])
+        if held + taken >= self.training_size:
+            self._create_index(dimension)
+        return taken
+
+    def write(self, documents: List[Document], vectors: List[List[float]]) -> None:
+        if self.index is None:
+            taken = self._hold_for_training(documents, vectors)
+            documents, vectors = documents[taken:], vectors[taken:]
+        if documents:
+            self._add(documents, vectors)
+
+    def _needs_training(self, dimension: int) -> bool:
+        return not make_faiss_index(self.index_spec, dimension).is_trained
+
+    def delete(self, ids: Set[str]) -> None:
+        if self.index is None or not ids:
+            return
+        faiss = dependable_faiss_import()
+        if isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlat):
+            self.index.delete(list(ids))
+        else:
+            # LangChain renumbers the remaining vectors from 0, which only matches a
+            # flat index: IVF keeps the labels of the remaining vectors and HNSW
+            # cannot remove vectors at all, so these are rebuilt
+            self._rebuild_without(ids)
+
+    def _rebuild_without(self, ids: Set[str]) -> None:
+        kept = [
+            (position, doc_id)
+            for position, doc_id in sorted(self.index.index_to_docstore_id.items())
+            if doc_id not in ids
+        ]
+        enable_reconstruct(self.index.index)
+        # PQ indexes return their decoded, approximate vectors
+        stored = self.index.index.reconstruct_n(0, self.index.index.ntotal)
+        index = dependable_faiss_import().clone_index(self.index.index)
+        index.reset()
+        documents = [self.index.docstore.search(doc_id) for _, doc_id in kept]
+        vectors = [stored[position].tolist() for position, _ in kept]
+        logging.info(f"Rebuilding the FAISS index with {len(kept)} vectors")
+        self.index = FAISS(self.embeddings, index, InMemoryDocstore({}), {})
+        if kept:
+            self._add(documents, vectors)
+
+    def finish(self) -> Optional[FAISS]:
+        """
+        The index, None when there was none and no chunk was written.
+        """
+        if self.index is None and self._untrained_documents:
+            # fewer vectors than the training size, train on all of them
+            self._create_index(self._untrained_vectors.shape[1])
+        return self.index
+
+
+class PGVectorWriter(VectorWriter):
+    """
+    Writes batches into the configured pgvector collection.
+
+    The collection is dropped first when overriding. Chunks are buffered and
+    inserted `PGVECTOR_WRITE_BATCH_SIZE` at a time with COPY, one transaction per
+    batch, on a connection released by `finish` or `close`. Once written, the
+    collection's ANN index (`PGVECTOR_INDEX_METHOD`) is created or maintained.
+    """
+
+    def __init__(self, embeddings: Embeddings, override: bool = False) -> None:
+        super().__init__(embeddings, override)
+        self.index = PGVector(
+            connection_string=make_connection_string(),
+            embedding_function=embeddings,
+            collection_name=settings.database_table,
+            pre_delete_collection=override,
+        )
+        self.batch_size = settings.get("pgvector_write_batch_size", 2000)
+        self._pending: List[Tuple[Document, List[float]]] = []
+        with Session(self.index._conn) as session:
+            self.collection_id = str(self.index.get_collection(session).uuid)
+        # the COPY batches run on a raw connection of their own engine
+        self._engine = sqlalchemy.create_engine(make_connection_string())
+        self._connection = self._engine.raw_connection()
+
+    def existing_ids(self) -> Set[str]:
+        embedding_store = self.index.EmbeddingStore
+        with Session(self.index._conn) as session:
+            collection = self.index.get_collection(session)
+            rows = session.query(embedding_store.custom_id).filter(
+                embedding_store.collection_id == collection.uuid
+            )
+            return {custom_id for (custom_id,) in rows if custom_id is not None}
+
+    def write(self, documents: List[Document], vectors: List[List[float]]) -> None:
+        self._pending.extend(zip(documents, vectors))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        documents = [doc for doc, _ in self._pending]
+        vectors = [vector for _, vector in self._pending]
+        copy_insert_embeddings(
+            self._connection,
+            self.collection_id,
+            documents,
+            vectors,
+            self.ids_of(documents),
+        )
+        logging.info(f"Copied {len(documents)} chunks into {settings.database_table}")
+        self._pending = []
+
+    def delete(self, ids: Set[str]) -> None:
+        self._flush()
+        if ids:
+            delete_embeddings(self._connection, self.collection_id, sorted(ids))
+
+    def finish(self) -> PGVector:
+        try:
+            self._flush()
+        finally:
+            self.close()
+        ensure_ann_index(
+            self.index,
+            method=settings.get("pgvector_index_method", "hnsw"),
+            m=settings.get("pgvector_hnsw_m", 16),
+            ef_construction=settings.get("pgvector_hnsw_ef_construction", 64),
+            lists=settings.get("pgvector_ivfflat_lists", 0),
+        )
+        return self.index
+
+    def close(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            # a committed batch leaves nothing to roll back, a failed one might
+            self._connection.rollback()
+        finally:
+            self._connection.close()
+            self._connection = None
+            self._engine.dispose()
@@ -0,0 +1,251 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+from langchain.schema.messages import BaseMessage, get_buffer_string
+
+from ..config import settings
+from .chat_history import (
+    FOLD_BATCH_MESSAGES,
+    Summarizer,
+    window_buffer_string,
+    window_size,
+)
+from .context_packing import TokenCounter
+
+# rough size of a message object besides its text
+MESSAGE_OVERHEAD_BYTES = 256
+
+
+def _message_nbytes(message: BaseMessage) -> int:
+    return len(str(message.content)) + MESSAGE_OVERHEAD_BYTES
+
+
+@dataclass
+class ChatSession:
+    messages: Deque[BaseMessage]
+    last_used: float
+    # messages ever added, the ring holds the last len(messages) of them
+    total: int = 0
+    summary: str = ""
+    # messages from the start covered by the summary
+    folded: int = 0
+    nbytes: int = field(default=0)
+
+
+class InMemoryChatStore:
+    """
+    Process-local store of chat sessions, for deployments without Redis.
+
+    Each session keeps its newest `max_messages` messages in a ring buffer, older
+    ones are dropped (fold them into the session summary before, see
+    `InMemoryChatMessageHistory.afold_history`). Sessions are kept in least
+    recently used order: beyond `max_bytes` the least recently used ones are
+    evicted, and sessions idle for `ttl` seconds expire.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Memory budget for the messages and summaries of all sessions.
+    max_messages : int
+        Messages kept per session.
+    ttl : float
+        Seconds a session is kept after its last use, 0 disables expiry.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_messages: int = 200,
+        ttl: float = 86400,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.evictions = 0
+        self._clock = clock
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, session_id: str) -> None:
+        self._nbytes -= self._sessions.pop(session_id).nbytes
+
+    def _expire(self, now: float) -> None:
+        # the least recently used sessions come first, stop at the first live one
+        while self.ttl and self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl:
+                break
+            self._drop(session_id)
+
+    def _touch(self, session_id: str, create: bool) -> Optional[ChatSession]:
+        now = self._clock()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = ChatSession(
+                messages=deque(maxlen=self.max_messages), last_used=now
+            )
+            self._sessions[session_id] = session
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _resize(self, session: ChatSession, nbytes: int) -> None:
+        self._nbytes += nbytes - session.nbytes
+        session.nbytes = nbytes
+        while self._nbytes > self.max_bytes and self._sessions:
+            session_id = next(iter(self._sessions))
+            self._drop(session_id)
+            self.evictions += 1
+
+    def read(
+        self, session_id: str, newest: Optional[int] = None
+    ) -> Tuple[str, int, List[BaseMessage], int]:
+        """
+        The summary, the messages it covers, the newest messages (all by default,
+        newest first) and the number of messages ever added to a session.
+        """
+        with self._lock:
+            session = self._touch(session_id, create=False)
+            if session is None:
+                return "", 0, [], 0
+            messages = list(islice(reversed(session.messages), newest))
+            return session.summary, session.folded, messages, session.total
+
+    def read_range(self, session_id: str, start: int, end: int) -> List[BaseMessage]:
+        """
+        The messages added `start` to `end` (exclusive), those still in the ring.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            first = session.total - len(session.messages)
+            begin, stop = max(start - first, 0), max(end - first, 0)
+            return list(session.messages)[begin:stop]
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        with self._lock:
+            session = self._touch(session_id, create=True)
+            session.messages.extend(messages)
+            session.total += len(messages)
+            nbytes = len(session.summary) + sum(
+                _message_nbytes(message) for message in session.messages
+            )
+            self._resize(session, nbytes)
+
+    def set_summary(self, session_id: str, summary: str, folded: int) -> None:
+        """
+        Store a session summary, unless a newer one was stored meanwhile.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or folded <= session.folded:
+                return
+            nbytes = session.nbytes - len(session.summary) + len(summary)
+            session.summary = summary
+            session.folded = folded
+            self._resize(session, nbytes)
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class InMemoryChatMessageHistory:
+    """
+    Chat history of one session in an `InMemoryChatStore`.
+
+    Same interface as `AsyncRedisChatMessageHistory`, without a network hop.
+
+    Attributes
+    ----------
+    session_id : str
+        Identifier of the conversation.
+    store : InMemoryChatStore
+        The store holding the session.
+    """
+
+    def __init__(self, session_id: str, store: InMemoryChatStore) -> None:
+        self.session_id = session_id
+        self.store = store
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        _, _, messages, _ = self.store.read(self.session_id)
+        return messages[::-1]
+
+    async def aget_buffer_string(self) -> str:
+        """
+        The session history formatted like ConversationBufferMemory's "history".
+        """
+        return get_buffer_string(await self.aget_messages())
+
+    async def aget_window_buffer_string(
+        self,
+        max_turns: int,
+        token_budget: int = 0,
+        count_tokens: Optional[TokenCounter] = None,
+    ) -> str:
+        """
+        See `AsyncRedisChatMessageHistory.aget_window_buffer_string`.
+        """
+        summary, _, recent, _ = self.store.read(self.session_id, 2 * max_turns)
+        return window_buffer_string(summary, recent, token_budget, count_tokens)
+
+    async def afold_history(
+        self,
+        summarize: Summarizer,
+        max_turns: int,
+        token_budget: int = 0,
+        count_tokens: Optional[TokenCounter] = None,
+    ) -> bool:
+        """
+        See `AsyncRedisChatMessageHistory.afold_history`. Messages the ring buffer
+        dropped before they were folded are left out of the summary.
+        """
+        summary, folded, recent, total = self.store.read(self.session_id, 2 * max_turns)
+        end = total - window_size(recent, token_budget, count_tokens)
+        if end <= folded:
+            return False
+        while folded < end:
+            batch_end = min(folded + FOLD_BATCH_MESSAGES, end)
+            messages = self.store.read_range(self.session_id, folded, batch_end)
+            if messages:
+                summary = await summarize(summary, get_buffer_string(messages))
+            folded = batch_end
+            self.store.set_summary(self.session_id, summary, folded)
+        return True
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.append(self.session_id, messages)
+
+    async def aclear(self) -> None:
+        self.store.clear(self.session_id)
+
+    async def aclose(self) -> None:
+        pass
+
+
+chat_store = InMemoryChatStore(
+    max_bytes=settings.get("memory_max_bytes", 64 * 1024 * 1024),
+    max_messages=settings.get("memory_session_max_messages", 200),
+    ttl=settings.get("memory_ttl", 86400),
+)
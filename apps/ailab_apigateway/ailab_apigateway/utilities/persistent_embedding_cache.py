@@ -0,0 +1,284 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ..config import settings
+from .directory_utils import initialize_dir_for_file
+from .embedding_cache import embedding_model_name
+from .executor import run_blocking
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+# lookups are chunked to stay under SQLite's limit on bound parameters
+LOOKUP_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+class PersistentEmbeddingCache:
+    """
+    SQLite-backed embedding cache shared by indexer runs and API workers.
+
+    Vectors are stored as float32 blobs keyed by (embedding model, SHA-256 of the
+    text). The database runs in WAL mode so several processes can read while one
+    writes. Once more than `max_entries` rows are stored, the least recently used
+    are pruned.
+
+    Lookups only read. The use times of the vectors found are kept in memory and
+    written in one batch with the next insert, prune or close, or by a lookup once
+    `touch_interval` seconds have passed since the last batch.
+
+    Attributes
+    ----------
+    path : str
+        Location of the SQLite database.
+    max_entries : int
+        Upper bound on stored vectors, 0 for no bound.
+    touch_interval : float
+        Longest delay, in seconds, before use times found by lookups are written.
+    """
+
+    def __init__(
+        self, path: str, max_entries: int = 1_000_000, touch_interval: float = 60
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._writes_since_prune = 0
+        # last use of the vectors found since the use times were last written
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._touched_since = time.monotonic()
+        self._lock = threading.Lock()
+        initialize_dir_for_file(path)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look texts up, returning None for each miss.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_CHUNK):
+                end = start + LOOKUP_CHUNK
+                chunk = hashes[start:end]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                )
+                found.update(rows)
+            now = time.time()
+            for found_hash in found:
+                self._touched[(model, found_hash)] = now
+            if time.monotonic() - self._touched_since >= self.touch_interval:
+                self._write_touches()
+                self._conn.commit()
+        return [
+            np.frombuffer(found[h], dtype=np.float32).tolist() if h in found else None
+            for h in hashes
+        ]
+
+    def put_many(
+        self, model: str, texts: Sequence[str], vectors: Sequence[List[float]]
+    ) -> None:
+        now = time.time()
+        rows = [
+            (
+                model,
+                text_hash(text),
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._write_touches()
+            self._conn.commit()
+            self._writes_since_prune += len(rows)
+            # counting rows is a scan, check the bound every so often only
+            check_size = self.max_entries and self._writes_since_prune >= max(
+                1000, self.max_entries // 100
+            )
+        if check_size:
+            self.prune(self.max_entries)
+
+    def prune(
+        self, max_entries: Optional[int] = None, older_than: Optional[float] = None
+    ) -> int:
+        """
+        Delete least recently used vectors beyond `max_entries`, and vectors unused
+        for `older_than` seconds.
+
+        Returns
+        -------
+        int
+            Number of deleted vectors.
+        """
+        deleted = 0
+        with self._lock:
+            self._writes_since_prune = 0
+            # vectors used since the last write are not the least recently used
+            self._write_touches()
+            if older_than is not None:
+                deleted += self._conn.execute(
+                    "DELETE FROM embeddings WHERE last_used < ?",
+                    (time.time() - older_than,),
+                ).rowcount
+            if max_entries:
+                (count,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM embeddings"
+                ).fetchone()
+                if count > max_entries:
+                    deleted += self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN ("
+                        "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (count - max_entries,),
+                    ).rowcount
+            self._conn.commit()
+        if deleted:
+            logging.info(f"Pruned {deleted} vectors from the embedding cache")
+        return deleted
+
+    def compact(self) -> None:
+        """
+        Reclaim the space left by pruned vectors.
+        """
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model, COUNT(*), SUM(LENGTH(vector)) FROM embeddings GROUP BY model"
+            ).fetchall()
+        return {
+            model: {"vectors": count, "bytes": nbytes} for model, count, nbytes in rows
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._write_touches()
+            self._conn.commit()
+            self._conn.close()
+
+    def _write_touches(self) -> None:
+        # with the lock held, committed by the caller
+        self._touched_since = time.monotonic()
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = MAX(last_used, ?) "
+            "WHERE model = ? AND text_hash = ?",
+            [(used, model, hashed) for (model, hashed), used in touched.items()],
+        )
+
+
+class PersistentCachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends texts missing from the persistent cache
+    to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: PersistentEmbeddingCache) -> None:
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = embedding_model_name(embeddings)
+
+    @property
+    def model(self) -> Optional[str]:
+        # lets the query cache namespace its keys by the wrapped model
+        return getattr(self.embeddings, "model", None)
+
+    def _fill_misses(
+        self,
+        texts: List[str],
+        vectors: List[Optional[List[float]]],
+        computed: List[List[float]],
+    ) -> List[List[float]]:
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.cache.put_many(self.model_name, [texts[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [texts[i] for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+        return self._fill_misses(
+            texts, vectors, self.embeddings.embed_documents(missing)
+        )
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = await run_blocking(self.cache.get_many, self.model_name, texts)
+        missing = [texts[i] for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+        computed = await self.embeddings.aembed_documents(missing)
+        return await run_blocking(self._fill_misses, texts, vectors, computed)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+_persistent_cache: Optional[PersistentEmbeddingCache] = None
+_persistent_cache_lock = threading.Lock()
+
+
+def get_persistent_cache() -> PersistentEmbeddingCache:
+    """
+    The process-wide persistent embedding cache, opened on first use.
+    """
+    global _persistent_cache
+    with _persistent_cache_lock:
+        if _persistent_cache is None:
+            _persistent_cache = PersistentEmbeddingCache(
+                settings.get(
+                    "embedding_cache_path", "databases/embedding_cache.sqlite3"
+                ),
+                max_entries=settings.get("embedding_cache_max_entries", 1_000_000),
+                touch_interval=settings.get("embedding_cache_touch_interval", 60),
+            )
+        return _persistent_cache
+
+
+def with_persistent_cache(embeddings: Embeddings) -> Embeddings:
+    """
+    Wrap an Embeddings instance with the persistent cache, if it is enabled.
+    """
+    if not settings.get("embedding_cache_enabled", True):
+        return embeddings
+    return PersistentCachedEmbeddings(embeddings, get_persistent_cache())
@@ -1,5 +1,5 @@
 from operator import itemgetter
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
 from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
@@ -10,22 +10,74 @@ from langchain.schema.retriever import BaseRetriever
 from langchain.schema.runnable import RunnableLambda
 from langchain.schema.vectorstore import VectorStore
 
+from ..config import settings
+from .context_packing import format_context
+from .executor import run_blocking
+from .retriever_utils.batch_search import batch_similarity_search_with_score
+from .retriever_utils.hybrid_search import hybrid_documents
+from .retriever_utils.mmr import mmr_search
+
+
+def _scored_documents(docs_and_scores: List[Tuple[Document, float]]) -> List[Document]:
+    # copies, the vector store may hand the same Document to concurrent queries
+    return [
+        Document(
+            page_content=doc.page_content,
+            metadata={**doc.metadata, **{"score": score}},
+        )
+        for doc, score in docs_and_scores
+    ]
+
+
+def _search(
+    vectorstore: VectorStore,
+    query: str,
+    embedding: List[float],
+    search_kwargs: dict,
+    threshold: Optional[float],
+) -> List[Document]:
+    # the threshold is applied by the search, documents over it are never fetched
+    if settings.get("mmr_enabled", False):
+        # over-fetched and re-ranked for diversity
+        docs_and_scores = mmr_search(
+            vectorstore, [embedding], threshold=threshold, **search_kwargs
+        )[0]
+    else:
+        docs_and_scores = batch_similarity_search_with_score(
+            vectorstore, [embedding], threshold=threshold, **search_kwargs
+        )[0]
+    documents = _scored_documents(docs_and_scores)
+    # fused with the BM25 search when the vector store has a lexical index
+    return hybrid_documents(
+        vectorstore, [query], [embedding], [documents], search_kwargs.get("k", 4)
+    )[0]
+
 
 class FAISSVectorStoreRetrieverWithScore(BaseRetriever):
     """
     A class used to retrieve documents from a FAISS vector store with their similarity scores.
 
+    When the vector store carries a BM25 `lexical_index`, the vector results are
+    fused with a lexical search of the query (see `hybrid_search.hybrid_documents`).
+    With `MMR_ENABLED`, the vector results are re-ranked for diversity first (see
+    `mmr.mmr_search`).
+
     Attributes
     ----------
     vectorstore : VectorStore
         An instance of VectorStore class which represents the vector store to be used for document retrieval.
     search_kwargs : dict
-        A dictionary of search parameters to be used in the similarity search.
+        A dictionary of search parameters to be used in the similarity search: `k`,
+        and optionally per-query index settings such as the pgvector `ef_search` and
+        `probes`.
 
     Methods
     -------
     get_relevant_documents(query: str, threshold: Optional[float] = None) -> List[Document]
         Retrieves relevant documents from the vector store based on the given query and threshold.
+    aget_relevant_documents(query: str, threshold: Optional[float] = None) -> List[Document]
+        Async version, embeds the query asynchronously and runs the vector search in the
+        bounded executor.
     """
 
     vectorstore: VectorStore
@@ -50,15 +102,24 @@ class FAISSVectorStoreRetrieverWithScore(BaseRetriever):
         list
             A list of Document objects that are relevant to the given query.
         """
-        docs_and_scores = self.vectorstore.similarity_search_with_score(
-            query, k=self.search_kwargs["k"]
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        return _search(
+            self.vectorstore, query, embedding, self.search_kwargs, threshold
+        )
+
+    async def _aget_relevant_documents(
+        self, query: str, threshold: Optional[float] = None
+    ) -> List[Document]:
+        """
+        Async version of `_get_relevant_documents`.
+
+        Neither FAISS nor PGVector has a native async search, so only the embedding
+        call is awaited directly and the search itself goes to the bounded executor.
+        """
+        embedding = await self.vectorstore.embeddings.aembed_query(query)
+        return await run_blocking(
+            _search, self.vectorstore, query, embedding, self.search_kwargs, threshold
         )
-        return_list = []
-        for doc, score in docs_and_scores:
-            doc.metadata = {**doc.metadata, **{"score": score}}
-            if threshold is None or score < threshold:
-                return_list.append(doc)
-        return return_list
 
 
 def get_scores(docs: List[Document]) -> List[float]:
@@ -122,6 +183,110 @@ def document_retrieval(
     return retrieved_documents
 
 
+async def adocument_retrieval(
+    vectorstore: VectorStore,
+    question: str,
+    top_k: int = 4,
+    similarity_threshold: Optional[float] = None,
+) -> List[Document]:
+    """
+    Async version of `document_retrieval`, see there for the parameters.
+    """
+    retriever = FAISSVectorStoreRetrieverWithScore(
+        vectorstore=vectorstore, search_kwargs={"k": top_k}
+    )
+    retrieved_documents = await retriever.aget_relevant_documents(
+        question, threshold=similarity_threshold
+    )
+    return retrieved_documents
+
+
+async def adocument_retrieval_by_vectors(
+    vectorstore: VectorStore,
+    embeddings: List[List[float]],
+    top_k: int = 4,
+    similarity_threshold: Optional[float] = None,
+    questions: Optional[List[str]] = None,
+) -> List[List[Document]]:
+    """
+    Retrieve relevant documents for many already embedded questions at once.
+
+    The searches are batched into one FAISS matrix search or one postgres round-trip,
+    run in the bounded executor.
+
+    Parameters
+    ----------
+    vectorstore : VectorStore
+        An instance of VectorStore containing document vectors.
+
+    embeddings : List[List[float]]
+        The question embeddings.
+
+    top_k : int, optional
+        The number of top documents to retrieve per question (default is 4).
+
+    similarity_threshold : float or None, optional
+        Only documents scoring below this threshold are returned (default is None).
+
+    questions : List[str], optional
+        The questions, to fuse the results with a lexical search when the vector
+        store has a BM25 index.
+
+    Returns
+    -------
+    List[List[Document]]
+        The documents retrieved for each question, in input order.
+    """
+    return await run_blocking(
+        _batch_search,
+        vectorstore,
+        embeddings,
+        top_k,
+        similarity_threshold,
+        questions,
+    )
+
+
+def _batch_search(
+    vectorstore: VectorStore,
+    embeddings: List[List[float]],
+    top_k: int,
+    threshold: Optional[float],
+    questions: Optional[List[str]],
+) -> List[List[Document]]:
+    if settings.get("mmr_enabled", False):
+        searches = mmr_search(vectorstore, embeddings, top_k, threshold=threshold)
+    else:
+        searches = batch_similarity_search_with_score(
+            vectorstore, embeddings, top_k, threshold=threshold
+        )
+    results = [_scored_documents(docs_and_scores) for docs_and_scores in searches]
+    if questions is None:
+        return results
+    return hybrid_documents(vectorstore, questions, embeddings, results, top_k)
+
+
+def format_docs(docs: List[Document]) -> str:
+    """
+    Formats a list of Document objects into a string.
+
+    Overlapping chunks of a source are merged, repeated text is dropped and the
+    result is cut to the `CONTEXT_TOKEN_BUDGET`, best documents first (see
+    `context_packing.pack_context`).
+
+    Parameters
+    ----------
+    docs : List[Document]
+        A list of Document objects, best first.
+
+    Returns
+    -------
+    str
+        A string that contains the packed passages, separated by two newline characters.
+    """
+    return format_context(docs)
+
+
 def chatbot_answer_with_history(
     question: str,
     documents: List[Document],
@@ -163,22 +328,6 @@ def chatbot_answer_with_history(
     and the formatted documents as inputs. The answer from the chain is returned as the chatbot's response.
     """
 
-    def format_docs(docs: List[Document]) -> str:
-        """
-        Formats a list of Document objects into a string.
-
-        Parameters
-        ----------
-        docs : List[Document]
-            A list of Document objects.
-
-        Returns
-        -------
-        str
-            A string that contains the page content of each Document object, separated by two newline characters.
-        """
-        return "\n\n".join(doc.page_content for doc in docs)
-
     chain = (
         {
             "context": itemgetter("documents") | RunnableLambda(format_docs),
@@ -194,5 +343,82 @@ def chatbot_answer_with_history(
     return answer
 
 
+async def achatbot_answer_with_history(
+    question: str,
+    documents: List[Document],
+    history: str,
+    prompt: ChatPromptTemplate,
+    model: ChatOpenAI,
+) -> str:
+    """
+    Async version of `chatbot_answer_with_history`.
+
+    The chat history is passed in already formatted, as read from an async history
+    store, instead of being loaded from a synchronous memory inside the chain.
+
+    Parameters
+    ----------
+    question : str
+        The question to which the chatbot should respond.
+
+    documents : List[Document]
+        A list of Document objects that the chatbot can use to generate its response.
+
+    history : str
+        The chat history, formatted as ConversationBufferMemory does.
+
+    prompt : ChatPromptTemplate
+        An instance of ChatPromptTemplate that defines the structure of the chat prompt.
+
+    model : ChatOpenAI
+        An instance of ChatOpenAI that is used to generate the chatbot's response.
+
+    Returns
+    -------
+    str
+        The chatbot's response to the given question.
+    """
+    chain = _answer_chain_with_history_input(prompt, model)
+    answer = await chain.ainvoke(
+        {"documents": documents, "question": question, "history": history}
+    )
+    return answer
+
+
+async def astream_chatbot_answer_with_history(
+    question: str,
+    documents: List[Document],
+    history: str,
+    prompt: ChatPromptTemplate,
+    model: ChatOpenAI,
+) -> AsyncIterator[str]:
+    """
+    Streaming version of `achatbot_answer_with_history`, see there for the parameters.
+
+    Yields
+    ------
+    str
+        Chunks of the chatbot's response, as the model produces them.
+    """
+    chain = _answer_chain_with_history_input(prompt, model)
+    async for chunk in chain.astream(
+        {"documents": documents, "question": question, "history": history}
+    ):
+        yield chunk
+
+
+def _answer_chain_with_history_input(prompt: ChatPromptTemplate, model: ChatOpenAI):
+    return (
+        {
+            "context": itemgetter("documents") | RunnableLambda(format_docs),
+            "question": itemgetter("question"),
+            "history": itemgetter("history"),
+        }
+        | prompt
+        | model
+        | StrOutputParser()
+    )
+
+
 if __name__ == "__main__":
     print("Module to use custom Langchain retriever functions")
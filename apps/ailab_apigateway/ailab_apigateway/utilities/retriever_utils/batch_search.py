@@ -0,0 +1,304 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy
+from langchain.schema.document import Document
+from langchain.schema.vectorstore import VectorStore
+from langchain.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain.vectorstores.pgvector import DistanceStrategy, PGVector
+from sqlalchemy.orm import Session
+
+PGVECTOR_OPERATORS = {
+    DistanceStrategy.EUCLIDEAN: "<->",
+    DistanceStrategy.COSINE: "<=>",
+    DistanceStrategy.MAX_INNER_PRODUCT: "<#>",
+}
+# operator class of an ANN index serving the operator of the same strategy
+PGVECTOR_OPCLASSES = {
+    DistanceStrategy.EUCLIDEAN: "vector_l2_ops",
+    DistanceStrategy.COSINE: "vector_cosine_ops",
+    DistanceStrategy.MAX_INNER_PRODUCT: "vector_ip_ops",
+}
+# ANN index methods the indexer builds (`PGVECTOR_INDEX_METHOD`) and queries tune
+ANN_METHODS = ("hnsw", "ivfflat")
+
+DocsAndScores = List[Tuple[Document, float]]
+# the documents and scores of one query, with the stored vector of each document
+DocsAndVectors = Tuple[DocsAndScores, np.ndarray]
+
+
+def faiss_nearest(
+    index: Any, vectors: np.ndarray, k: int, threshold: Optional[float] = None
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Distances and positions of the k nearest vectors of each query, nearest first.
+
+    With a threshold, the index is range searched for the vectors closer than it,
+    so far vectors are never ranked; indexes without range search are searched for
+    the k nearest, and those not under the threshold dropped.
+    """
+    if threshold is not None:
+        try:
+            limits, distances, positions = index.range_search(vectors, threshold)
+        except RuntimeError:
+            pass
+        else:
+            hits = []
+            for start, end in zip(limits[:-1], limits[1:]):
+                row_distances, row_positions = (
+                    distances[start:end],
+                    positions[start:end],
+                )
+                if len(row_distances) > k:
+                    top = np.argpartition(row_distances, k - 1)[:k]
+                    row_distances, row_positions = (
+                        row_distances[top],
+                        row_positions[top],
+                    )
+                order = np.argsort(row_distances, kind="stable")
+                hits.append((row_distances[order], row_positions[order]))
+            return hits
+    distances, positions = index.search(vectors, k)
+    hits = []
+    for row_distances, row_positions in zip(distances, positions):
+        # -1 pads the results when the index holds fewer than k vectors
+        found = row_positions != -1
+        if threshold is not None:
+            found &= row_distances < threshold
+        hits.append((row_distances[found], row_positions[found]))
+    return hits
+
+
+def faiss_batch_search(
+    vectorstore: FAISS,
+    embeddings: List[List[float]],
+    k: int,
+    threshold: Optional[float] = None,
+    with_vectors: bool = False,
+) -> List[DocsAndScores] | List[DocsAndVectors]:
+    """
+    Search all query vectors against a FAISS index in one matrix search.
+
+    Only documents scoring below `threshold` are looked up and returned. With
+    `with_vectors`, the stored vectors of the results are reconstructed from the
+    index (see `faiss_index.enable_reconstruct`) and returned with them.
+    """
+    vectors = np.array(embeddings, dtype=np.float32)
+    if vectorstore._normalize_L2:
+        dependable_faiss_import().normalize_L2(vectors)
+    results = []
+    for distances, positions in faiss_nearest(vectorstore.index, vectors, k, threshold):
+        docs_and_scores = [
+            (
+                vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]),
+                float(score),
+            )
+            for score, i in zip(distances, positions)
+        ]
+        if not with_vectors:
+            results.append(docs_and_scores)
+            continue
+        stored = np.array(
+            [vectorstore.index.reconstruct(int(i)) for i in positions],
+            dtype=np.float32,
+        ).reshape(len(docs_and_scores), vectorstore.index.d)
+        results.append((docs_and_scores, stored))
+    return results
+
+
+def pgvector_batch_search(
+    vectorstore: PGVector,
+    embeddings: List[List[float]],
+    k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    ann_index: bool = False,
+    threshold: Optional[float] = None,
+    with_vectors: bool = False,
+) -> List[DocsAndScores] | List[DocsAndVectors]:
+    """
+    Search all query vectors against a pgvector collection in a single round-trip.
+
+    Each query vector is joined laterally to its own top-k scan of the collection,
+    so the result equals k separate similarity searches. A `threshold` is part of
+    the scan, only rows closer than it are returned. With `with_vectors`, the
+    stored vectors of the results are returned with them.
+
+    With `ann_index`, distances are computed on the embedding cast to the query
+    dimension, the expression the collection's ANN index is built on (see
+    `indexer_utils.pgvector_index`), and `ef_search` (hnsw) or `probes` (ivfflat) set
+    how much of the index each query explores, for this transaction only.
+    """
+    operator = PGVECTOR_OPERATORS[vectorstore._distance_strategy]
+    column = "e.embedding"
+    if ann_index:
+        column = f"CAST(e.embedding AS vector({len(embeddings[0])}))"
+    vector_column = "CAST(hits.embedding AS text)" if with_vectors else "NULL"
+    distance_filter = ""
+    if threshold is not None:
+        distance_filter = f"AND {column} {operator} queries.embedding < :threshold"
+    values = ", ".join(
+        f"({position}, CAST(:query_{position} AS vector))"
+        for position in range(len(embeddings))
+    )
+    statement = sqlalchemy.text(
+        f"""
+        WITH queries (position, embedding) AS (VALUES {values})
+        SELECT queries.position, hits.document, hits.cmetadata, hits.distance,
+            {vector_column}
+        FROM queries
+        CROSS JOIN LATERAL (
+            SELECT e.document, e.cmetadata, e.embedding,
+                {column} {operator} queries.embedding AS distance
+            FROM langchain_pg_embedding e
+            WHERE e.collection_id = :collection_id {distance_filter}
+            ORDER BY distance
+            LIMIT :k
+        ) AS hits
+        ORDER BY queries.position, hits.distance
+        """
+    )
+    params = {"k": k, "threshold": threshold}
+    for position, embedding in enumerate(embeddings):
+        params[f"query_{position}"] = "[" + ",".join(map(str, embedding)) + "]"
+    results: List[DocsAndScores] = [[] for _ in embeddings]
+    stored: List[List[List[float]]] = [[] for _ in embeddings]
+    with Session(vectorstore._conn) as session:
+        collection = vectorstore.get_collection(session)
+        if collection is None:
+            return _with_vectors(results, stored, with_vectors)
+        # a literal collection id lets the planner match the partial ANN index
+        params["collection_id"] = str(collection.uuid)
+        for setting, value in (
+            ("hnsw.ef_search", ef_search),
+            ("ivfflat.probes", probes),
+        ):
+            if value:
+                session.execute(
+                    sqlalchemy.text("SELECT set_config(:setting, :value, true)"),
+                    {"setting": setting, "value": str(value)},
+                )
+        for position, document, cmetadata, distance, vector in session.execute(
+            statement, params
+        ):
+            doc = Document(page_content=document, metadata=cmetadata or {})
+            results[position].append((doc, float(distance)))
+            if with_vectors:
+                # pgvector's text form of a vector is a JSON array
+                stored[position].append(json.loads(vector))
+    return _with_vectors(results, stored, with_vectors)
+
+
+def _with_vectors(
+    results: List[DocsAndScores], stored: List[List[List[float]]], with_vectors: bool
+) -> List[DocsAndScores] | List[DocsAndVectors]:
+    if not with_vectors:
+        return results
+    return [
+        (docs_and_scores, np.array(vectors, dtype=np.float32))
+        for docs_and_scores, vectors in zip(results, stored)
+    ]
+
+
+def batch_similarity_search_with_score(
+    vectorstore: VectorStore,
+    embeddings: List[List[float]],
+    k: int,
+    threshold: Optional[float] = None,
+    **options: Any,
+) -> List[DocsAndScores]:
+    """
+    Similarity search for many query vectors at once.
+
+    Parameters
+    ----------
+    vectorstore : VectorStore
+        The vector store to search.
+    embeddings : List[List[float]]
+        One query vector per question.
+    k : int
+        Number of documents to return per question.
+    threshold : float, optional
+        Only documents scoring below it are returned. FAISS and pgvector apply it in
+        the search itself, so documents over it are never fetched.
+    **options
+        Per-query pgvector search settings (`ef_search`, `probes`), overriding the
+        store's `search_options`.
+
+    Returns
+    -------
+    List[List[Tuple[Document, float]]]
+        The documents and scores for each query vector, in input order.
+    """
+    if not embeddings:
+        return []
+    if isinstance(vectorstore, FAISS):
+        return faiss_batch_search(vectorstore, embeddings, k, threshold=threshold)
+    if isinstance(vectorstore, PGVector):
+        search_options = {**getattr(vectorstore, "search_options", {}), **options}
+        return pgvector_batch_search(
+            vectorstore, embeddings, k, threshold=threshold, **search_options
+        )
+    return [
+        [
+            (doc, score)
+            for doc, score in vectorstore.similarity_search_with_score_by_vector(
+                embedding, k=k
+            )
+            if threshold is None or score < threshold
+        ]
+        for embedding in embeddings
+    ]
+
+
+def batch_similarity_search_with_vectors(
+    vectorstore: VectorStore,
+    embeddings: List[List[float]],
+    k: int,
+    threshold: Optional[float] = None,
+    **options: Any,
+) -> List[DocsAndVectors]:
+    """
+    Similarity search for many query vectors at once, returning the stored vector
+    of every document found.
+
+    Parameters
+    ----------
+    vectorstore : VectorStore
+        The vector store to search, FAISS or pgvector.
+    embeddings : List[List[float]]
+        One query vector per question.
+    k : int
+        Number of documents to return per question.
+    threshold : float, optional
+        Only documents scoring below it are returned.
+    **options
+        Per-query pgvector search settings (`ef_search`, `probes`), overriding the
+        store's `search_options`.
+
+    Returns
+    -------
+    List[Tuple[List[Tuple[Document, float]], np.ndarray]]
+        The documents and scores for each query vector, in input order, with a
+        matrix holding the vector of each document.
+    """
+    if not embeddings:
+        return []
+    if isinstance(vectorstore, FAISS):
+        return faiss_batch_search(
+            vectorstore, embeddings, k, threshold=threshold, with_vectors=True
+        )
+    if isinstance(vectorstore, PGVector):
+        search_options = {**getattr(vectorstore, "search_options", {}), **options}
+        return pgvector_batch_search(
+            vectorstore,
+            embeddings,
+            k,
+            threshold=threshold,
+            with_vectors=True,
+            **search_options,
+        )
+    raise TypeError(
+        f"Cannot fetch the vectors of a {type(vectorstore).__name__} search"
+    )
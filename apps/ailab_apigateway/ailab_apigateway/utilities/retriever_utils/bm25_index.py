@@ -0,0 +1,241 @@
+import hashlib
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BM25_INDEX_FILE = "bm25.npz"
+TOKEN_PATTERN = re.compile(r"\w+")
+# words too common to tell chunks apart, they would only add long posting lists
+STOPWORDS = frozenset(
+    """
+    a an and are as at be but by did do does for from had has have he her his i if in
+    into is it its me my no not of on or our she so than that the their them then there
+    these they this to was we were what when where which who why will with you your
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens of a text, without stopwords.
+
+    Numbers are kept as tokens, so dates and figures can be matched exactly.
+    """
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS
+    ]
+
+
+def term_hash(term: str) -> int:
+    # a 64 bit hash stands in for the term: the index stores no strings, and a
+    # collision between two terms of one corpus is vanishingly unlikely
+    return int.from_bytes(
+        hashlib.blake2b(term.encode("utf8"), digest_size=8).digest(), "little"
+    )
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over the chunks of the vector store.
+
+    Posting lists are stored in CSR form, sorted by term hash: the postings of the
+    term at position t are `postings[offsets[t]:offsets[t + 1]]`, each with its
+    precomputed BM25 weight, so a query only gathers and sums the weights of its
+    terms.
+
+    Attributes
+    ----------
+    doc_ids : np.ndarray
+        Vector store id of every chunk, addressed by the postings.
+    term_hashes : np.ndarray
+        Sorted hashes of the terms (uint64).
+    offsets : np.ndarray
+        Start of each term's postings, with a final end offset (int64).
+    postings : np.ndarray
+        Chunk positions (int32).
+    weights : np.ndarray
+        BM25 weight of the term in the chunk (float32).
+    """
+
+    def __init__(
+        self,
+        doc_ids: np.ndarray,
+        term_hashes: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+    ) -> None:
+        self.doc_ids = doc_ids
+        self.term_hashes = term_hashes
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(
+        cls, chunks: Iterable[Tuple[str, str]], k1: float = 1.2, b: float = 0.75
+    ) -> "BM25Index":
+        """
+        Index chunks given as (id, text) pairs.
+
+        Parameters
+        ----------
+        chunks : Iterable[Tuple[str, str]]
+            The id and text of every chunk.
+        k1 : float
+            Term frequency saturation.
+        b : float
+            Strength of the document length normalization.
+
+        Returns
+        -------
+        BM25Index
+            The index.
+        """
+        doc_ids: List[str] = []
+        lengths = array("I")
+        term_ids: Dict[str, int] = {}
+        posting_terms, posting_docs, posting_tfs = array("I"), array("I"), array("I")
+        for doc_id, text in chunks:
+            position = len(doc_ids)
+            doc_ids.append(doc_id)
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_docs.append(position)
+                posting_tfs.append(tf)
+        terms = np.frombuffer(posting_terms, dtype=np.uint32)
+        docs = np.frombuffer(posting_docs, dtype=np.uint32)
+        tfs = np.frombuffer(posting_tfs, dtype=np.uint32).astype(np.float32)
+        doc_lengths = np.frombuffer(lengths, dtype=np.uint32).astype(np.float32)
+        hashes = np.array([term_hash(term) for term in term_ids], dtype=np.uint64)
+        # postings grouped by term, terms ordered by hash, chunks ascending
+        order = np.lexsort((docs, hashes[terms]))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        document_frequency = np.bincount(terms, minlength=len(term_ids))
+        n = len(doc_ids)
+        idf = np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = float(doc_lengths.mean()) if n else 0.0
+        norm = k1 * (1 - b + b * doc_lengths[docs] / max(average_length, 1.0))
+        weights = idf[terms] * tfs * (k1 + 1) / (tfs + norm)
+        sorted_terms = np.argsort(hashes, kind="stable")
+        offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        np.cumsum(document_frequency[sorted_terms], out=offsets[1:])
+        return cls(
+            doc_ids=np.array(doc_ids, dtype=np.bytes_),
+            term_hashes=hashes[sorted_terms],
+            offsets=offsets,
+            postings=docs.astype(np.int32),
+            weights=weights.astype(np.float32),
+        )
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        The k chunks scoring highest for the query.
+
+        Parameters
+        ----------
+        query : str
+            The question.
+        k : int
+            Number of chunks to return.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            The ids and BM25 scores of the chunks sharing a term with the query,
+            best first.
+        """
+        hashes = np.array(
+            sorted({term_hash(term) for term in tokenize(query)}), dtype=np.uint64
+        )
+        if not len(hashes) or not len(self.term_hashes) or k <= 0:
+            return []
+        positions = np.minimum(
+            np.searchsorted(self.term_hashes, hashes), len(self.term_hashes) - 1
+        )
+        positions = positions[self.term_hashes[positions] == hashes]
+        if not len(positions):
+            return []
+        slices = [
+            slice(self.offsets[position], self.offsets[position + 1])
+            for position in positions
+        ]
+        docs = np.concatenate([self.postings[part] for part in slices])
+        weights = np.concatenate([self.weights[part] for part in slices])
+        matched, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            (self.doc_ids[matched[i]].decode("ascii"), float(scores[i])) for i in top
+        ]
+
+    def save(self, path: str) -> None:
+        """
+        Write the index to `path`, atomically replacing a previous one.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez(
+                file,
+                doc_ids=self.doc_ids,
+                term_hashes=self.term_hashes,
+                offsets=self.offsets,
+                postings=self.postings,
+                weights=self.weights,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+
+def load_bm25_index(path: str) -> Optional[BM25Index]:
+    """
+    Load the BM25 index at `path`, None when it has not been built.
+    """
+    if not os.path.exists(path):
+        return None
+    return BM25Index.load(path)
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """
+    Fuse rankings of ids with reciprocal rank fusion.
+
+    Every ranking adds 1 / (k + rank) to the score of each id it holds, rank
+    starting at 1, so ids ranked well by several searches come first.
+
+    Parameters
+    ----------
+    rankings : Sequence[Sequence[str]]
+        Ids ordered best first, one sequence per search.
+    k : int
+        Damping of the top ranks.
+
+    Returns
+    -------
+    List[Tuple[str, float]]
+        Every id with its fused score, best first; ties keep first-seen order.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
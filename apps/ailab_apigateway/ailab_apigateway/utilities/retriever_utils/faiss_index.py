@@ -0,0 +1,70 @@
+import logging
+from typing import Any, Optional
+
+from langchain.vectorstores.faiss import dependable_faiss_import
+
+
+def make_faiss_index(spec: str, dimension: int) -> Any:
+    """
+    Build an empty FAISS index from a factory string.
+
+    Parameters
+    ----------
+    spec : str
+        A `faiss.index_factory` description, e.g. "Flat" (exact search),
+        "IVF4096,PQ64" or "HNSW32". Distances are Euclidean, as with the default
+        LangChain index, so score thresholds keep their meaning.
+    dimension : int
+        Size of the vectors.
+
+    Returns
+    -------
+    faiss.Index
+        The index; IVF and PQ indexes must be trained before vectors are added.
+    """
+    faiss = dependable_faiss_import()
+    return faiss.index_factory(dimension, spec, faiss.METRIC_L2)
+
+
+def tune_faiss_index(
+    index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+) -> None:
+    """
+    Set the search-time parameters of an approximate index.
+
+    Parameters that do not apply to the index (nprobe on HNSW, efSearch on IVF,
+    either on a flat index) are ignored.
+
+    Parameters
+    ----------
+    index : faiss.Index
+        The index to tune.
+    nprobe : int, optional
+        Inverted lists visited per query by IVF indexes.
+    ef_search : int, optional
+        Size of the candidate list explored per query by HNSW indexes.
+    """
+    parameter_space = dependable_faiss_import().ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            parameter_space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            continue
+        logging.info(f"FAISS search parameter {name}={value}")
+
+
+def enable_reconstruct(index: Any) -> None:
+    """
+    Let an index return its stored vectors by position.
+
+    IVF indexes need a map from positions to inverted list entries to reconstruct
+    vectors, which takes 8 bytes per vector; other indexes reconstruct as they are.
+    """
+    faiss = dependable_faiss_import()
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    ivf.make_direct_map()
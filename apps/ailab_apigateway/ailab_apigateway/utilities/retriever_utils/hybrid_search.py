@@ -0,0 +1,233 @@
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy
+from langchain.schema.document import Document
+from langchain.schema.vectorstore import VectorStore
+from langchain.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain.vectorstores.pgvector import PGVector
+from sqlalchemy.orm import Session
+
+from ...config import settings
+from ..indexer_utils.chunk_hashes import CHUNK_HASH_KEY
+from .batch_search import PGVECTOR_OPERATORS
+from .bm25_index import BM25_INDEX_FILE, BM25Index, reciprocal_rank_fusion
+from .mmap_docstore import MmapDocstore
+
+# documents and distances of the requested ids, per query
+DocsById = Dict[str, Tuple[Document, float]]
+
+
+def bm25_index_path() -> str:
+    """
+    Where the BM25 index of the configured vector store is kept.
+
+    A FAISS index keeps it in its folder, a pgvector collection at `BM25_INDEX_PATH`.
+    """
+    if settings.database_type == "FAISS":
+        return os.path.join(settings.database_path, BM25_INDEX_FILE)
+    return settings.get("bm25_index_path", "databases/bm25.npz")
+
+
+def indexed_chunks(vectorstore: VectorStore) -> Iterator[Tuple[str, str]]:
+    """
+    The id and text of every chunk in a vector store.
+    """
+    if isinstance(vectorstore, FAISS):
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            yield doc_id, vectorstore.docstore.search(doc_id).page_content
+    elif isinstance(vectorstore, PGVector):
+        embedding_store = vectorstore.EmbeddingStore
+        with Session(vectorstore._conn) as session:
+            collection = vectorstore.get_collection(session)
+            rows = (
+                session.query(embedding_store.custom_id, embedding_store.document)
+                .filter(embedding_store.collection_id == collection.uuid)
+                .yield_per(10_000)
+            )
+            yield from rows
+    else:
+        raise TypeError(f"Cannot list the chunks of a {type(vectorstore).__name__}")
+
+
+def faiss_documents_by_ids(
+    vectorstore: FAISS, requests: List[Tuple[List[str], List[float]]]
+) -> List[DocsById]:
+    """
+    Fetch documents by id with their distance to a query vector, from the stored
+    vectors (see `faiss_index.enable_reconstruct`).
+    """
+    docstore = vectorstore.docstore
+    if isinstance(docstore, MmapDocstore):
+        row_of = docstore.row_of
+    else:
+        rows = {doc_id: row for row, doc_id in vectorstore.index_to_docstore_id.items()}
+        row_of = rows.get
+    results = []
+    for ids, embedding in requests:
+        query = np.array([embedding], dtype=np.float32)
+        if vectorstore._normalize_L2:
+            dependable_faiss_import().normalize_L2(query)
+        found = {}
+        for doc_id in ids:
+            row = row_of(doc_id)
+            if row is None:
+                continue
+            try:
+                vector = vectorstore.index.reconstruct(int(row))
+            except RuntimeError:
+                logging.warning("The FAISS index cannot reconstruct its vectors")
+                break
+            # squared L2, the distance the index reports
+            distance = float(np.sum((vector - query[0]) ** 2))
+            found[doc_id] = (docstore.search(doc_id), distance)
+        results.append(found)
+    return results
+
+
+def pgvector_documents_by_ids(
+    vectorstore: PGVector, requests: List[Tuple[List[str], List[float]]]
+) -> List[DocsById]:
+    """
+    Fetch documents by id with their distance to a query vector, in one round-trip.
+    """
+    results: List[DocsById] = [{} for _ in requests]
+    values = []
+    params = {}
+    for position, (ids, embedding) in enumerate(requests):
+        params[f"query_{position}"] = "[" + ",".join(map(str, embedding)) + "]"
+        for n, doc_id in enumerate(ids):
+            values.append(
+                f"({position}, :id_{position}_{n}, CAST(:query_{position} AS vector))"
+            )
+            params[f"id_{position}_{n}"] = doc_id
+    if not values:
+        return results
+    operator = PGVECTOR_OPERATORS[vectorstore._distance_strategy]
+    statement = sqlalchemy.text(
+        f"""
+        WITH wanted (position, custom_id, embedding) AS (VALUES {", ".join(values)})
+        SELECT wanted.position, e.custom_id, e.document, e.cmetadata,
+            e.embedding {operator} wanted.embedding AS distance
+        FROM wanted
+        JOIN langchain_pg_embedding e ON e.custom_id = wanted.custom_id
+        WHERE e.collection_id = :collection_id
+        """
+    )
+    with Session(vectorstore._conn) as session:
+        collection = vectorstore.get_collection(session)
+        if collection is None:
+            return results
+        params["collection_id"] = str(collection.uuid)
+        for position, custom_id, document, cmetadata, distance in session.execute(
+            statement, params
+        ):
+            doc = Document(page_content=document, metadata=cmetadata or {})
+            results[position][custom_id] = (doc, float(distance))
+    return results
+
+
+def documents_by_ids(
+    vectorstore: VectorStore, requests: List[Tuple[List[str], List[float]]]
+) -> List[DocsById]:
+    """
+    Fetch documents by id, with their distance to a query vector.
+
+    Parameters
+    ----------
+    vectorstore : VectorStore
+        The vector store holding the documents.
+    requests : List[Tuple[List[str], List[float]]]
+        The ids to fetch and the query vector, per query.
+
+    Returns
+    -------
+    List[Dict[str, Tuple[Document, float]]]
+        The documents found and their distances by id, per query.
+    """
+    if isinstance(vectorstore, FAISS):
+        return faiss_documents_by_ids(vectorstore, requests)
+    if isinstance(vectorstore, PGVector):
+        return pgvector_documents_by_ids(vectorstore, requests)
+    return [{} for _ in requests]
+
+
+def hybrid_documents(
+    vectorstore: VectorStore,
+    questions: List[str],
+    embeddings: List[List[float]],
+    vector_documents: List[List[Document]],
+    k: int,
+    lexical_index: Optional[BM25Index] = None,
+) -> List[List[Document]]:
+    """
+    Fuse the vector search results with a BM25 search of the same questions.
+
+    The `BM25_TOP_K` best lexical matches of each question and its vector search
+    results are merged with reciprocal rank fusion (`RRF_K`) and cut to k. Chunks
+    found only by the lexical search are fetched with their vector distance as
+    `score`, like the others; the similarity threshold only applies to the vector
+    search, an exact match on a name or a date is kept whatever its distance.
+
+    Parameters
+    ----------
+    vectorstore : VectorStore
+        The vector store the documents come from.
+    questions : List[str]
+        The questions.
+    embeddings : List[List[float]]
+        Their embeddings.
+    vector_documents : List[List[Document]]
+        The vector search results of each question, best first, with their score.
+    k : int
+        Number of documents to return per question.
+    lexical_index : BM25Index, optional
+        The BM25 index of the vector store, by default its `lexical_index`.
+
+    Returns
+    -------
+    List[List[Document]]
+        The fused documents of each question, best first.
+    """
+    if lexical_index is None:
+        lexical_index = getattr(vectorstore, "lexical_index", None)
+    if lexical_index is None or not len(lexical_index):
+        return vector_documents
+    lexical_k = settings.get("bm25_top_k", 10)
+    rrf_k = settings.get("rrf_k", 60)
+    fused_ids = []
+    requests = []
+    for question, embedding, documents in zip(questions, embeddings, vector_documents):
+        vector_ids = [doc.metadata.get(CHUNK_HASH_KEY) for doc in documents]
+        if None in vector_ids:
+            # an index built before chunks were identified by their hash
+            fused_ids.append(None)
+            requests.append(([], embedding))
+            continue
+        lexical_ids = [
+            doc_id for doc_id, _ in lexical_index.search(question, lexical_k)
+        ]
+        fused = [
+            doc_id
+            for doc_id, _ in reciprocal_rank_fusion([vector_ids, lexical_ids], rrf_k)
+        ][:k]
+        fused_ids.append(fused)
+        requests.append(
+            ([doc_id for doc_id in fused if doc_id not in vector_ids], embedding)
+        )
+    fetched = documents_by_ids(vectorstore, requests)
+    results = []
+    for ids, documents, found in zip(fused_ids, vector_documents, fetched):
+        if ids is None:
+            results.append(documents)
+            continue
+        by_id = {doc.metadata[CHUNK_HASH_KEY]: doc for doc in documents}
+        for doc_id, (doc, distance) in found.items():
+            by_id[doc_id] = Document(
+                page_content=doc.page_content,
+                metadata={**doc.metadata, **{"score": distance}},
+            )
+        results.append([by_id[doc_id] for doc_id in ids if doc_id in by_id])
+    return results
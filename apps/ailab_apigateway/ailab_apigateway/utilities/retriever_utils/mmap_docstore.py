@@ -0,0 +1,294 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Union
+
+import numpy as np
+from langchain.docstore.base import Docstore
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema.document import Document
+from langchain.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_core.embeddings import Embeddings
+
+from ..indexer_utils.ingestion import START_INDEX_KEY
+
+FAISS_INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.bin"
+# written by FAISS.save_local, loaded as a fallback
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# every save writes its files into a new directory under VERSIONS_DIR and points
+# the CURRENT_LINK symlink at it
+VERSIONS_DIR = "versions"
+CURRENT_LINK = "current"
+
+MAGIC = b"AILDOCS1"
+HEADER = struct.Struct("<8sQ")
+ALIGNMENT = 8
+# integer metadata differing from chunk to chunk, stored as columns
+ROW_METADATA_KEYS = (START_INDEX_KEY,)
+MISSING_VALUE = -1
+
+
+def _padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+def write_docstore(path: str, ids: List[str], documents: List[Document]) -> None:
+    """
+    Write documents to a compact docstore file, row `i` holding `ids[i]`.
+
+    The file holds a JSON header followed by flat arrays: text offsets into a UTF-8
+    blob, the ids sorted for binary search with their rows, and per row an index into
+    the distinct metadata dicts kept in the header. Chunks share their source, so the
+    distinct dicts are few once metadata values equal to the id (the chunk hash) are
+    stored as key names only, and the `ROW_METADATA_KEYS` integers (the start index)
+    as a column per key. The file is replaced atomically, so processes that
+    have the previous version mapped keep reading it.
+
+    Parameters
+    ----------
+    path : str
+        The file to write.
+    ids : List[str]
+        Docstore id of every row.
+    documents : List[Document]
+        Document of every row.
+    """
+    texts = [doc.page_content.encode("utf8") for doc in documents]
+    text_offsets = np.zeros(len(texts) + 1, dtype="<u8")
+    np.cumsum([len(text) for text in texts], out=text_offsets[1:])
+
+    encoded_ids = np.array([doc_id.encode("utf8") for doc_id in ids], dtype=bytes)
+    sorted_rows = np.argsort(encoded_ids, kind="stable").astype("<u8")
+    id_ranks = np.empty(len(ids), dtype="<u8")
+    id_ranks[sorted_rows] = np.arange(len(ids), dtype="<u8")
+
+    distinct: Dict[str, int] = {}
+    metadata_index = np.empty(len(ids), dtype="<u4")
+    columns = {
+        key: np.full(len(ids), MISSING_VALUE, dtype="<i8") for key in ROW_METADATA_KEYS
+    }
+    for row, (doc_id, doc) in enumerate(zip(ids, documents)):
+        id_keys = sorted(key for key, value in doc.metadata.items() if value == doc_id)
+        metadata = {
+            key: value for key, value in doc.metadata.items() if key not in id_keys
+        }
+        for key, column in columns.items():
+            value = metadata.get(key)
+            if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+                column[row] = metadata.pop(key)
+        key = json.dumps({"metadata": metadata, "id_keys": id_keys}, sort_keys=True)
+        metadata_index[row] = distinct.setdefault(key, len(distinct))
+
+    sections = {
+        "text_offsets": text_offsets,
+        "sorted_ids": encoded_ids[sorted_rows],
+        "sorted_rows": sorted_rows,
+        "id_ranks": id_ranks,
+        "metadata_index": metadata_index,
+        "texts": np.frombuffer(b"".join(texts), dtype=np.uint8),
+        **{f"column_{key}": column for key, column in columns.items()},
+    }
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        layout[name] = [offset, array.dtype.str, len(array)]
+        offset += array.nbytes + _padding(array.nbytes)
+    header = json.dumps(
+        {
+            "sections": layout,
+            "metadata": [json.loads(key) for key in distinct],
+            "columns": list(columns),
+        }
+    ).encode("utf8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(header)))
+        file.write(header + b"\0" * _padding(HEADER.size + len(header)))
+        for array in sections.values():
+            file.write(array.tobytes())
+            file.write(b"\0" * _padding(array.nbytes))
+    os.replace(tmp_path, path)
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only docstore memory-mapped from a file written by `write_docstore`.
+
+    Loading only parses the header; texts, ids and metadata are read from the
+    mapping on access, so the pages are shared through the page cache by every
+    process serving the same index.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a docstore file")
+        self._mmap.seek(HEADER.size)
+        header = json.loads(self._mmap.read(header_size))
+        header_end = HEADER.size + header_size
+        data_start = header_end + _padding(header_end)
+        self._metadata = header["metadata"]
+        # written by versions without metadata columns
+        self._columns = header.get("columns", [])
+        self._arrays = {
+            name: np.frombuffer(
+                self._mmap, dtype=dtype, count=count, offset=data_start + offset
+            )
+            for name, (offset, dtype, count) in header["sections"].items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._arrays["id_ranks"])
+
+    def id_at(self, row: int) -> str:
+        rank = self._arrays["id_ranks"][row]
+        return self._arrays["sorted_ids"][rank].decode("utf8")
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        sorted_ids = self._arrays["sorted_ids"]
+        key = doc_id.encode("utf8")
+        rank = int(np.searchsorted(sorted_ids, key))
+        if rank == len(sorted_ids) or sorted_ids[rank] != key:
+            return None
+        return int(self._arrays["sorted_rows"][rank])
+
+    def document(self, row: int) -> Document:
+        start = self._arrays["text_offsets"][row]
+        end = self._arrays["text_offsets"][row + 1]
+        text = self._arrays["texts"][start:end].tobytes().decode("utf8")
+        entry = self._metadata[self._arrays["metadata_index"][row]]
+        metadata = dict(entry["metadata"])
+        if entry["id_keys"]:
+            doc_id = self.id_at(row)
+            metadata.update((key, doc_id) for key in entry["id_keys"])
+        for key in self._columns:
+            value = int(self._arrays[f"column_{key}"][row])
+            if value != MISSING_VALUE:
+                metadata[key] = value
+        return Document(page_content=text, metadata=metadata)
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self.row_of(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document(row)
+
+
+class RowIds(Mapping[int, str]):
+    """
+    The FAISS position to docstore id map, read from an `MmapDocstore`.
+    """
+
+    def __init__(self, docstore: MmapDocstore) -> None:
+        self.docstore = docstore
+
+    def __getitem__(self, row: Any) -> str:
+        row = int(row)
+        if not 0 <= row < len(self.docstore):
+            raise KeyError(row)
+        return self.docstore.id_at(row)
+
+    def __len__(self) -> int:
+        return len(self.docstore)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.docstore)))
+
+
+def faiss_files_path(folder_path: str) -> str:
+    """
+    The directory holding the index files of the FAISS index saved in a folder: the
+    version `CURRENT_LINK` points at, or the folder itself for older saves.
+    """
+    current = os.path.join(folder_path, CURRENT_LINK)
+    if os.path.isdir(current):
+        return os.path.realpath(current)
+    return folder_path
+
+
+def save_faiss(vectorstore: FAISS, folder_path: str) -> None:
+    """
+    Save a FAISS vector store as its index file and a compact docstore.
+
+    Both files are written into a new version directory, which is then swapped in
+    by renaming the `CURRENT_LINK` symlink over the previous one: a reader resolving
+    the link gets both files of the same save. The previous version is kept for
+    readers still opening it, older ones and files of older layouts are removed.
+    """
+    versions_path = os.path.join(folder_path, VERSIONS_DIR)
+    version_path = os.path.join(versions_path, str(time.time_ns()))
+    os.makedirs(version_path)
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    documents = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    write_docstore(os.path.join(version_path, DOCSTORE_FILE), ids, documents)
+    dependable_faiss_import().write_index(
+        vectorstore.index, os.path.join(version_path, FAISS_INDEX_FILE)
+    )
+    link_path = os.path.join(folder_path, CURRENT_LINK)
+    previous_path = faiss_files_path(folder_path)
+    if os.path.lexists(f"{link_path}.tmp"):
+        os.remove(f"{link_path}.tmp")
+    os.symlink(os.path.relpath(version_path, folder_path), f"{link_path}.tmp")
+    os.replace(f"{link_path}.tmp", link_path)
+    for name in os.listdir(versions_path):
+        path = os.path.join(versions_path, name)
+        if path not in (version_path, previous_path):
+            shutil.rmtree(path, ignore_errors=True)
+    for name in (FAISS_INDEX_FILE, DOCSTORE_FILE, LEGACY_DOCSTORE_FILE):
+        path = os.path.join(folder_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_faiss(
+    folder_path: str, embeddings: Embeddings, writable: bool = False
+) -> FAISS:
+    """
+    Load a FAISS vector store saved by `save_faiss`, or by `FAISS.save_local`.
+
+    Parameters
+    ----------
+    folder_path : str
+        The folder holding the index.
+    embeddings : Embeddings
+        Embeds the queries.
+    writable : bool
+        Load the index and documents into memory so they can be updated. By default
+        both are memory-mapped read-only.
+
+    Returns
+    -------
+    FAISS
+        The vector store.
+    """
+    # resolved once, so both files come from the same save
+    files_path = faiss_files_path(folder_path)
+    docstore_path = os.path.join(files_path, DOCSTORE_FILE)
+    if not os.path.exists(docstore_path):
+        return FAISS.load_local(folder_path, embeddings)
+    faiss = dependable_faiss_import()
+    index_path = os.path.join(files_path, FAISS_INDEX_FILE)
+    docstore = MmapDocstore(docstore_path)
+    if writable:
+        ids = RowIds(docstore)
+        return FAISS(
+            embeddings,
+            faiss.read_index(index_path),
+            InMemoryDocstore(
+                {ids[row]: docstore.document(row) for row in range(len(docstore))}
+            ),
+            dict(ids),
+        )
+    flags = faiss.IO_FLAG_READ_ONLY | getattr(
+        faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP
+    )
+    return FAISS(
+        embeddings, faiss.read_index(index_path, flags), docstore, RowIds(docstore)
+    )
@@ -0,0 +1,113 @@
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.schema.vectorstore import VectorStore
+
+from ...config import settings
+from .batch_search import DocsAndScores, batch_similarity_search_with_vectors
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    Select k candidates balancing relevance to the query and diversity.
+
+    Each step picks the candidate maximizing
+    `lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, s) for s selected)`
+    with cosine similarities. All similarities are computed as two matrix products
+    up front and a step only updates the running maximum similarity to the selected
+    candidates, a vector operation.
+
+    Parameters
+    ----------
+    query : np.ndarray
+        The query vector.
+    candidates : np.ndarray
+        One candidate vector per row.
+    k : int
+        Number of candidates to select.
+    lambda_mult : float
+        1 ranks by relevance only, 0 by diversity only.
+
+    Returns
+    -------
+    List[int]
+        Positions of the selected candidates, in selection order.
+    """
+    candidates = np.asarray(candidates, dtype=np.float32)
+    if not len(candidates) or k <= 0:
+        return []
+    unit = candidates / np.maximum(
+        np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12
+    )
+    query = np.asarray(query, dtype=np.float32)
+    relevance = unit @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    similarity = unit @ unit.T
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    for _ in range(min(k, len(candidates)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+def mmr_search(
+    vectorstore: VectorStore,
+    embeddings: List[List[float]],
+    k: int = 4,
+    threshold: Optional[float] = None,
+    fetch_k: Optional[int] = None,
+    lambda_mult: Optional[float] = None,
+    **options: Any,
+) -> List[DocsAndScores]:
+    """
+    Similarity search re-ranked for diversity with maximal marginal relevance.
+
+    The `MMR_FETCH_K` nearest chunks of each query under the similarity threshold
+    are fetched with their vectors, and k of them are selected by
+    `maximal_marginal_relevance` with `MMR_LAMBDA`, so near-identical overlapping
+    chunks do not fill the prompt.
+
+    Parameters
+    ----------
+    vectorstore : VectorStore
+        The vector store to search, FAISS or pgvector.
+    embeddings : List[List[float]]
+        One query vector per question.
+    k : int
+        Number of documents to return per question.
+    threshold : float, optional
+        Only candidates scoring below it are selected.
+    fetch_k : int, optional
+        Candidates fetched per question, by default `MMR_FETCH_K`.
+    lambda_mult : float, optional
+        Relevance weight, by default `MMR_LAMBDA`.
+    **options
+        Per-query pgvector search settings (`ef_search`, `probes`).
+
+    Returns
+    -------
+    List[List[Tuple[Document, float]]]
+        The selected documents and their scores for each query vector, in input
+        order, in selection order.
+    """
+    if fetch_k is None:
+        fetch_k = settings.get("mmr_fetch_k", 20)
+    if lambda_mult is None:
+        lambda_mult = settings.get("mmr_lambda", 0.5)
+    results = []
+    for embedding, (docs_and_scores, vectors) in zip(
+        embeddings,
+        batch_similarity_search_with_vectors(
+            vectorstore, embeddings, max(fetch_k, k), threshold=threshold, **options
+        ),
+    ):
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding), vectors, k, lambda_mult
+        )
+        results.append([docs_and_scores[i] for i in selected])
+    return results
@@ -0,0 +1,86 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Any
+
+import sqlalchemy
+from sqlalchemy.pool import QueuePool
+
+# upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolWaitMetrics:
+    """
+    Time spent waiting for a connection from a pool.
+
+    A checkout waits when every pooled connection is in use and the overflow is
+    exhausted; it also includes opening new connections and the pre-ping. Growing
+    waits mean the pool is too small for the request concurrency of the worker.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.buckets[bisect_left(WAIT_BUCKETS, wait)] += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            bounds = [f"{bound * 1000:g}ms" for bound in WAIT_BUCKETS] + ["inf"]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "mean_wait_ms": (
+                    self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0
+                ),
+                "max_wait_ms": self.max_wait * 1000,
+                "wait_histogram": dict(zip(bounds, self.buckets)),
+            }
+
+
+def timed_queue_pool(metrics: PoolWaitMetrics) -> type[QueuePool]:
+    """
+    A QueuePool class recording checkout wait times into `metrics`.
+
+    The metrics are bound to the class, so they survive the pool being recreated
+    by `Engine.dispose`.
+    """
+
+    class TimedQueuePool(QueuePool):
+        def connect(self) -> Any:
+            start = time.perf_counter()
+            try:
+                connection = super().connect()
+            except sqlalchemy.exc.TimeoutError:
+                metrics.record_timeout()
+                raise
+            metrics.record(time.perf_counter() - start)
+            return connection
+
+    return TimedQueuePool
+
+
+def pool_stats(pool: QueuePool, metrics: PoolWaitMetrics) -> dict:
+    """
+    Occupancy of a pool together with its checkout wait metrics.
+    """
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        **metrics.stats(),
+    }
@@ -1,8 +1,100 @@
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+import sqlalchemy
+from langchain.schema.document import Document
 from langchain.vectorstores.faiss import FAISS
 from langchain.vectorstores.pgvector import PGVector
 
 from ...config import settings
+from ..embedding_batcher import with_micro_batching
+from ..embedding_cache import with_query_cache
 from ..embedding_selector import embedding_selector
+from ..persistent_embedding_cache import with_persistent_cache
+from .batch_search import ANN_METHODS, pgvector_batch_search
+from .bm25_index import load_bm25_index
+from .faiss_index import enable_reconstruct, tune_faiss_index
+from .hybrid_search import bm25_index_path
+from .mmap_docstore import load_faiss
+from .pool_metrics import PoolWaitMetrics, pool_stats, timed_queue_pool
+
+
+def make_retrieval_connection_string() -> str:
+    return PGVector.connection_string_from_db_params(
+        driver="psycopg2",
+        host=settings.database_host,
+        port=settings.database_port,
+        database=settings.database_name,
+        user=settings.database_username,
+        password=settings.database_password,
+    )
+
+
+retrieval_pool_metrics = PoolWaitMetrics()
+
+
+@lru_cache(maxsize=1)
+def get_retrieval_engine() -> sqlalchemy.engine.Engine:
+    """
+    Return the SQLAlchemy engine shared by every retrieval query of this process.
+
+    Each worker process holds up to `PGVECTOR_POOL_SIZE + PGVECTOR_MAX_OVERFLOW`
+    connections, which bounds the connections a deployment opens to that times the
+    number of workers. Checkout waits are recorded in `retrieval_pool_metrics`.
+    """
+    return sqlalchemy.create_engine(
+        make_retrieval_connection_string(),
+        poolclass=timed_queue_pool(retrieval_pool_metrics),
+        pool_size=settings.get("pgvector_pool_size", 5),
+        max_overflow=settings.get("pgvector_max_overflow", 10),
+        pool_timeout=settings.get("pgvector_pool_timeout", 30),
+        pool_recycle=settings.get("pgvector_pool_recycle", 1800),
+        pool_pre_ping=settings.get("pgvector_pool_pre_ping", True),
+    )
+
+
+def retrieval_pool_stats() -> dict:
+    return pool_stats(get_retrieval_engine().pool, retrieval_pool_metrics)
+
+
+class SharedEnginePGVector(PGVector):
+    """
+    PGVector that binds its sessions to the process-wide retrieval engine.
+
+    The stock PGVector opens a dedicated connection per instance and uses it from
+    every call; binding to the engine instead checks a connection out of the
+    engine's pool per query, so one instance can be shared across requests.
+
+    Searches run through `pgvector_batch_search`, which uses the collection's ANN
+    index when `PGVECTOR_INDEX_METHOD` is set. `search_options` holds the default
+    `ef_search`/`probes`, which can be overridden per query.
+    """
+
+    search_options: dict = {}
+
+    def connect(self) -> sqlalchemy.engine.Engine:
+        return get_retrieval_engine()
+
+    def __del__(self) -> None:
+        # the engine outlives this store, it is disposed at application shutdown
+        pass
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        if filter is not None:
+            return super().similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter
+            )
+        options = {
+            **self.search_options,
+            **{key: kwargs[key] for key in ("ef_search", "probes") if key in kwargs},
+        }
+        return pgvector_batch_search(self, [embedding], k, **options)[0]
 
 
 def get_vectorstore_connector() -> PGVector | FAISS:
@@ -12,25 +104,32 @@ def get_vectorstore_connector() -> PGVector | FAISS:
             f"Embeddings name {settings.embeddings_name} is not valid. Please check the config file."
         )
 
+    # every question is embedded through the query cache, whichever backend is used,
+    # then through the persistent cache shared with the indexer; the questions
+    # missing from both are batched with the concurrent ones
+    embeddings = with_query_cache(
+        with_persistent_cache(with_micro_batching(embeddings_function()))
+    )
     vectorstore = None
 
     if settings.database_type == "postgres":
-        connection_string = PGVector.connection_string_from_db_params(
-            driver="psycopg2",
-            host=settings.database_host,
-            port=settings.database_port,
-            database=settings.database_name,
-            user=settings.database_username,
-            password=settings.database_password,
-        )
-        vectorstore = PGVector(
-            embedding_function=embeddings_function(),
+        vectorstore = SharedEnginePGVector(
+            embedding_function=embeddings,
             collection_name=settings.database_table,
-            connection_string=connection_string,
+            connection_string=make_retrieval_connection_string(),
         )
+        vectorstore.search_options = {
+            "ef_search": settings.get("pgvector_ef_search", 40),
+            "probes": settings.get("pgvector_probes", 10),
+            "ann_index": settings.get("pgvector_index_method", "hnsw") in ANN_METHODS,
+        }
     elif settings.database_type == "FAISS":
-        vectorstore = FAISS.load_local(
-            embeddings=embeddings_function(), folder_path=settings.database_path
+        # memory-mapped, so every worker shares one copy of the index in page cache
+        vectorstore = load_faiss(settings.database_path, embeddings)
+        tune_faiss_index(
+            vectorstore.index,
+            nprobe=settings.get("faiss_nprobe", 16),
+            ef_search=settings.get("faiss_ef_search", 64),
         )
 
     if vectorstore is None:
@@ -38,4 +137,14 @@ def get_vectorstore_connector() -> PGVector | FAISS:
             f"Database type {settings.database_type} is not valid. Please check the config file."
         )
 
+    hybrid = settings.get("hybrid_search_enabled", True)
+    if hybrid:
+        # loaded with the store, so a reload swaps both together
+        vectorstore.lexical_index = load_bm25_index(bm25_index_path())
+    if isinstance(vectorstore, FAISS) and (
+        hybrid or settings.get("mmr_enabled", False)
+    ):
+        # lexical matches are scored, and MMR candidates compared, by stored vector
+        enable_reconstruct(vectorstore.index)
+
     return vectorstore
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from langchain.schema.vectorstore import VectorStore
+
+from ...config import settings
+from ..executor import run_blocking
+from ..index_version import read_index_version
+from .bm25_index import BM25_INDEX_FILE
+from .mmap_docstore import (
+    DOCSTORE_FILE,
+    FAISS_INDEX_FILE,
+    LEGACY_DOCSTORE_FILE,
+    faiss_files_path,
+)
+from .vectorstore_methods import get_vectorstore_connector
+
+
+def index_fingerprint() -> Optional[str]:
+    """
+    Fingerprint of the index backing the configured vector store.
+
+    Returns
+    -------
+    str or None
+        A string that changes whenever the indexer bumps the index version or the
+        FAISS index files are rewritten, or None when there is nothing to watch.
+    """
+    parts = []
+    version = read_index_version()
+    if version is not None:
+        parts.append(f"version:{version}")
+    if settings.database_type == "FAISS":
+        files_path = faiss_files_path(settings.database_path)
+        if not os.path.exists(os.path.join(files_path, FAISS_INDEX_FILE)):
+            return None
+        # the version directory changes with every save
+        parts.append(f"files:{files_path}")
+        for file_path in (
+            os.path.join(files_path, FAISS_INDEX_FILE),
+            os.path.join(files_path, DOCSTORE_FILE),
+            os.path.join(files_path, LEGACY_DOCSTORE_FILE),
+            os.path.join(settings.database_path, BM25_INDEX_FILE),
+        ):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            parts.append(
+                f"{os.path.basename(file_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+            )
+    return "|".join(parts) or None
+
+
+@dataclass(frozen=True)
+class LoadedVectorStore:
+    """
+    A loaded vector store and the fingerprint of the index it was loaded from.
+    """
+
+    vectorstore: VectorStore
+    fingerprint: Optional[str]
+
+
+class VectorStoreRegistry:
+    """
+    Process-wide holder of the vector store used by the retrieval endpoints.
+
+    The store is built once (normally from the application lifespan hook) and shared
+    by every request. A reload builds a complete new store before swapping the
+    reference, so queries that already hold the previous store finish against it and
+    never observe a partially loaded index. The store and its fingerprint are
+    swapped as one `LoadedVectorStore`, so answers are keyed by the version of the
+    index they were computed with.
+
+    Attributes
+    ----------
+    loader : Callable[[], VectorStore]
+        Builds a new vector store from the current settings.
+    fingerprint : Callable[[], Optional[str]]
+        Identifies the version of the index on disk; a change triggers a reload.
+    attempts : int
+        Loads tried before giving up on an index that changes while it is loaded.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], VectorStore] = get_vectorstore_connector,
+        fingerprint: Callable[[], Optional[str]] = index_fingerprint,
+        attempts: int = 3,
+    ) -> None:
+        self.loader = loader
+        self.fingerprint = fingerprint
+        self.attempts = attempts
+        self._loaded: Optional[LoadedVectorStore] = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def loaded_fingerprint(self) -> Optional[str]:
+        """
+        Fingerprint of the loaded index, used as its version by the answer caches.
+        """
+        loaded = self._loaded
+        return loaded.fingerprint if loaded is not None else None
+
+    def get_loaded(self) -> LoadedVectorStore:
+        """
+        Return the current vector store with its fingerprint, loading it on first
+        use. Concurrent first calls wait for a single load.
+        """
+        loaded = self._loaded
+        if loaded is None:
+            with self._reload_lock:
+                loaded = self._loaded
+                if loaded is None:
+                    loaded = self._load()
+        return loaded
+
+    async def aget_loaded(self) -> LoadedVectorStore:
+        """
+        Async version of `get_loaded`, a first load runs in the bounded executor.
+        """
+        loaded = self._loaded
+        if loaded is None:
+            loaded = await run_blocking(self.get_loaded)
+        return loaded
+
+    def get(self) -> VectorStore:
+        """
+        Return the current vector store, loading it on first use.
+        """
+        return self.get_loaded().vectorstore
+
+    async def aget(self) -> VectorStore:
+        """
+        Async version of `get`, a first load runs in the bounded executor.
+        """
+        return (await self.aget_loaded()).vectorstore
+
+    def load(self) -> VectorStore:
+        """
+        Build a new vector store and atomically swap it in.
+
+        The store is only swapped in if the index fingerprint did not change while it
+        was built, otherwise files may have been replaced mid-load and the load is
+        tried again, up to `attempts` times. If the index keeps changing, the current
+        store is kept; a first load uses the new store but leaves its fingerprint
+        unset, so the next check loads the index again.
+
+        Returns
+        -------
+        VectorStore
+            The vector store in place after the load.
+        """
+        with self._reload_lock:
+            return self._load().vectorstore
+
+    def _load(self) -> LoadedVectorStore:
+        # with the reload lock held
+        for _ in range(self.attempts):
+            fingerprint_before = self.fingerprint()
+            vectorstore = self.loader()
+            fingerprint_after = self.fingerprint()
+            if fingerprint_before == fingerprint_after:
+                self._loaded = LoadedVectorStore(vectorstore, fingerprint_after)
+                logging.info(f"Vector store loaded (fingerprint={fingerprint_after})")
+                return self._loaded
+            logging.info("Index files changed while loading, loading them again")
+        logging.warning(
+            f"Index files kept changing over {self.attempts} loads, "
+            "keeping the current store"
+        )
+        if self._loaded is None:
+            self._loaded = LoadedVectorStore(vectorstore, None)
+        return self._loaded
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the vector store if the index on disk changed since the last load.
+
+        A failed reload is logged and the previous store stays in place.
+
+        Returns
+        -------
+        bool
+            True if a new store was swapped in.
+        """
+        current = self._loaded
+        if current is not None and self.fingerprint() == current.fingerprint:
+            return False
+        try:
+            with self._reload_lock:
+                return self._load() is not current
+        except Exception:
+            logging.exception("Vector store reload failed, keeping the current store")
+            return False
+
+    async def watch(self, interval: float) -> None:
+        """
+        Poll the index fingerprint every `interval` seconds and reload on change.
+
+        The reload runs in a worker thread so the event loop keeps serving requests.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reload_if_changed)
+
+
+vectorstore_registry = VectorStoreRegistry()
@@ -0,0 +1,68 @@
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+def text_fingerprint(text: str) -> str:
+    """
+    Short stable digest of a text, to key on it without keeping it.
+    """
+    return hashlib.blake2b(text.encode("utf8"), digest_size=16).hexdigest()
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesce concurrent calls for the same key into one computation.
+
+    The first call for a key starts the computation as a task; calls for the key
+    arriving while it runs await the same task and get its result, or its
+    exception. The key is forgotten once the task is done, so later calls compute
+    afresh. A caller that is cancelled, a client that disconnected, does not cancel
+    the computation the others wait for.
+
+    Attributes
+    ----------
+    shared : int
+        Calls served by a computation started by another call.
+    """
+
+    def __init__(self) -> None:
+        self.shared = 0
+        self._flights: Dict[Hashable, "asyncio.Task[T]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        """
+        The result of `compute()`, shared with the concurrent calls for `key`.
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies calls with the same result.
+        compute : Callable[[], Awaitable[T]]
+            Produces the result, only called when no call for `key` is in flight.
+
+        Returns
+        -------
+        T
+            The result.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # retrieve the exception, the callers may all be gone
+            task.exception()
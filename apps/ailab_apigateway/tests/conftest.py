@@ -0,0 +1,71 @@
+import asyncio
+
+from langchain.vectorstores.faiss import FAISS
+from langchain_core.embeddings import Embeddings
+
+from ailab_apigateway.utilities.indexer_utils.chunk_hashes import CHUNK_HASH_KEY
+
+
+class WordEmbeddings(Embeddings):
+    # one component per word, its count in the text
+    words = ["alpha", "beta", "gamma", "delta", "epsilon"]
+    # texts containing one of these words fail to embed
+    failing = ()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        if any(word in text for word in self.failing):
+            raise RuntimeError(f"cannot embed {text}")
+        return [float(text.count(word)) for word in self.words]
+
+
+class CountingEmbeddings(Embeddings):
+    # one component, the text length, and a record of the calls
+    model = "fake-model"
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        # embed_query and embed_documents calls
+        self.calls = 0
+        self.document_calls = 0
+        # every text embedded, in order
+        self.embedded = []
+        # the batches of aembed_documents
+        self.requests = []
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        self.embedded.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.embedded.append(text)
+        return [float(len(text))]
+
+    async def aembed_documents(self, texts):
+        self.requests.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("rate limited")
+        return self.embed_documents(texts)
+
+
+def make_faiss_store(texts, embeddings=None, sources="doc.txt"):
+    """
+    A FAISS store of `texts` with WordEmbeddings by default, chunk i stored as
+    "id-i" with that id as its chunk hash and its source from `sources`, one name
+    for all or one per text.
+    """
+    if isinstance(sources, str):
+        sources = [sources] * len(texts)
+    ids = [f"id-{i}" for i in range(len(texts))]
+    metadatas = [
+        {"source": source, CHUNK_HASH_KEY: doc_id}
+        for source, doc_id in zip(sources, ids)
+    ]
+    return FAISS.from_texts(
+        texts, embeddings or WordEmbeddings(), metadatas=metadatas, ids=ids
+    )
@@ -0,0 +1,63 @@
+import math
+
+from langchain.schema.document import Document
+
+from ailab_apigateway.utilities.answer_cache import SemanticAnswerCache
+
+
+def test_similar_question_hits_within_distance():
+    cache = SemanticAnswerCache(max_distance=0.05)
+    cache.store([1.0, 0.0], "v1", "Who is Alice?", "A friend.", [])
+    hit = cache.lookup([0.99, 0.05], "v1")
+    assert hit is not None and hit.answer == "A friend."
+    assert cache.lookup([0.0, 1.0], "v1") is None
+
+
+def at_distance(distance):
+    # a unit vector at the given cosine distance from [1, 0]
+    return [1 - distance, math.sqrt(1 - (1 - distance) ** 2)]
+
+
+def test_questions_differing_in_a_date_or_name_do_not_hit():
+    # typical ada-002 distances: a rephrasing or a typo is within a few
+    # thousandths, another day or person within a few hundredths
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], "v1", "What did I do on Monday?", "Hiking.", [])
+    assert cache.lookup(at_distance(0.003), "v1").answer == "Hiking."
+    for distance in (0.02, 0.03, 0.045):
+        assert cache.lookup(at_distance(distance), "v1") is None
+
+
+def test_new_index_version_invalidates_entries():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], "v1", "Who is Alice?", "A friend.", [])
+    assert cache.lookup([1.0, 0.0], "v2") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_memory_budget_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_bytes=2 * (2 * 4 + 10))
+    cache.store([1.0, 0.0], "v1", "first", "a" * 10, [])
+    cache.store([0.0, 1.0], "v1", "second", "b" * 10, [])
+    cache.lookup([1.0, 0.0], "v1")
+    cache.store([-1.0, 0.0], "v1", "third", "c" * 10, [])
+    assert cache.lookup([1.0, 0.0], "v1") is not None
+    assert cache.lookup([0.0, 1.0], "v1") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_cached_documents_are_snapshotted():
+    cache = SemanticAnswerCache()
+    doc = Document(page_content="Alice met Bob", metadata={"score": 0.1})
+    cache.store([1.0, 0.0], "v1", "Who met Bob?", "Alice.", [doc])
+    doc.metadata = {"score": 0.9}
+    assert cache.lookup([1.0, 0.0], "v1").documents[0].metadata["score"] == 0.1
+
+
+def test_answers_only_hit_for_the_same_history():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], "v1", "And her sister?", "Beth.", [], "history-a")
+    cache.store([1.0, 0.0], "v1", "And her sister?", "Carla.", [], "history-b")
+    assert cache.lookup([1.0, 0.0], "v1", "history-a").answer == "Beth."
+    assert cache.lookup([1.0, 0.0], "v1", "history-b").answer == "Carla."
+    assert cache.lookup([1.0, 0.0], "v1") is None
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from langchain.chat_models.fake import FakeListChatModel
+
+from ailab_apigateway.routers import ask
+from ailab_apigateway.routers.dtos.ask_dto import AskDto
+from ailab_apigateway.utilities.answer_cache import SemanticAnswerCache
+from ailab_apigateway.utilities.memory_chat_history import (
+    InMemoryChatMessageHistory,
+    InMemoryChatStore,
+)
+from ailab_apigateway.utilities.retriever_utils.vectorstore_registry import (
+    VectorStoreRegistry,
+)
+from tests.conftest import WordEmbeddings, make_faiss_store
+
+TEXTS = ["alpha beta", "gamma delta", "epsilon"]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # a small FAISS store, a stubbed LLM and a fresh answer cache
+    store = make_faiss_store(TEXTS)
+    monkeypatch.setattr(
+        ask,
+        "vectorstore_registry",
+        VectorStoreRegistry(loader=lambda: store, fingerprint=lambda: "v1"),
+    )
+    answers = iter(f"answer {n}" for n in range(100))
+    monkeypatch.setattr(
+        ask, "ChatOpenAI", lambda: FakeListChatModel(responses=[next(answers)])
+    )
+    monkeypatch.setattr(ask, "answer_cache", SemanticAnswerCache())
+    chats = InMemoryChatStore()
+    monkeypatch.setattr(
+        ask,
+        "new_message_history",
+        lambda session_id=None: InMemoryChatMessageHistory(session_id or "s", chats),
+    )
+    return store
+
+
+def stream_events(question, session_id=None):
+    async def collect():
+        return [event async for event in ask.stream_answer_events(question, session_id)]
+
+    return [
+        (
+            event.split("\n")[0].removeprefix("event: "),
+            json.loads(event.split("data: ")[1]),
+        )
+        for event in asyncio.run(collect())
+    ]
+
+
+def ask_batch(*questions):
+    return asyncio.run(
+        ask.ask_questions_batch([AskDto(question=question) for question in questions])
+    )
+
+
+def test_batch_answers_every_question_in_order(store):
+    results = ask_batch("alpha beta", "epsilon")
+    assert [result["error"] for result in results] == [None, None]
+    assert all(result["answer"] == "answer 0" for result in results)
+    assert [result["documents"][0]["page_content"] for result in results] == [
+        "alpha beta",
+        "epsilon",
+    ]
+
+
+def test_failing_question_only_fails_its_own_result(store, monkeypatch):
+    monkeypatch.setattr(WordEmbeddings, "failing", ("gamma",))
+    results = ask_batch("alpha beta", "gamma delta", "epsilon")
+    assert [result["answer"] is None for result in results] == [False, True, False]
+    assert results[1]["error"] and "gamma" not in results[1]["error"]
+    assert results[2]["documents"][0]["page_content"] == "epsilon"
+
+
+def test_stream_sends_documents_then_tokens_then_end(store):
+    events = stream_events("alpha beta", session_id="stream")
+    names = [name for name, _ in events]
+    assert names[0] == "documents" and names[-1] == "end"
+    assert set(names[1:-1]) == {"token"}
+    assert events[0][1]["documents"][0]["page_content"] == "alpha beta"
+    assert "".join(data["token"] for _, data in events[1:-1]) == "answer 0"
+    history = ask.new_message_history("stream")
+    assert asyncio.run(history.aget_buffer_string()) == (
+        "Human: alpha beta\nAI: answer 0"
+    )
+
+
+def test_stream_failure_is_reported_without_details(store, monkeypatch):
+    monkeypatch.setattr(WordEmbeddings, "failing", ("gamma",))
+    events = stream_events("gamma", session_id="failing")
+    assert [name for name, _ in events] == ["error"]
+    assert "gamma" not in events[0][1]["detail"]
+    history = ask.new_message_history("failing")
+    assert asyncio.run(history.aget_buffer_string()) == ""
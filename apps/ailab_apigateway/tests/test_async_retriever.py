@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain.chat_models.fake import FakeListChatModel
+from langchain.prompts import ChatPromptTemplate
+
+from ailab_apigateway.utilities.prompt_variables import template_history_prompt
+from ailab_apigateway.utilities.retriever import (
+    achatbot_answer_with_history,
+    adocument_retrieval,
+    adocument_retrieval_by_vectors,
+    astream_chatbot_answer_with_history,
+    document_retrieval,
+    get_scores,
+)
+from tests.conftest import WordEmbeddings, make_faiss_store
+
+TEXTS = ["alpha alpha", "alpha beta", "gamma", "delta gamma"]
+
+
+def make_store():
+    return make_faiss_store(TEXTS, sources="a.txt")
+
+
+def test_async_retrieval_matches_the_sync_one():
+    store = make_store()
+    for question in ["alpha", "gamma delta"]:
+        expected = document_retrieval(store, question, top_k=2)
+        retrieved = asyncio.run(adocument_retrieval(store, question, top_k=2))
+        assert [doc.page_content for doc in retrieved] == [
+            doc.page_content for doc in expected
+        ]
+        assert get_scores(retrieved) == get_scores(expected)
+    # only documents scoring below the threshold
+    retrieved = asyncio.run(
+        adocument_retrieval(store, "gamma", top_k=4, similarity_threshold=0.5)
+    )
+    assert [doc.page_content for doc in retrieved] == ["gamma"]
+
+
+def test_batched_retrieval_answers_each_question():
+    store = make_store()
+    questions = ["alpha beta", "delta gamma"]
+    vectors = WordEmbeddings().embed_documents(questions)
+    batched = asyncio.run(
+        adocument_retrieval_by_vectors(store, vectors, top_k=2, questions=questions)
+    )
+    for question, documents in zip(questions, batched):
+        single = asyncio.run(adocument_retrieval(store, question, top_k=2))
+        assert [doc.page_content for doc in documents] == [
+            doc.page_content for doc in single
+        ]
+        assert documents[0].page_content == question
+
+
+def test_answer_is_generated_and_streamed_from_the_documents():
+    store = make_store()
+    documents = asyncio.run(adocument_retrieval(store, "gamma", top_k=2))
+    prompt = ChatPromptTemplate.from_template(template_history_prompt)
+    model = FakeListChatModel(responses=["gamma it is"])
+
+    async def stream():
+        return [
+            chunk
+            async for chunk in astream_chatbot_answer_with_history(
+                "gamma?", documents, "", prompt, model
+            )
+        ]
+
+    answer = asyncio.run(
+        achatbot_answer_with_history("gamma?", documents, "", prompt, model)
+    )
+    assert answer == "gamma it is"
+    chunks = asyncio.run(stream())
+    assert len(chunks) > 1 and "".join(chunks) == answer
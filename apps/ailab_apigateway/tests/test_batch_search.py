@@ -0,0 +1,83 @@
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.vectorstores.faiss import FAISS
+from langchain_core.embeddings import Embeddings
+
+from ailab_apigateway.utilities.retriever_utils.batch_search import (
+    batch_similarity_search_with_score,
+    faiss_nearest,
+)
+
+RNG = np.random.default_rng(7)
+VECTORS = RNG.random((300, 8), dtype=np.float32)
+QUERIES = RNG.random((5, 8), dtype=np.float32)
+
+
+class NoEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+
+class CountingDocstore(InMemoryDocstore):
+    lookups = 0
+
+    def search(self, search):
+        CountingDocstore.lookups += 1
+        return super().search(search)
+
+
+def test_range_search_matches_the_filtered_nearest_vectors():
+    index = faiss.IndexFlatL2(8)
+    index.add(VECTORS)
+    threshold = 0.4
+    ranged = faiss_nearest(index, QUERIES, 10, threshold)
+    distances, positions = index.search(QUERIES, 10)
+    for (hit_distances, hit_positions), row_distances, row_positions in zip(
+        ranged, distances, positions
+    ):
+        kept = row_distances < threshold
+        assert list(hit_positions) == list(row_positions[kept])
+        np.testing.assert_allclose(hit_distances, row_distances[kept], rtol=1e-5)
+
+
+def test_indexes_without_range_search_are_filtered():
+    class NoRangeSearch:
+        def __init__(self, index):
+            self.index = index
+
+        def range_search(self, vectors, radius):
+            raise RuntimeError("range search not implemented")
+
+        def search(self, vectors, k):
+            return self.index.search(vectors, k)
+
+    index = faiss.IndexFlatL2(8)
+    index.add(VECTORS)
+    assert [
+        list(positions) for _, positions in faiss_nearest(index, QUERIES, 10, 0.4)
+    ] == [
+        list(positions)
+        for _, positions in faiss_nearest(NoRangeSearch(index), QUERIES, 10, 0.4)
+    ]
+
+
+def test_documents_over_the_threshold_are_never_fetched():
+    ids = [f"id-{i}" for i in range(len(VECTORS))]
+    store = FAISS.from_embeddings(
+        list(zip([f"chunk {i}" for i in range(len(VECTORS))], VECTORS.tolist())),
+        NoEmbeddings(),
+        ids=ids,
+    )
+    store.docstore = CountingDocstore(store.docstore._dict)
+    distances, _ = store.index.search(QUERIES[:1], 10)
+    threshold = float(distances[0][5])
+    [docs_and_scores] = batch_similarity_search_with_score(
+        store, [QUERIES[0].tolist()], 10, threshold=threshold
+    )
+    assert len(docs_and_scores) == 5
+    assert all(score < threshold for _, score in docs_and_scores)
+    assert CountingDocstore.lookups == len(docs_and_scores)
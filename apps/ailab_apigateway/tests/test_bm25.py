@@ -0,0 +1,97 @@
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+from ailab_apigateway.utilities.retriever_utils.bm25_index import (
+    BM25Index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+from ailab_apigateway.utilities.retriever_utils.hybrid_search import (
+    hybrid_documents,
+    indexed_chunks,
+)
+from ailab_apigateway.utilities.retriever_utils.mmap_docstore import (
+    load_faiss,
+    save_faiss,
+)
+from tests.conftest import make_faiss_store
+
+TEXTS = [
+    "Went hiking with Anna on October 13, the weather was great.",
+    "Dinner with my sister, we talked about the new job.",
+    "Long meeting at work about the quarterly budget.",
+    "Anna called, she is moving to Berlin in November.",
+]
+
+
+class MoodEmbeddings(Embeddings):
+    # vectors that know nothing about names and dates
+    words = ["weather", "job", "work", "moving"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(word in text.lower()) for word in self.words]
+
+
+def make_store():
+    return make_faiss_store(TEXTS, MoodEmbeddings(), sources="diary.txt")
+
+
+def test_tokenize_keeps_names_and_numbers():
+    assert tokenize("Went hiking with Anna on October 13!") == [
+        "went",
+        "hiking",
+        "anna",
+        "october",
+        "13",
+    ]
+
+
+def test_search_ranks_exact_matches_first(tmp_path):
+    index = BM25Index.build((f"id-{i}", text) for i, text in enumerate(TEXTS))
+    assert [
+        doc_id for doc_id, _ in index.search("What did Anna do on October 13?", 2)
+    ] == [
+        "id-0",
+        "id-3",
+    ]
+    assert index.search("the", 2) == []
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    assert BM25Index.load(path).search("berlin", 4) == index.search("berlin", 4)
+
+
+def test_rare_terms_weigh_more():
+    index = BM25Index.build(
+        [("a", "anna anna work"), ("b", "work budget"), ("c", "work")]
+    )
+    scores = dict(index.search("anna budget work", 3))
+    assert scores["a"] > scores["b"] > scores["c"]
+
+
+def test_reciprocal_rank_fusion_favours_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "c"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "c", "a", "d"]
+
+
+def test_hybrid_documents_add_lexical_matches_with_their_distance(tmp_path):
+    save_faiss(make_store(), str(tmp_path))
+    store = load_faiss(str(tmp_path), MoodEmbeddings())
+    index = BM25Index.build(indexed_chunks(store))
+    question = "Where is Anna moving in November?"
+    embedding = store.embeddings.embed_query(question)
+    vector_documents = [
+        Document(
+            page_content=doc.page_content, metadata={**doc.metadata, "score": score}
+        )
+        for doc, score in store.similarity_search_with_score_by_vector(embedding, k=1)
+    ]
+    assert [doc.metadata["chunk_hash"] for doc in vector_documents] == ["id-3"]
+    [documents] = hybrid_documents(
+        store, [question], [embedding], [vector_documents], k=2, lexical_index=index
+    )
+    assert [doc.metadata["chunk_hash"] for doc in documents] == ["id-3", "id-0"]
+    # squared L2 distance between the query vector and the stored one
+    assert documents[1].metadata["score"] == 1.0 + 1.0
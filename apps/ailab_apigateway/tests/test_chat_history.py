@@ -0,0 +1,259 @@
+import asyncio
+
+from langchain.schema.messages import AIMessage, HumanMessage
+from redis.asyncio import BlockingConnectionPool
+from redis.exceptions import WatchError
+
+from ailab_apigateway.utilities.chat_history import (
+    AsyncRedisChatMessageHistory,
+    aclose_shared_redis_clients,
+    shared_redis_client,
+    window_size,
+)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+        self.watched = None
+        self.immediate = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def watch(self, *keys):
+        # commands run right away until multi(), as in redis-py
+        self.watched = {key: self.redis.versions.get(key, 0) for key in keys}
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        if self.immediate:
+            return getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+
+        return queue
+
+    async def execute(self):
+        calls, self.calls = self.calls, []
+        watched, self.watched = self.watched or {}, None
+        if any(self.redis.versions.get(k, 0) != v for k, v in watched.items()):
+            raise WatchError("Watched variable changed.")
+        return [
+            await getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in calls
+        ]
+
+
+class FakeRedis:
+    # the commands the history uses, with Redis' semantics
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+        self.expiries = {}
+        # bumped by every write of a key, for WATCH
+        self.versions = {}
+
+    def _written(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def lpush(self, key, *values):
+        for value in values:
+            self.lists.setdefault(key, []).insert(0, value.encode("utf-8"))
+        self._written(key)
+
+    async def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        start = max(start + len(items) if start < 0 else start, 0)
+        stop = (end + len(items) if end < 0 else end) + 1
+        return items[start:stop]
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(
+            {field: str(value).encode("utf-8") for field, value in mapping.items()}
+        )
+        self._written(key)
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hmget(self, key, *fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    async def expire(self, key, seconds):
+        if key in self.lists or key in self.hashes:
+            self.expiries[key] = seconds
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.lists.pop(key, None)
+            self.hashes.pop(key, None)
+            self._written(key)
+
+
+def make_history(session_id="session", redis_client=None, ttl=0):
+    return AsyncRedisChatMessageHistory(
+        session_id, redis_client=redis_client or FakeRedis(), ttl=ttl
+    )
+
+
+def turn(n):
+    return [HumanMessage(content=f"question {n}"), AIMessage(content=f"answer {n}")]
+
+
+def test_window_size_keeps_whole_turns_within_the_budget():
+    recent = (turn(1) + turn(2))[::-1]
+    assert window_size(recent) == 4
+    assert window_size(recent, token_budget=1, count_tokens=len) == 0
+    # "Human: question 2" and "AI: answer 2"
+    assert window_size(recent, token_budget=29, count_tokens=len) == 2
+    assert window_size(recent, token_budget=28, count_tokens=len) == 0
+
+
+def test_older_turns_are_folded_into_the_summary():
+    history = make_history()
+    calls = []
+
+    async def summarize(summary, new_lines):
+        calls.append(new_lines)
+        return (summary + " | " + new_lines.replace("\n", " ")).strip(" |")
+
+    async def run():
+        for n in range(1, 5):
+            await history.aadd_messages(turn(n))
+            await history.afold_history(summarize, max_turns=2)
+        return await history.aget_window_buffer_string(max_turns=2)
+
+    assert asyncio.run(run()) == (
+        "System: Human: question 1 AI: answer 1 | Human: question 2 AI: answer 2\n"
+        "Human: question 3\nAI: answer 3\nHuman: question 4\nAI: answer 4"
+    )
+    # every turn is summarized once, when it leaves the window
+    assert calls == [
+        "Human: question 1\nAI: answer 1",
+        "Human: question 2\nAI: answer 2",
+    ]
+    assert asyncio.run(history.afold_history(summarize, max_turns=2)) is False
+
+
+def test_summary_of_a_cleared_session_is_dropped():
+    history = make_history()
+
+    async def summarize(summary, new_lines):
+        return "summary"
+
+    async def run():
+        for n in range(1, 4):
+            await history.aadd_messages(turn(n))
+        await history.afold_history(summarize, max_turns=1)
+        # the list written by another client without the summary hash
+        del history.redis_client.lists[history.key]
+        await history.aadd_messages(turn(4))
+        return await history.aget_window_buffer_string(max_turns=1)
+
+    assert asyncio.run(run()) == "Human: question 4\nAI: answer 4"
+
+
+def test_turns_added_while_folding_do_not_shift_the_fold():
+    history = make_history()
+    calls = []
+
+    async def summarize(summary, new_lines):
+        calls.append(new_lines)
+        if len(calls) == 1:
+            # the next answer lands while the summary is generated
+            await history.aadd_messages(turn(13))
+        return "summary"
+
+    async def run():
+        # more turns than one summarization call takes
+        for n in range(1, 13):
+            await history.aadd_messages(turn(n))
+        await history.afold_history(summarize, max_turns=1)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert calls[0].startswith("Human: question 1\n")
+    assert calls[0].endswith("AI: answer 10")
+    assert calls[1] == "Human: question 11\nAI: answer 11"
+
+
+def test_concurrent_folds_store_one_summary():
+    history = make_history()
+
+    async def run():
+        slow_started, slow_done = asyncio.Event(), asyncio.Event()
+
+        async def slow(summary, new_lines):
+            slow_started.set()
+            await slow_done.wait()
+            return "slow summary"
+
+        async def fast(summary, new_lines):
+            return "fast summary"
+
+        for n in range(1, 3):
+            await history.aadd_messages(turn(n))
+        slow_fold = asyncio.ensure_future(history.afold_history(slow, max_turns=1))
+        await slow_started.wait()
+        assert await history.afold_history(fast, max_turns=1) is True
+        slow_done.set()
+        assert await slow_fold is False
+        return await history.aget_window_buffer_string(max_turns=1)
+
+    assert asyncio.run(run()) == (
+        "System: fast summary\nHuman: question 2\nAI: answer 2"
+    )
+
+
+def test_sessions_are_kept_apart_and_expire():
+    redis = FakeRedis()
+    alice = make_history("alice", redis, ttl=60)
+    bob = make_history("bob", redis, ttl=60)
+
+    async def summarize(summary, new_lines):
+        return "summary"
+
+    async def run():
+        await alice.aadd_messages(turn(1))
+        await bob.aadd_messages(turn(2))
+        await bob.aadd_messages(turn(3))
+        await bob.afold_history(summarize, max_turns=1)
+        await alice.aclose()
+        return await alice.aget_buffer_string(), await bob.aget_buffer_string()
+
+    assert asyncio.run(run()) == (
+        "Human: question 1\nAI: answer 1",
+        "Human: question 2\nAI: answer 2\nHuman: question 3\nAI: answer 3",
+    )
+    assert redis.expiries == {
+        "message_store:alice": 60,
+        "message_store:bob": 60,
+        "message_store:bob:summary": 60,
+    }
+
+
+def test_shared_client_waits_for_a_free_connection():
+    url = "redis://localhost:6379/0"
+    client = shared_redis_client(url, max_connections=3, pool_timeout=2)
+    assert shared_redis_client(url) is client
+    pool = client.connection_pool
+    assert isinstance(pool, BlockingConnectionPool)
+    assert (pool.max_connections, pool.timeout) == (3, 2)
+    asyncio.run(aclose_shared_redis_clients())
+    assert shared_redis_client(url) is not client
+    asyncio.run(aclose_shared_redis_clients())
@@ -0,0 +1,33 @@
+from langchain.schema.document import Document
+
+from ailab_apigateway.utilities.indexer_utils.chunk_hashes import (
+    CHUNK_HASH_KEY,
+    ChunkDiff,
+    chunk_hash,
+)
+
+
+def make_chunks(*texts, source="diary.txt"):
+    return [Document(page_content=text, metadata={"source": source}) for text in texts]
+
+
+def test_only_new_chunks_are_yielded():
+    indexed = {chunk_hash(doc) for doc in make_chunks("kept", "removed")}
+    diff = ChunkDiff(indexed)
+    new = list(diff.new_chunks(make_chunks("kept", "added")))
+    assert [doc.page_content for doc in new] == ["added"]
+    assert new[0].metadata[CHUNK_HASH_KEY] == chunk_hash(new[0])
+    assert diff.unchanged == 1
+    assert diff.stale_ids == {chunk_hash(make_chunks("removed")[0])}
+
+
+def test_duplicate_chunks_are_indexed_once():
+    diff = ChunkDiff(set())
+    new = list(diff.new_chunks(make_chunks("same", "same")))
+    assert len(new) == 1
+
+
+def test_hash_depends_on_source():
+    first = make_chunks("text", source="a.txt")[0]
+    second = make_chunks("text", source="b.txt")[0]
+    assert chunk_hash(first) != chunk_hash(second)
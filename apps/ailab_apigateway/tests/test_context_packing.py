@@ -0,0 +1,88 @@
+import random
+
+from langchain.schema.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from ailab_apigateway.utilities.context_packing import (
+    Passage,
+    merge_overlapping,
+    pack_context,
+)
+
+DIARY = " ".join(
+    f"October {day} 2023: walked {day} km with Anna and wrote {day * 3} lines of code."
+    for day in range(1, 15)
+)
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def chunks(text, source):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=120, chunk_overlap=40, add_start_index=True
+    )
+    return splitter.create_documents([text], metadatas=[{"source": source}])
+
+
+def test_merge_overlapping():
+    first = Passage("a.txt", 0, "the quick brown fox")
+    second = Passage("a.txt", 10, "brown fox jumps")
+    assert merge_overlapping(second, first).text == "the quick brown fox jumps"
+    assert merge_overlapping(first, Passage("a.txt", 4, "quick")).text == first.text
+    # apart, from another source, or offsets out of date
+    assert merge_overlapping(first, Passage("a.txt", 21, "jumps")) is None
+    assert merge_overlapping(first, Passage("b.txt", 10, "brown fox jumps")) is None
+    assert merge_overlapping(first, Passage("a.txt", 12, "brown fox jumps")) is None
+
+
+def test_neighbouring_chunks_merge_into_the_source_text():
+    documents = chunks(DIARY, "diary.txt")
+    assert len(documents) > 5
+    random.Random(3).shuffle(documents)
+    [passage] = pack_context(documents, count_tokens=count_words)
+    assert passage == DIARY
+
+
+def test_chunks_without_offsets_are_not_merged():
+    documents = chunks(DIARY, "diary.txt")[:2]
+    for doc in documents:
+        del doc.metadata["start_index"]
+    assert pack_context(documents, count_tokens=count_words) == [
+        doc.page_content for doc in documents
+    ]
+
+
+def test_repeated_text_is_dropped_and_sources_are_not_mixed():
+    first, second = chunks(DIARY, "diary.txt")[:2]
+    copy = Document(page_content=first.page_content, metadata={"source": "copy.txt"})
+    other = Document(
+        page_content=second.page_content,
+        metadata={"source": "b.txt", "start_index": second.metadata["start_index"]},
+    )
+    passages = pack_context([first, copy, other], count_tokens=count_words)
+    assert passages == [first.page_content, second.page_content]
+
+
+def test_budget_is_filled_in_rank_order():
+    documents = [
+        Document(page_content="one two three four", metadata={"source": "a"}),
+        Document(page_content="five six seven eight nine", metadata={"source": "b"}),
+        Document(page_content="ten eleven", metadata={"source": "c"}),
+    ]
+    assert pack_context(documents, token_budget=7, count_tokens=count_words) == [
+        "one two three four",
+        "ten eleven",
+    ]
+    # not even the best chunk fits: it is cut to the budget
+    assert pack_context(documents, token_budget=2, count_tokens=len) == ["on"]
+
+
+def test_merged_chunks_cost_only_their_new_text():
+    documents = chunks(DIARY, "diary.txt")
+    budget = count_words(DIARY)
+    assert sum(count_words(doc.page_content) for doc in documents) > budget
+    assert pack_context(documents, token_budget=budget, count_tokens=count_words) == [
+        DIARY
+    ]
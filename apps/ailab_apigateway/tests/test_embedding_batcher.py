@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from ailab_apigateway.utilities.embedding_batcher import MicroBatchingEmbeddings
+from ailab_apigateway.utilities.embedding_cache import embedding_model_name
+from tests.conftest import CountingEmbeddings
+
+
+def test_concurrent_queries_share_one_request():
+    model = CountingEmbeddings()
+    batcher = MicroBatchingEmbeddings(model, window=0.01, max_batch_size=64)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.aembed_query("a"),
+            batcher.aembed_documents(["bb", "ccc"]),
+            batcher.aembed_query("dddd"),
+        )
+
+    assert asyncio.run(run()) == [[1.0], [[2.0], [3.0]], [4.0]]
+    assert model.requests == [["a", "bb", "ccc", "dddd"]]
+    assert batcher.stats()["batches"] == 1
+
+
+def test_full_batches_are_sent_without_waiting():
+    model = CountingEmbeddings()
+    # a window no test would wait for
+    batcher = MicroBatchingEmbeddings(model, window=60, max_batch_size=2)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.aembed_query(text) for text in "abcd")), 1
+        )
+
+    assert asyncio.run(run()) == [[1.0]] * 4
+    assert model.requests == [["a", "b"], ["c", "d"]]
+
+
+def test_failures_reach_every_caller_of_the_batch():
+    batcher = MicroBatchingEmbeddings(CountingEmbeddings(fail=True), window=0.01)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.aembed_query("a"), batcher.aembed_query("b"), return_exceptions=True
+        )
+
+    assert [str(error) for error in asyncio.run(run())] == ["rate limited"] * 2
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.aembed_query("c"))
+
+
+def test_cache_keys_are_those_of_the_wrapped_model():
+    model = CountingEmbeddings()
+    assert embedding_model_name(MicroBatchingEmbeddings(model)) == (
+        embedding_model_name(model)
+    )
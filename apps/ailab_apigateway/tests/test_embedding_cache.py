@@ -0,0 +1,86 @@
+import asyncio
+
+from ailab_apigateway.utilities.embedding_cache import (
+    CachedQueryEmbeddings,
+    QueryEmbeddingCache,
+)
+from tests.conftest import CountingEmbeddings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_repeated_question_is_embedded_once():
+    embeddings = CountingEmbeddings()
+    cached = CachedQueryEmbeddings(embeddings, QueryEmbeddingCache(max_size=10))
+    first = cached.embed_query("What did Alice say?")
+    assert cached.embed_query("  what did   alice say? ") == first
+    assert embeddings.calls == 1
+    assert cached.cache.stats()["hits"] == 1
+    assert cached.cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    embeddings = CountingEmbeddings()
+    cached = CachedQueryEmbeddings(embeddings, QueryEmbeddingCache(max_size=2))
+    cached.embed_query("a")
+    cached.embed_query("bb")
+    cached.embed_query("a")
+    cached.embed_query("ccc")
+    assert cached.cache.stats()["size"] == 2
+    cached.embed_query("a")
+    assert embeddings.calls == 3
+    cached.embed_query("bb")
+    assert embeddings.calls == 4
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    embeddings = CountingEmbeddings()
+    cache = QueryEmbeddingCache(max_size=10, ttl=60, clock=clock)
+    cached = CachedQueryEmbeddings(embeddings, cache)
+    cached.embed_query("question")
+    clock.now = 59
+    cached.embed_query("question")
+    assert embeddings.calls == 1
+    clock.now = 121
+    cached.embed_query("question")
+    assert embeddings.calls == 2
+
+
+def test_cache_keys_are_namespaced_by_model():
+    cache = QueryEmbeddingCache(max_size=10)
+    first = CountingEmbeddings()
+    second = CountingEmbeddings()
+    second.model = "other-model"
+    CachedQueryEmbeddings(first, cache).embed_query("question")
+    CachedQueryEmbeddings(second, cache).embed_query("question")
+    assert first.calls == 1 and second.calls == 1
+
+
+def test_batch_embeds_only_misses_in_one_call():
+    embeddings = CountingEmbeddings()
+    cached = CachedQueryEmbeddings(embeddings, QueryEmbeddingCache(max_size=10))
+    cached.embed_query("known")
+    vectors = asyncio.run(cached.aembed_queries(["new", "known", "newer"]))
+    assert vectors == [[3.0], [5.0], [5.0]]
+    assert embeddings.calls == 1
+    assert embeddings.document_calls == 1
+    assert cached.cache.stats()["size"] == 3
+
+
+def test_cached_vector_does_not_depend_on_the_first_spelling():
+    normalized = "what did alice say?"
+    for first in ("  What did ALICE   say?", normalized):
+        cached = CachedQueryEmbeddings(
+            CountingEmbeddings(), QueryEmbeddingCache(max_size=10)
+        )
+        assert cached.embed_query(first) == [float(len(normalized))]
+        assert asyncio.run(cached.aembed_queries(["What  did Alice say?"])) == [
+            [float(len(normalized))]
+        ]
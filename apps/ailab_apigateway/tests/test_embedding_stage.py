@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+from ailab_apigateway.utilities.indexer_utils.embedding_stage import (
+    embed_in_batches,
+    embed_with_retry,
+)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class FlakyEmbeddings(Embeddings):
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise RateLimitError("429 Too Many Requests")
+            self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_batches_are_yielded_in_input_order():
+    chunks = [Document(page_content="x" * n) for n in range(1, 11)]
+    embeddings = FlakyEmbeddings()
+    batches = list(
+        embed_in_batches(chunks, embeddings, batch_size=3, max_concurrency=2)
+    )
+    assert [len(documents) for documents, _ in batches] == [3, 3, 3, 1]
+    vectors = [vector for _, batch_vectors in batches for vector in batch_vectors]
+    assert vectors == [[float(n)] for n in range(1, 11)]
+
+
+def test_throttled_batch_is_retried_with_backoff():
+    embeddings = FlakyEmbeddings(failures=2)
+    delays = []
+    vectors = embed_with_retry(embeddings, ["abc"], sleep=delays.append)
+    assert vectors == [[3.0]]
+    assert len(delays) == 2
+
+
+def test_throttling_beyond_max_retries_is_raised():
+    embeddings = FlakyEmbeddings(failures=3)
+    with pytest.raises(RateLimitError):
+        embed_with_retry(embeddings, ["abc"], max_retries=2, sleep=lambda _: None)
+
+
+def test_other_errors_are_not_retried():
+    class BrokenEmbeddings(FlakyEmbeddings):
+        def embed_documents(self, texts):
+            raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        embed_with_retry(BrokenEmbeddings(), ["abc"], sleep=lambda _: None)
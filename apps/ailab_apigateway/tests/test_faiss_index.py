@@ -0,0 +1,99 @@
+import numpy as np
+from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+from ailab_apigateway.utilities.indexer_utils.chunk_hashes import CHUNK_HASH_KEY
+from ailab_apigateway.utilities.indexer_utils.vector_writers import FAISSWriter
+from ailab_apigateway.utilities.retriever_utils.faiss_index import tune_faiss_index
+
+DIMENSION = 8
+
+
+class RandomEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int(text.split("-")[1])
+        return np.random.default_rng(seed).random(DIMENSION).tolist()
+
+
+def make_batch(start, size):
+    documents = [
+        Document(
+            page_content=f"chunk-{i}",
+            metadata={"source": "doc.txt", CHUNK_HASH_KEY: f"id-{i}"},
+        )
+        for i in range(start, start + size)
+    ]
+    vectors = RandomEmbeddings().embed_documents(
+        [doc.page_content for doc in documents]
+    )
+    return documents, vectors
+
+
+def make_writer(spec, training_size=1000):
+    writer = FAISSWriter(RandomEmbeddings(), override=True)
+    writer.index_spec = spec
+    writer.training_size = training_size
+    return writer
+
+
+def test_trained_index_holds_back_vectors_until_training():
+    writer = make_writer("IVF4,Flat", training_size=300)
+    writer.write(*make_batch(0, 200))
+    assert writer.index is None
+    assert writer._untrained_vectors.shape == (300, DIMENSION)
+    assert writer._untrained_vectors.dtype == np.float32
+    writer.write(*make_batch(200, 200))
+    assert writer.index.index.is_trained
+    writer.write(*make_batch(400, 100))
+    store = writer.finish()
+    assert store.index.ntotal == 500
+    tune_faiss_index(store.index, nprobe=4)
+    assert store.similarity_search("chunk-42", k=1)[0].page_content == "chunk-42"
+
+
+def test_small_corpus_is_trained_at_finish():
+    writer = make_writer("IVF2,Flat")
+    writer.write(*make_batch(0, 100))
+    assert writer.finish().index.ntotal == 100
+
+
+def test_empty_corpus_gives_no_index():
+    # the indexer then skips the save
+    assert make_writer("IVF2,Flat").finish() is None
+
+
+def test_hnsw_index_is_rebuilt_on_delete():
+    writer = make_writer("HNSW8")
+    writer.write(*make_batch(0, 50))
+    writer.delete({"id-3", "id-7"})
+    store = writer.finish()
+    assert store.index.ntotal == 48
+    assert "id-3" not in set(store.index_to_docstore_id.values())
+    tune_faiss_index(store.index, nprobe=4, ef_search=32)
+    assert store.similarity_search("chunk-10", k=1)[0].page_content == "chunk-10"
+
+
+def test_ivf_index_is_rebuilt_on_delete():
+    writer = make_writer("IVF8,Flat", training_size=400)
+    writer.write(*make_batch(0, 400))
+    writer.delete({f"id-{i}" for i in range(100)})
+    writer.write(*make_batch(400, 50))
+    store = writer.finish()
+    assert store.index.ntotal == 350
+    tune_faiss_index(store.index, nprobe=8)
+    for i in (100, 399, 449):
+        found = store.similarity_search(f"chunk-{i}", k=1)[0]
+        assert found.page_content == f"chunk-{i}"
+    assert store.similarity_search("chunk-5", k=1)[0].page_content != "chunk-5"
+
+
+def test_flat_index_deletes_in_place():
+    writer = make_writer("Flat")
+    writer.write(*make_batch(0, 50))
+    writer.delete({"id-3"})
+    store = writer.finish()
+    assert store.index.ntotal == 49
+    assert store.similarity_search("chunk-40", k=1)[0].page_content == "chunk-40"
@@ -0,0 +1,123 @@
+import random
+
+from ailab_apigateway.utilities.indexer_utils.ingestion import (
+    START_INDEX_KEY,
+    iter_chunks,
+    resolve_document_paths,
+    split_file,
+    stream_split_file,
+)
+
+
+def write_docs(tmp_path):
+    (tmp_path / "notes").mkdir()
+    paths = {
+        "a.txt": "alpha " * 50,
+        "notes/b.md": "beta " * 50,
+        "notes/c.txt": "gamma " * 50,
+        "notes/skip.csv": "delta",
+    }
+    for name, text in paths.items():
+        (tmp_path / name).write_text(text)
+    return tmp_path
+
+
+def test_directories_globs_and_files_are_resolved(tmp_path):
+    root = write_docs(tmp_path)
+    assert resolve_document_paths(str(root / "notes")) == [
+        str(root / "notes" / "b.md"),
+        str(root / "notes" / "c.txt"),
+    ]
+    assert resolve_document_paths(
+        [str(root / "**" / "*.txt"), str(root / "a.txt")]
+    ) == [str(root / "a.txt"), str(root / "notes" / "c.txt")]
+
+
+def test_chunks_of_all_files_keep_their_source(tmp_path):
+    root = write_docs(tmp_path)
+    paths = resolve_document_paths(str(root))
+    chunks = list(iter_chunks(paths, chunk_size=100, overlap=10, workers=2))
+    sources = {doc.metadata["source"] for doc in chunks}
+    assert sources == set(paths)
+    for doc in chunks:
+        word = {"a.txt": "alpha", "b.md": "beta", "c.txt": "gamma"}[
+            doc.metadata["source"].rsplit("/", 1)[-1]
+        ]
+        assert set(doc.page_content.split()) == {word}
+
+
+def mixed_text(seed=0):
+    # repeated words and words inside others, where a plain search for a chunk can
+    # match the wrong place
+    rng = random.Random(seed)
+    words = ["Zeta", "eta", "eta289", "the", "and", "lorem", "ipsum"]
+    paragraphs = [
+        "\n".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+            for _ in range(rng.randint(1, 6))
+        )
+        for _ in range(60)
+    ]
+    return "\n\n".join(paragraphs + paragraphs[:20])
+
+
+def spans(documents):
+    return [
+        (
+            doc.metadata[START_INDEX_KEY],
+            doc.metadata[START_INDEX_KEY] + len(doc.page_content),
+        )
+        for doc in documents
+    ]
+
+
+def test_streaming_split_matches_the_whole_file_split(tmp_path):
+    path = tmp_path / "large.txt"
+    for seed in range(3):
+        text = mixed_text(seed)
+        path.write_text(text)
+        whole = split_file(str(path), chunk_size=120, overlap=0)
+        for window_size in (50, 120, 333, 1000, len(text) + 1):
+            streamed = list(
+                stream_split_file(str(path), 120, overlap=0, window_size=window_size)
+            )
+            assert all(len(doc.page_content) <= 120 for doc in streamed)
+            assert {doc.metadata["source"] for doc in streamed} == {str(path)}
+            for chunks in (whole, streamed):
+                # without overlap no text is repeated or lost, chunks start at words
+                assert all(
+                    start >= end
+                    for (_, end), (start, _) in zip(spans(chunks), spans(chunks)[1:])
+                )
+                assert " ".join(doc.page_content for doc in chunks).split() == (
+                    text.split()
+                )
+                assert all(
+                    start == 0 or text[start - 1].isspace()
+                    for start, _ in spans(chunks)
+                )
+            if window_size > len(text):
+                assert [doc.page_content for doc in streamed] == [
+                    doc.page_content for doc in whole
+                ]
+    # with overlap, a window larger than the file splits exactly as the whole file
+    whole = split_file(str(path), chunk_size=120, overlap=30)
+    assert [doc.page_content for doc in stream_split_file(str(path), 120, 30)] == [
+        doc.page_content for doc in whole
+    ]
+
+
+def test_chunks_record_their_offset_in_the_file(tmp_path):
+    paragraphs = [" ".join(f"word{p}x{w}" for w in range(40)) for p in range(30)]
+    for name, text, chunk_size in (
+        ("large.txt", "\n\n".join(paragraphs), 200),
+        ("mixed.txt", mixed_text(), 120),
+    ):
+        path = tmp_path / name
+        path.write_text(text)
+        for chunks in (
+            split_file(str(path), chunk_size, overlap=30),
+            list(stream_split_file(str(path), chunk_size, 30, window_size=500)),
+        ):
+            for doc, (start, end) in zip(chunks, spans(chunks)):
+                assert text[start:end] == doc.page_content
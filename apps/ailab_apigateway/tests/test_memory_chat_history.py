@@ -0,0 +1,86 @@
+import asyncio
+
+from langchain.schema.messages import AIMessage, HumanMessage
+
+from ailab_apigateway.utilities.memory_chat_history import (
+    MESSAGE_OVERHEAD_BYTES,
+    InMemoryChatMessageHistory,
+    InMemoryChatStore,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def turn(n):
+    return [HumanMessage(content=f"question {n}"), AIMessage(content=f"answer {n}")]
+
+
+def test_sessions_keep_their_newest_messages():
+    store = InMemoryChatStore(max_messages=4)
+    history = InMemoryChatMessageHistory("alice", store)
+
+    async def run():
+        for n in range(1, 4):
+            await history.aadd_messages(turn(n))
+        return await history.aget_buffer_string()
+
+    assert asyncio.run(run()) == (
+        "Human: question 2\nAI: answer 2\nHuman: question 3\nAI: answer 3"
+    )
+    assert asyncio.run(InMemoryChatMessageHistory("bob", store).aget_messages()) == []
+
+
+def test_least_recently_used_sessions_are_evicted_beyond_the_budget():
+    turn_bytes = len("question 1") + len("answer 1") + 2 * MESSAGE_OVERHEAD_BYTES
+    store = InMemoryChatStore(max_bytes=2 * turn_bytes)
+    alice, bob, carol = (
+        InMemoryChatMessageHistory(name, store) for name in ("alice", "bob", "carol")
+    )
+
+    async def run():
+        await alice.aadd_messages(turn(1))
+        await bob.aadd_messages(turn(2))
+        # reading alice makes bob the least recently used session
+        await alice.aget_messages()
+        await carol.aadd_messages(turn(3))
+        return [len(await history.aget_messages()) for history in (alice, bob, carol)]
+
+    assert asyncio.run(run()) == [2, 0, 2]
+    assert store.stats()["bytes"] == 2 * turn_bytes
+    assert store.stats()["evictions"] == 1
+
+
+def test_idle_sessions_expire():
+    clock = FakeClock()
+    store = InMemoryChatStore(ttl=60, clock=clock)
+    history = InMemoryChatMessageHistory("alice", store)
+    asyncio.run(history.aadd_messages(turn(1)))
+    clock.now = 30
+    assert len(asyncio.run(history.aget_messages())) == 2
+    clock.now = 100
+    assert asyncio.run(history.aget_messages()) == []
+    assert store.stats()["bytes"] == 0
+
+
+def test_older_turns_are_folded_into_the_summary():
+    history = InMemoryChatMessageHistory("alice", InMemoryChatStore(max_messages=4))
+
+    async def summarize(summary, new_lines):
+        return (summary + " | " + new_lines.replace("\n", " ")).strip(" |")
+
+    async def run():
+        for n in range(1, 4):
+            await history.aadd_messages(turn(n))
+            await history.afold_history(summarize, max_turns=1)
+        return await history.aget_window_buffer_string(max_turns=1)
+
+    assert asyncio.run(run()) == (
+        "System: Human: question 1 AI: answer 1 | Human: question 2 AI: answer 2\n"
+        "Human: question 3\nAI: answer 3"
+    )
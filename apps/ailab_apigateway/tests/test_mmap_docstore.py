@@ -0,0 +1,97 @@
+import os
+
+from langchain.docstore.in_memory import InMemoryDocstore
+
+from ailab_apigateway.utilities.retriever_utils.mmap_docstore import (
+    DOCSTORE_FILE,
+    LEGACY_DOCSTORE_FILE,
+    VERSIONS_DIR,
+    MmapDocstore,
+    faiss_files_path,
+    load_faiss,
+    save_faiss,
+)
+from tests.conftest import WordEmbeddings, make_faiss_store
+
+
+def make_store():
+    texts = ["alpha alpha", "beta", "gamma délta", "delta beta"]
+    return make_faiss_store(texts, sources=[f"doc{i % 2}.txt" for i in range(4)])
+
+
+def test_saved_store_answers_like_the_original(tmp_path):
+    store = make_store()
+    save_faiss(store, str(tmp_path))
+    loaded = load_faiss(str(tmp_path), WordEmbeddings())
+    assert isinstance(loaded.docstore, MmapDocstore)
+    for query in ["alpha", "beta", "gamma délta"]:
+        assert loaded.similarity_search_with_score(
+            query, k=2
+        ) == store.similarity_search_with_score(query, k=2)
+    assert loaded.docstore.search("id-2").metadata == {
+        "source": "doc0.txt",
+        "chunk_hash": "id-2",
+    }
+    assert loaded.docstore.search("missing") == "ID missing not found."
+
+
+def test_metadata_shared_by_chunks_is_stored_once(tmp_path):
+    save_faiss(make_store(), str(tmp_path))
+    docstore = MmapDocstore(
+        os.path.join(faiss_files_path(str(tmp_path)), DOCSTORE_FILE)
+    )
+    assert len(docstore._metadata) == 2
+
+
+def test_writable_load_can_be_updated(tmp_path):
+    save_faiss(make_store(), str(tmp_path))
+    store = load_faiss(str(tmp_path), WordEmbeddings(), writable=True)
+    assert isinstance(store.docstore, InMemoryDocstore)
+    store.delete(["id-0"])
+    store.add_texts(["alpha beta"], ids=["id-4"])
+    save_faiss(store, str(tmp_path))
+    loaded = load_faiss(str(tmp_path), WordEmbeddings())
+    assert set(loaded.index_to_docstore_id.values()) == {"id-1", "id-2", "id-3", "id-4"}
+    assert loaded.similarity_search("alpha", k=1)[0].page_content == "alpha beta"
+
+
+def test_saves_swap_in_a_new_version(tmp_path):
+    store = make_store()
+    save_faiss(store, str(tmp_path))
+    first = load_faiss(str(tmp_path), WordEmbeddings())
+    first_path = faiss_files_path(str(tmp_path))
+    store.delete(["id-0"])
+    save_faiss(store, str(tmp_path))
+    assert faiss_files_path(str(tmp_path)) != first_path
+    loaded = load_faiss(str(tmp_path), WordEmbeddings())
+    assert "id-0" not in set(loaded.index_to_docstore_id.values())
+    # a store loaded before keeps reading its own, complete version
+    assert first.similarity_search("alpha", k=1)[0].page_content == "alpha alpha"
+    save_faiss(store, str(tmp_path))
+    # the current and the previous version are kept
+    assert len(os.listdir(os.path.join(tmp_path, VERSIONS_DIR))) == 2
+    assert not os.path.exists(first_path)
+
+
+def test_pickled_index_is_still_loaded(tmp_path):
+    make_store().save_local(str(tmp_path))
+    loaded = load_faiss(str(tmp_path), WordEmbeddings())
+    assert loaded.similarity_search("gamma", k=1)[0].page_content == "gamma délta"
+    save_faiss(loaded, str(tmp_path))
+    assert not os.path.exists(os.path.join(tmp_path, LEGACY_DOCSTORE_FILE))
+
+
+def test_start_indexes_are_stored_as_a_column(tmp_path):
+    store = make_store()
+    for row, doc_id in store.index_to_docstore_id.items():
+        store.docstore.search(doc_id).metadata["start_index"] = row * 10
+    save_faiss(store, str(tmp_path))
+    docstore = MmapDocstore(
+        os.path.join(faiss_files_path(str(tmp_path)), DOCSTORE_FILE)
+    )
+    assert len(docstore._metadata) == 2
+    assert docstore.search("id-3").metadata == {
+        "source": "doc1.txt",
+        "chunk_hash": "id-3",
+        "start_index": 30,
+    }
@@ -0,0 +1,56 @@
+import numpy as np
+from langchain.vectorstores.faiss import FAISS
+from langchain_core.embeddings import Embeddings
+
+from ailab_apigateway.utilities.retriever_utils.mmr import (
+    maximal_marginal_relevance,
+    mmr_search,
+)
+
+VECTORS = {
+    "Alice met Bob on Monday.": [1.0, 0.0, 0.0],
+    "Alice met Bob on Monday, at noon.": [0.99, 0.1, 0.0],
+    "Alice met Bob on Monday, at the park.": [0.98, 0.15, 0.0],
+    "Alice and Carol went fishing.": [0.7, 0.0, 0.7],
+    "Dave baked bread.": [0.0, 1.0, 0.0],
+}
+
+
+class TableEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS.get(text, [1.0, 0.0, 0.1])
+
+
+def test_relevance_only_keeps_the_similarity_order():
+    candidates = np.array(list(VECTORS.values()))
+    query = np.array([1.0, 0.0, 0.1])
+    relevance = candidates @ query / np.linalg.norm(candidates, axis=1)
+    assert maximal_marginal_relevance(query, candidates, 3, lambda_mult=1.0) == list(
+        np.argsort(-relevance)[:3]
+    )
+
+
+def test_near_duplicates_give_way_to_other_chunks():
+    candidates = np.array(list(VECTORS.values()))
+    selected = maximal_marginal_relevance([1.0, 0.0, 0.1], candidates, 2, 0.5)
+    assert selected == [0, 3]
+
+
+def test_mmr_search_on_faiss():
+    store = FAISS.from_texts(list(VECTORS), TableEmbeddings())
+    [results] = mmr_search(store, [[1.0, 0.0, 0.1]], k=2, fetch_k=5, lambda_mult=0.5)
+    assert [doc.page_content for doc, _ in results] == [
+        "Alice met Bob on Monday.",
+        "Alice and Carol went fishing.",
+    ]
+    [results] = mmr_search(
+        store, [[1.0, 0.0, 0.1]], k=2, threshold=0.05, fetch_k=5, lambda_mult=0.5
+    )
+    # the fishing chunk is over the threshold, the most different of the rest wins
+    assert [doc.page_content for doc, _ in results] == [
+        "Alice met Bob on Monday.",
+        "Alice met Bob on Monday, at the park.",
+    ]
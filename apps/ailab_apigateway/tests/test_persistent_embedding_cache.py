@@ -0,0 +1,53 @@
+from ailab_apigateway.utilities.persistent_embedding_cache import (
+    PersistentCachedEmbeddings,
+    PersistentEmbeddingCache,
+)
+from tests.conftest import CountingEmbeddings
+
+
+def test_vectors_survive_a_new_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first_run = CountingEmbeddings()
+    cached = PersistentCachedEmbeddings(first_run, PersistentEmbeddingCache(path))
+    cached.embed_documents(["alpha", "beta"])
+
+    second_run = CountingEmbeddings()
+    cached = PersistentCachedEmbeddings(second_run, PersistentEmbeddingCache(path))
+    vectors = cached.embed_documents(["beta", "gamma", "alpha"])
+    assert vectors == [[4.0], [5.0], [5.0]]
+    assert second_run.embedded == ["gamma"]
+
+
+def test_prune_keeps_most_recently_used(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many("model", ["old"], [[1.0]])
+    cache.put_many("model", ["new"], [[2.0]])
+    assert cache.prune(max_entries=1) == 1
+    cache.compact()
+    assert cache.get_many("model", ["old", "new"]) == [None, [2.0]]
+
+
+def test_vectors_are_namespaced_by_model(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many("model-a", ["text"], [[1.0]])
+    assert cache.get_many("model-b", ["text"]) == [None]
+
+
+def test_lookups_only_read_and_defer_use_times(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many("model", ["old", "new"], [[1.0], [2.0]])
+    changes = cache._conn.total_changes
+    assert cache.get_many("model", ["old", "missing"]) == [[1.0], None]
+    assert cache._conn.total_changes == changes
+    # the deferred use of "old" is written before pruning, so "new" goes
+    cache._conn.execute("UPDATE embeddings SET last_used = 0")
+    assert cache.prune(max_entries=1) == 1
+    assert cache.get_many("model", ["old", "new"]) == [[1.0], None]
+
+
+def test_use_times_are_written_after_the_touch_interval(tmp_path):
+    cache = PersistentEmbeddingCache(str(tmp_path / "cache.sqlite3"), touch_interval=0)
+    cache.put_many("model", ["text"], [[1.0]])
+    changes = cache._conn.total_changes
+    cache.get_many("model", ["text"])
+    assert cache._conn.total_changes == changes + 1
@@ -0,0 +1,213 @@
+import json
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy
+from langchain.vectorstores.pgvector import DistanceStrategy
+from sqlalchemy.orm import Session
+
+from ailab_apigateway.utilities.indexer_utils import pgvector_index
+from ailab_apigateway.utilities.indexer_utils.pgvector_index import (
+    _is_current,
+    ann_index_name,
+    ann_index_options,
+    create_ann_index_sql,
+    ensure_ann_index,
+    ivfflat_lists,
+)
+
+COLLECTION_ID = "0b4f0a3c-6a0e-4b57-9a1d-5f6c7d8e9f00"
+ORPHAN_ID = "7d1e2f3a-4b5c-4d6e-8f7a-9b0c1d2e3f4a"
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def all(self):
+        return self.rows
+
+    def one(self):
+        return self.rows[0]
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+
+class FakeDatabase:
+    # the catalog queries of ensure_ann_index, answered from a few attributes
+    def __init__(self, rows=10, dimension=8, comment=None, index_names=()):
+        self.rows = rows
+        self.dimension = dimension
+        self.comment = comment
+        self.index_names = list(index_names)
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT uuid FROM langchain_pg_collection"):
+            return FakeResult([(uuid.UUID(COLLECTION_ID),)])
+        if sql.startswith("SELECT indexname FROM pg_indexes"):
+            return FakeResult([(name,) for name in self.index_names])
+        if sql.startswith("SELECT count(*)"):
+            return FakeResult([(self.rows, self.dimension)])
+        if sql.startswith("SELECT obj_description"):
+            return FakeResult([(self.comment,)])
+        return FakeResult([])
+
+    def ddl(self):
+        return [sql for sql, _ in self.statements if not sql.startswith("SELECT")]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+
+    class FakeSession:
+        def __init__(self, bind):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def execute(self, statement, params=None):
+            return database.execute(statement, params)
+
+        def commit(self):
+            database.commits += 1
+
+    monkeypatch.setattr(pgvector_index, "Session", FakeSession)
+    return database
+
+
+def fake_vectorstore():
+    collection = SimpleNamespace(uuid=uuid.UUID(COLLECTION_ID))
+    return SimpleNamespace(
+        _conn=None,
+        _distance_strategy=DistanceStrategy.COSINE,
+        get_collection=lambda session: collection,
+    )
+
+
+def test_index_names_fit_postgres_identifiers():
+    for method in ("hnsw", "ivfflat"):
+        assert len(ann_index_name(method, COLLECTION_ID)) <= 63
+
+
+def test_ivfflat_lists_follow_collection_size():
+    assert ivfflat_lists(500) == 10
+    assert ivfflat_lists(200_000) == 200
+    assert ivfflat_lists(4_000_000) == 2000
+    assert ann_index_options("ivfflat", 200_000, 16, 64, lists=0) == "lists = 200"
+    assert ann_index_options("ivfflat", 200_000, 16, 64, lists=50) == "lists = 50"
+
+
+def test_index_is_built_on_the_cast_embedding_of_one_collection():
+    sql = create_ann_index_sql(
+        "idx",
+        "hnsw",
+        1536,
+        "vector_cosine_ops",
+        ann_index_options("hnsw", 10, 16, 64, 0),
+        COLLECTION_ID,
+    )
+    assert "USING hnsw ((embedding::vector(1536)) vector_cosine_ops)" in sql
+    assert "WITH (m = 16, ef_construction = 64)" in sql
+    assert sql.endswith(f"WHERE collection_id = '{COLLECTION_ID}'")
+
+
+def test_auto_sized_ivfflat_index_is_rebuilt_when_the_collection_doubles():
+    built = {"dimension": 8, "options": "lists = 10", "lists": 0, "rows": 1000}
+    wanted = {"dimension": 8, "options": "lists = 10", "lists": 0}
+    assert _is_current("ivfflat", built, wanted, rows=1500)
+    assert not _is_current("ivfflat", built, wanted, rows=2500)
+    assert not _is_current("ivfflat", built, {**wanted, "dimension": 16}, rows=1000)
+
+
+def test_hnsw_index_is_rebuilt_when_its_options_change():
+    built = {"dimension": 8, "options": "m = 16, ef_construction = 64", "lists": 0}
+    assert _is_current("hnsw", {**built, "rows": 10}, built, rows=10_000)
+    changed = {**built, "options": "m = 32, ef_construction = 64"}
+    assert not _is_current("hnsw", {**built, "rows": 10}, changed, rows=10)
+
+
+def test_missing_hnsw_index_is_created_and_its_definition_recorded(database):
+    name = ensure_ann_index(fake_vectorstore(), "hnsw")
+    assert name == ann_index_name("hnsw", COLLECTION_ID)
+    ddl = database.ddl()
+    assert ddl[-2] == (
+        f"CREATE INDEX {name} ON langchain_pg_embedding "
+        "USING hnsw ((embedding::vector(8)) vector_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64) "
+        f"WHERE collection_id = '{COLLECTION_ID}'"
+    )
+    assert ddl[-1] == f"COMMENT ON INDEX {name} IS :definition"
+    definition = json.loads(database.statements[-1][1]["definition"])
+    assert definition == {
+        "dimension": 8,
+        "options": "m = 16, ef_construction = 64",
+        "lists": 0,
+        "rows": 10,
+    }
+    assert database.commits == 1
+
+
+def test_current_index_is_only_analyzed(database):
+    database.comment = json.dumps(
+        {
+            "dimension": 8,
+            "options": "m = 16, ef_construction = 64",
+            "lists": 0,
+            "rows": 2,
+        }
+    )
+    ensure_ann_index(fake_vectorstore(), "hnsw")
+    assert database.ddl() == ["ANALYZE langchain_pg_embedding"]
+
+
+def test_other_methods_drop_the_index_and_orphans(database):
+    orphan = ann_index_name("ivfflat", ORPHAN_ID)
+    database.index_names = [ann_index_name("hnsw", COLLECTION_ID), orphan]
+    assert ensure_ann_index(fake_vectorstore(), "none") is None
+    assert database.ddl() == [
+        f"DROP INDEX IF EXISTS {orphan}",
+        f"DROP INDEX IF EXISTS {ann_index_name('hnsw', COLLECTION_ID)}",
+        f"DROP INDEX IF EXISTS {ann_index_name('ivfflat', COLLECTION_ID)}",
+    ]
+
+
+@pytest.mark.skipif(not os.environ.get("PG_TEST_URL"), reason="PG_TEST_URL is not set")
+def test_hnsw_index_is_built_in_postgres():
+    from langchain.embeddings import FakeEmbeddings
+    from langchain.vectorstores.pgvector import PGVector
+
+    vectorstore = PGVector.from_texts(
+        [f"text {i}" for i in range(20)],
+        FakeEmbeddings(size=8),
+        collection_name=f"test_ann_{uuid.uuid4().hex}",
+        connection_string=os.environ["PG_TEST_URL"],
+        pre_delete_collection=True,
+    )
+    try:
+        name = ensure_ann_index(vectorstore, "hnsw")
+        with Session(vectorstore._conn) as session:
+            definition = session.execute(
+                sqlalchemy.text(
+                    "SELECT indexdef FROM pg_indexes WHERE indexname = :name"
+                ),
+                {"name": name},
+            ).scalar()
+        assert "USING hnsw" in definition
+        assert ensure_ann_index(vectorstore, "none") is None
+    finally:
+        vectorstore.delete_collection()
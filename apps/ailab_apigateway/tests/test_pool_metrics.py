@@ -0,0 +1,41 @@
+import pytest
+import sqlalchemy
+
+from ailab_apigateway.utilities.retriever_utils.pool_metrics import (
+    PoolWaitMetrics,
+    pool_stats,
+    timed_queue_pool,
+)
+
+
+def make_engine(tmp_path, metrics):
+    return sqlalchemy.create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=timed_queue_pool(metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+
+
+def test_checkouts_and_timeouts_are_recorded(tmp_path):
+    metrics = PoolWaitMetrics()
+    engine = make_engine(tmp_path, metrics)
+    with engine.connect():
+        assert pool_stats(engine.pool, metrics)["checked_out"] == 1
+        with pytest.raises(sqlalchemy.exc.TimeoutError):
+            engine.connect()
+    with engine.connect():
+        pass
+    stats = metrics.stats()
+    assert (stats["checkouts"], stats["timeouts"]) == (2, 1)
+    assert sum(stats["wait_histogram"].values()) == 2
+
+
+def test_metrics_survive_dispose(tmp_path):
+    metrics = PoolWaitMetrics()
+    engine = make_engine(tmp_path, metrics)
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert metrics.checkouts == 1
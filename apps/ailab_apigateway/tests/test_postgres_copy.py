@@ -0,0 +1,134 @@
+import csv
+import json
+
+import pytest
+from langchain.schema.document import Document
+
+from ailab_apigateway.utilities.indexer_utils.postgres_methods import (
+    copy_insert_embeddings,
+    delete_embeddings,
+    embedding_copy_rows,
+)
+from ailab_apigateway.utilities.indexer_utils.vector_writers import PGVectorWriter
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement, parameters=None):
+        if self.connection.fail_on and self.connection.fail_on in statement:
+            raise RuntimeError("statement failed")
+        self.connection.statements.append(statement)
+        self.connection.parameters.append(parameters)
+
+    def copy_expert(self, statement, file):
+        self.execute(statement)
+        self.connection.copied = file.read()
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.statements = []
+        self.parameters = []
+        self.copied = None
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+    disposed = False
+
+    def dispose(self):
+        self.disposed = True
+
+
+DOCUMENTS = [
+    Document(
+        page_content='a "quoted", multi\nline\ttext', metadata={"source": "a.txt"}
+    ),
+    Document(page_content="plain", metadata={}),
+]
+VECTORS = [[0.5, -1.0], [1e-07, 2.0]]
+
+
+def test_copy_rows_survive_csv_quoting():
+    rows = list(
+        csv.reader(embedding_copy_rows("collection", DOCUMENTS, VECTORS, ["x", "y"]))
+    )
+    assert [row[1:] for row in rows] == [
+        [
+            "collection",
+            "[0.5,-1.0]",
+            DOCUMENTS[0].page_content,
+            '{"source": "a.txt"}',
+            "x",
+        ],
+        ["collection", "[1e-07,2.0]", "plain", "{}", "y"],
+    ]
+    assert json.loads(rows[0][4]) == DOCUMENTS[0].metadata
+
+
+def test_batch_is_copied_in_one_transaction():
+    connection = FakeConnection()
+    copy_insert_embeddings(connection, "collection", DOCUMENTS, VECTORS, ["x", "y"])
+    # no DELETE of existing ids, it would scan the whole table per batch
+    assert connection.statements == [
+        "COPY langchain_pg_embedding "
+        "(uuid, collection_id, embedding, document, cmetadata, custom_id) "
+        "FROM STDIN WITH (FORMAT csv)"
+    ]
+    assert connection.copied.count("collection") == 2
+    assert (connection.commits, connection.rollbacks) == (1, 0)
+
+
+def test_failed_batch_is_rolled_back():
+    connection = FakeConnection(fail_on="COPY")
+    with pytest.raises(RuntimeError):
+        copy_insert_embeddings(connection, "collection", DOCUMENTS, VECTORS, ["x", "y"])
+    assert (connection.commits, connection.rollbacks) == (0, 1)
+
+
+def test_deletes_are_limited_to_the_collection():
+    connection = FakeConnection()
+    delete_embeddings(connection, "collection", ["x", "y"])
+    assert "collection_id = %s AND custom_id = ANY(%s)" in connection.statements[0]
+    assert connection.parameters == [("collection", ["x", "y"])]
+    assert (connection.commits, connection.rollbacks) == (1, 0)
+
+
+def test_writer_releases_its_connection_when_a_batch_fails():
+    # the writer without its PGVector store, which needs a database
+    writer = PGVectorWriter.__new__(PGVectorWriter)
+    writer.collection_id = "collection"
+    writer._engine = FakeEngine()
+    writer._connection = connection = FakeConnection(fail_on="COPY")
+    writer._pending = [
+        (Document(page_content="text", metadata={"chunk_hash": "x"}), [0.5])
+    ]
+    with pytest.raises(RuntimeError):
+        writer.finish()
+    assert connection.closed and writer._engine.disposed
+    assert connection.commits == 0 and connection.rollbacks >= 1
+    # closing again, as the indexer does, is a no-op
+    writer.close()
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from ailab_apigateway.utilities.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute(question):
+        calls.append(question)
+        await asyncio.sleep(0.01)
+        return f"answer to {question}"
+
+    async def run():
+        results = await asyncio.gather(
+            *(flights.run(q, lambda q=q: compute(q)) for q in ["a", "a", "b", "a"])
+        )
+        # the key is forgotten once answered
+        assert len(flights) == 0
+        results.append(await flights.run("a", lambda: compute("a")))
+        return results
+
+    assert (
+        asyncio.run(run())
+        == ["answer to a"] * 2 + ["answer to b"] + ["answer to a"] * 2
+    )
+    assert calls == ["a", "b", "a"]
+    assert flights.shared == 2
+
+
+def test_failures_and_cancellations_reach_the_right_callers():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model unavailable")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def run():
+        failures = await asyncio.gather(
+            flights.run("x", fail), flights.run("x", fail), return_exceptions=True
+        )
+        assert [str(error) for error in failures] == ["model unavailable"] * 2
+        # the first caller goes away, the second still gets the answer
+        first = asyncio.ensure_future(flights.run("y", slow))
+        second = asyncio.ensure_future(flights.run("y", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "answer"
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ailab_apigateway.utilities.retriever_utils.vectorstore_registry import (
+    VectorStoreRegistry,
+)
+
+
+class FakeIndex:
+    def __init__(self):
+        self.version = "v1"
+        self.loads = 0
+
+    def loader(self):
+        self.loads += 1
+        return {"version": self.version}
+
+    def fingerprint(self):
+        return self.version
+
+
+def test_store_is_loaded_once_and_shared():
+    index = FakeIndex()
+    registry = VectorStoreRegistry(loader=index.loader, fingerprint=index.fingerprint)
+    first = registry.get()
+    assert registry.get() is first
+    assert registry.reload_if_changed() is False
+    assert index.loads == 1
+
+
+def test_store_is_swapped_when_index_changes():
+    index = FakeIndex()
+    registry = VectorStoreRegistry(loader=index.loader, fingerprint=index.fingerprint)
+    old_store = registry.get()
+    index.version = "v2"
+    assert registry.reload_if_changed() is True
+    assert registry.get() is not old_store
+    assert registry.get()["version"] == "v2"
+    # a query holding the previous store keeps a complete, unchanged index
+    assert old_store["version"] == "v1"
+
+
+def test_failed_reload_keeps_current_store():
+    index = FakeIndex()
+    registry = VectorStoreRegistry(loader=index.loader, fingerprint=index.fingerprint)
+    store = registry.get()
+    index.version = "broken"
+
+    def failing_loader():
+        raise OSError("index.pkl truncated")
+
+    registry.loader = failing_loader
+    assert registry.reload_if_changed() is False
+    assert registry.get() is store
+
+
+def test_store_is_not_swapped_while_the_index_changes():
+    index = FakeIndex()
+    registry = VectorStoreRegistry(loader=index.loader, fingerprint=index.fingerprint)
+    store = registry.get()
+
+    def rewriting_loader():
+        # the indexer replaces the files while they are loaded
+        index.version += "+"
+        return {"version": "torn"}
+
+    registry.loader = rewriting_loader
+    index.version = "v2"
+    assert registry.reload_if_changed() is False
+    assert registry.get() is store
+    assert registry.loaded_fingerprint == "v1"
+    # a load seeing the same index before and after is swapped in
+    registry.loader = index.loader
+    assert registry.reload_if_changed() is True
+    assert registry.get()["version"] == index.version
+    assert registry.loaded_fingerprint == index.version
+
+
+def test_concurrent_first_gets_load_once():
+    index = FakeIndex()
+
+    def slow_loader():
+        time.sleep(0.05)
+        return index.loader()
+
+    registry = VectorStoreRegistry(loader=slow_loader, fingerprint=index.fingerprint)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        stores = list(executor.map(lambda _: registry.get(), range(8)))
+    assert index.loads == 1
+    assert all(store is stores[0] for store in stores)
+
+
+def test_store_and_fingerprint_are_swapped_together():
+    index = FakeIndex()
+    registry = VectorStoreRegistry(loader=index.loader, fingerprint=index.fingerprint)
+    before = registry.get_loaded()
+    index.version = "v2"
+    registry.reload_if_changed()
+    after = registry.get_loaded()
+    assert (before.vectorstore["version"], before.fingerprint) == ("v1", "v1")
+    assert (after.vectorstore["version"], after.fingerprint) == ("v2", "v2")